@@ -0,0 +1,407 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+"""
+Benchmarks of the cache decoding and exporting stages on synthetic caches written by icewriter.
+
+    python -m benchmark decode [-p 10000 100000] [-v 102 103] [-r 3] [-a Size:float,Mass:float:const]
+                               [--save [baselines.json]] [--compare [baselines.json]] [--tolerance 0.1]
+    python -m benchmark pool [-n 32] [-p 100000] [-j 8] [-m load|export] [--save] [--compare]
+
+Every stage is run repeat times on the same file and the best time is kept. Throughputs are given
+for the uncompressed attribute data of the cache so the stages can be compared.
+
+Results can be saved as baselines, stored per machine fingerprint as timings differ from a machine
+to another. The compare mode reports the stages slower than the baseline of the machine by more than
+the tolerance and exits with a non-zero code.
+
+The pool mode loads or exports a synthetic sequence through process_pool.Pool with 1..N processes,
+the way the application does, and reports the wall time, the CPU utilisation of the workers and the
+latency of the tasks. PyQt is only imported by this mode.
+"""
+
+import os
+import sys
+import time
+import json
+import shutil
+import hashlib
+import platform
+import tempfile
+import argparse
+import multiprocessing as mp
+from cStringIO import StringIO
+import numpy
+from consts import CONSTS
+from icereader_util import to_sih5, to_ascii, dataAccessorPool, ICECacheFileHandler
+import icereader as icer
+import h5reader as h5r
+import icewriter
+from profiler import clock
+
+STAGES = ('ICEReader.load', 'to_sih5', 'to_ascii', 'H5Reader.load')
+
+BASELINES = 'baselines.json'
+POOL_MODES = ('load', 'export')
+# bins of the task latency histograms
+LATENCY_BINS = 10
+# stages slower than the baseline by more than 10% are reported
+DEFAULT_TOLERANCE = 0.1
+
+def _time( func, repeat ):
+    """ best time of repeat calls to func, returns (seconds, last result). An untimed first call pays the imports and fills the caches. """
+    best = None
+    result = func()
+    for i in range( max( 1, repeat ) ):
+        t1 = clock()
+        result = func()
+        t = clock() - t1
+        if best == None or t < best:
+            best = t
+    return (best, result)
+
+def _load_icecache( filename ):
+    reader = icer.ICEReader( filename )
+    reader.load()
+    return reader
+
+def _load_sih5( filename ):
+    """ load the header and attributes and read all the data sets """
+    reader = h5r.H5Reader( filename )
+    reader.load()
+    for a in reader.attributes:
+        a.data
+    reader.close()
+    return reader
+
+def decode( folder, particle_count, version, attributes, repeat ):
+    """ benchmark the stages on one synthetic cache, returns a result dict per stage """
+    name = 'bench_v%d_%d' % (version, particle_count)
+    filename = os.path.join( folder, name + '.icecache' )
+    data_bytes = icewriter.write_icecache( filename, particle_count, version, attributes )
+    sih5 = os.path.join( folder, name + '.sih5' )
+    text = os.path.join( folder, name + '.txt' )
+
+    (t_load, reader) = _time( lambda: _load_icecache( filename ), repeat )
+    (t_sih5, r) = _time( lambda: to_sih5( sih5, reader ), repeat )
+    (t_ascii, r) = _time( lambda: to_ascii( text, reader ), repeat )
+    (t_h5, r) = _time( lambda: _load_sih5( sih5 ), repeat )
+
+    results = []
+    for (stage, seconds) in zip( STAGES, (t_load, t_sih5, t_ascii, t_h5) ):
+        results.append( _result( stage, version, particle_count, data_bytes, seconds ) )
+    return results
+
+def accessors( particle_count, repeat ):
+    """ benchmark the DataAccessor classes reading particle_count values from memory, the way ICEReader reads a chunk """
+    results = []
+    for datatype in sorted( icewriter.DATATYPES ):
+        (length, type) = icewriter.DATATYPES[ datatype ]
+        buf = numpy.random.RandomState( 0 ).uniform( 0.0, 1.0, (particle_count, length) ).astype( type ).tostring()
+        accessor = dataAccessorPool.accessor( datatype, CONSTS.siICENodeStructureSingle )
+        handler = ICECacheFileHandler( StringIO( buf ) )
+
+        def read():
+            handler.file.seek( 0 )
+            accessor.handler = handler
+            data = accessor.allocate_array( particle_count )
+            accessor.read_block( particle_count )
+            for index in xrange( particle_count ):
+                data[index] = accessor.read( )
+            accessor.release_block()
+
+        (seconds, r) = _time( read, repeat )
+        results.append( _result( '%s.read' % accessor.__class__.__name__, None, particle_count, len(buf), seconds ) )
+    return results
+
+def _result( stage, version, particle_count, data_bytes, seconds ):
+    seconds = max( seconds, 1e-9 )
+    return {
+        'stage' : stage,
+        'version' : version,
+        'particles' : particle_count,
+        'bytes' : data_bytes,
+        'seconds' : seconds,
+        'mb_per_s' : data_bytes / seconds / (1024*1024),
+        'particles_per_s' : particle_count / seconds
+        }
+
+def pool( folder, files, process_count, mode, timeout ):
+    """
+    Run one task per file through a Pool of process_count workers, the pool startup is included in
+    the wall time. Returns (wall time, worker CPU time, task latencies, errors).
+    """
+    from PyQt4 import QtCore
+    from process_pool import Pool
+
+    app = QtCore.QCoreApplication.instance()
+    if app == None:
+        app = QtCore.QCoreApplication( sys.argv )
+
+    # output folders are created before the workers start, they would race to create them
+    here = os.path.dirname( os.path.abspath( __file__ ) )
+    if mode == 'load':
+        # the loader converts next to the files, only if the SIH5 file doesn't exist
+        shutil.rmtree( os.path.join( folder, '.sih5' ), ignore_errors=True )
+        os.makedirs( os.path.join( folder, '.sih5' ) )
+        command = '"%s" "%s"' % (sys.executable, os.path.join( here, 'loader_process.py' ))
+        tasks = [ repr( [ [f], [i] ] ) for i,f in enumerate( files ) ]
+    else:
+        destination = os.path.join( folder, 'export' )
+        if not os.path.exists( destination ):
+            os.makedirs( destination )
+        command = '"%s" "%s"' % (sys.executable, os.path.join( here, 'export_process.py' ))
+        tasks = [ repr( [ [f], destination, CONSTS.SIH5_FMT ] ) for f in files ]
+
+    loop = QtCore.QEventLoop()
+    starts = {}
+    latencies = []
+    errors = []
+
+    def callback( sender, notif, arg ):
+        if notif == Pool.STARTED:
+            starts[ sender ] = clock()
+        elif notif == Pool.OUTPUT_ERROR_MSG or notif == Pool.ERROR:
+            errors.append( str(arg) )
+        elif notif == Pool.FINISHED:
+            latencies.append( clock() - starts.pop( sender, clock() ) )
+            if len(latencies) >= len(tasks):
+                loop.quit()
+
+    # workers are reaped by QProcess, their CPU time shows in the children times once they are stopped
+    cpu = os.times()
+    t1 = clock()
+    workers = Pool( None )
+    workers.init( process_count, callback, command )
+    for t in tasks:
+        workers.submit( t )
+    QtCore.QTimer.singleShot( int( timeout * 1000 ), loop.quit )
+    loop.exec_()
+    wall = clock() - t1
+    workers.shutdown()
+    times = os.times()
+    cpu_time = (times[2] - cpu[2]) + (times[3] - cpu[3])
+    if len(latencies) < len(tasks):
+        errors.append( '%d/%d tasks done after %d s' % (len(latencies), len(tasks), timeout) )
+    return (wall, cpu_time, latencies, errors)
+
+def latency_histogram( latencies, bins=LATENCY_BINS ):
+    """ histogram of the task latencies as {'edges': [...], 'counts': [...]} """
+    (counts, edges) = numpy.histogram( latencies, bins=bins )
+    return { 'edges' : edges.tolist(), 'counts' : counts.tolist() }
+
+def print_histogram( histogram, width=40 ):
+    top = max( max( histogram['counts'] ), 1 )
+    edges = histogram['edges']
+    for i,count in enumerate( histogram['counts'] ):
+        print '  %8.3f - %8.3f s %5d %s' % (edges[i], edges[i+1], count, '#' * int( round( count * width / float(top) ) ))
+
+def result_key( result ):
+    """ key identifying a stage and its input in the baselines """
+    return '%s|v%s|%d' % (result['stage'], result['version'] or '-', result['particles'])
+
+def print_results( results ):
+    print '%-28s %7s %10s %10s %10s %14s' % ('Stage', 'Version', 'Particles', 'Time (s)', 'MB/s', 'Particles/s')
+    for r in results:
+        print '%-28s %7s %10d %10.4f %10.2f %14.0f' % (r['stage'], r['version'] or '-', r['particles'], r['seconds'], r['mb_per_s'], r['particles_per_s'])
+
+def machine_info():
+    """ description of the machine the benchmarks run on """
+    return {
+        'node' : platform.node(),
+        'system' : platform.system(),
+        'release' : platform.release(),
+        'machine' : platform.machine(),
+        'processor' : platform.processor(),
+        'cpu_count' : mp.cpu_count(),
+        'python' : platform.python_version()
+        }
+
+def machine_fingerprint( info=None ):
+    """ short hash of the machine info, baselines are only compared on the same machine """
+    if info == None:
+        info = machine_info()
+    return hashlib.sha1( json.dumps( info, sort_keys=True ) ).hexdigest()[:16]
+
+def load_baselines( filename ):
+    """ return the baselines of all machines saved in filename, {} if the file doesn't exist """
+    if not os.path.isfile( filename ):
+        return {}
+    with open( filename ) as f:
+        return json.load( f )
+
+def save_baseline( filename, results ):
+    """ save results as the baseline of this machine, results of other stages are kept """
+    baselines = load_baselines( filename )
+    info = machine_info()
+    baseline = baselines.setdefault( machine_fingerprint( info ), { 'results' : {} } )
+    baseline['machine'] = info
+    baseline['date'] = time.strftime( '%Y-%m-%d %H:%M:%S' )
+    for r in results:
+        baseline['results'][ result_key( r ) ] = r
+    with open( filename, 'w' ) as f:
+        json.dump( baselines, f, indent=1, sort_keys=True )
+
+def compare( results, baseline, tolerance=DEFAULT_TOLERANCE ):
+    """
+    Compare results to a baseline, returns a list of (result, baseline seconds, ratio, regressed).
+    Stages without baseline get None for the baseline and the ratio.
+    """
+    rows = []
+    for r in results:
+        base = baseline['results'].get( result_key( r ) )
+        if base == None:
+            rows.append( (r, None, None, False) )
+            continue
+        ratio = r['seconds'] / max( base['seconds'], 1e-9 )
+        rows.append( (r, base['seconds'], ratio, ratio > 1.0 + tolerance) )
+    return rows
+
+def print_comparison( rows ):
+    print '%-28s %7s %10s %12s %10s %8s' % ('Stage', 'Version', 'Particles', 'Baseline (s)', 'Time (s)', 'Change')
+    for (r, base, ratio, regressed) in rows:
+        if base == None:
+            print '%-28s %7s %10d %12s %10.4f %8s' % (r['stage'], r['version'] or '-', r['particles'], '-', r['seconds'], 'new')
+            continue
+        status = ''
+        if regressed:
+            status = '  REGRESSION'
+        print '%-28s %7s %10d %12.4f %10.4f %+7.1f%%%s' % (r['stage'], r['version'] or '-', r['particles'], base, r['seconds'], (ratio-1.0)*100, status)
+
+def _decode( options ):
+    attributes = icewriter.DEFAULT_ATTRIBUTES
+    if options.attributes:
+        attributes = icewriter.parse_attributes( options.attributes )
+
+    folder = options.folder
+    if folder == None:
+        folder = tempfile.mkdtemp( prefix='icebench' )
+    elif not os.path.exists( folder ):
+        os.makedirs( folder )
+
+    results = []
+    try:
+        for version in options.versions:
+            for count in options.particles:
+                results += decode( folder, count, version, attributes, options.repeat )
+        for count in options.particles:
+            results += accessors( count, options.repeat )
+    finally:
+        if options.folder == None:
+            shutil.rmtree( folder, ignore_errors=True )
+
+    print_results( results )
+    return _baselines( options, results )
+
+def _pool( options ):
+    attributes = icewriter.DEFAULT_ATTRIBUTES
+    if options.attributes:
+        attributes = icewriter.parse_attributes( options.attributes )
+
+    folder = options.folder
+    if folder == None:
+        folder = tempfile.mkdtemp( prefix='icebench' )
+
+    results = []
+    try:
+        files = icewriter.write_sequence( folder, options.frames, options.particles, options.version, attributes )
+        data_bytes = options.frames * icewriter.data_size( options.particles, attributes )
+
+        for count in range( 1, options.jobs+1 ):
+            (wall, cpu_time, latencies, errors) = pool( folder, files, count, options.mode, options.timeout )
+            for e in errors:
+                sys.stderr.write( 'Pool %d: %s\n' % (count, e.strip()) )
+
+            r = _result( 'Pool.%s/%d' % (options.mode, count), options.version, options.particles * options.frames, data_bytes, wall )
+            r['processes'] = count
+            r['files'] = len(files)
+            r['cpu_seconds'] = cpu_time
+            # busy fraction of the workers and of the whole machine
+            r['worker_utilisation'] = cpu_time / (r['seconds'] * count)
+            r['cpu_utilisation'] = cpu_time / (r['seconds'] * mp.cpu_count())
+            r['latency'] = latency_histogram( latencies )
+            r['latency_median'] = float( numpy.median( latencies ) ) if latencies else 0.0
+            r['latency_max'] = max( latencies ) if latencies else 0.0
+            results.append( r )
+    finally:
+        if options.folder == None:
+            shutil.rmtree( folder, ignore_errors=True )
+
+    print '%-16s %9s %10s %10s %10s %8s %8s %12s %10s' % ('Stage', 'Processes', 'Time (s)', 'Files/s', 'MB/s', 'Workers', 'CPU', 'Median task', 'Max task')
+    for r in results:
+        print '%-16s %9d %10.3f %10.2f %10.2f %7.0f%% %7.0f%% %12.3f %10.3f' % (r['stage'], r['processes'], r['seconds'], r['files'] / r['seconds'], r['mb_per_s'], r['worker_utilisation']*100, r['cpu_utilisation']*100, r['latency_median'], r['latency_max'])
+    for r in results:
+        print '\nTask latency, %d processes' % r['processes']
+        print_histogram( r['latency'] )
+    return _baselines( options, results )
+
+def _baselines( options, results ):
+    """ save or compare the results as requested by the options, returns the exit code """
+    code = 0
+    if options.compare:
+        baseline = load_baselines( options.compare ).get( machine_fingerprint() )
+        if baseline == None:
+            sys.stderr.write( 'No baseline for this machine (%s) in %s\n' % (machine_fingerprint(), options.compare) )
+            code = 1
+        else:
+            print '\nCompared to the baseline of %s' % baseline['date']
+            rows = compare( results, baseline, options.tolerance )
+            print_comparison( rows )
+            regressions = len( [ row for row in rows if row[3] ] )
+            if regressions:
+                print '%d stage(s) slower than the baseline by more than %d%%' % (regressions, options.tolerance*100)
+                code = 1
+    if options.save:
+        save_baseline( options.save, results )
+        print 'Baseline saved to %s (machine %s)' % (options.save, machine_fingerprint())
+    return code
+
+def main( argv ):
+    parser = argparse.ArgumentParser( prog='benchmark', description='Benchmark ICE cache decoding and exporting.' )
+    commands = parser.add_subparsers( dest='command' )
+
+    p = commands.add_parser( 'decode', help='time ICEReader, the exporters and H5Reader on synthetic caches' )
+    p.add_argument( '-p', '--particles', type=int, nargs='+', default=[10000, 100000], help='particle counts' )
+    p.add_argument( '-v', '--versions', type=int, nargs='+', choices=(CONSTS.siICECacheV102, CONSTS.siICECacheV103), default=[CONSTS.siICECacheV103], help='ICE cache versions' )
+    p.add_argument( '-a', '--attributes', help='attributes besides PointPosition___, e.g. Size:float,Mass:float:const' )
+    p.add_argument( '-r', '--repeat', type=int, default=3, help='runs per stage, the best time is kept' )
+    p.add_argument( '--folder', help='keep the generated files in this folder' )
+    p.add_argument( '--save', nargs='?', const=BASELINES, help='save the results as the baseline of this machine' )
+    p.add_argument( '--compare', nargs='?', const=BASELINES, help='compare the results to the baseline of this machine' )
+    p.add_argument( '--tolerance', type=float, default=DEFAULT_TOLERANCE, help='slowdown reported as a regression, 0.1 for 10%%' )
+    p.set_defaults( func=_decode )
+
+    p = commands.add_parser( 'pool', help='load or export a synthetic sequence through the process pool with 1..N processes' )
+    p.add_argument( '-n', '--frames', type=int, default=32, help='number of frames' )
+    p.add_argument( '-p', '--particles', type=int, default=100000, help='particles per frame' )
+    p.add_argument( '-v', '--version', type=int, choices=(CONSTS.siICECacheV102, CONSTS.siICECacheV103), default=CONSTS.siICECacheV103, help='ICE cache version' )
+    p.add_argument( '-a', '--attributes', help='attributes besides PointPosition___, e.g. Size:float,Mass:float:const' )
+    p.add_argument( '-j', '--jobs', type=int, default=mp.cpu_count(), help='largest number of processes' )
+    p.add_argument( '-m', '--mode', choices=POOL_MODES, default='load', help='load (convert to SIH5 like the viewer) or export' )
+    p.add_argument( '--timeout', type=float, default=3600, help='seconds allowed per run' )
+    p.add_argument( '--folder', help='keep the generated files in this folder' )
+    p.add_argument( '--save', nargs='?', const=BASELINES, help='save the results as the baseline of this machine' )
+    p.add_argument( '--compare', nargs='?', const=BASELINES, help='compare the results to the baseline of this machine' )
+    p.add_argument( '--tolerance', type=float, default=DEFAULT_TOLERANCE, help='slowdown reported as a regression, 0.1 for 10%%' )
+    p.set_defaults( func=_pool )
+
+    options = parser.parse_args( argv[1:] )
+    return options.func( options )
+
+if __name__ == '__main__':
+    sys.exit( main(sys.argv) )
@@ -19,12 +19,20 @@
 from math import pi
 from math import cos
 from math import sin
-from OpenGL import GL, GLU, GLUT
+from math import tan
+from math import atan
+from math import sqrt
+from OpenGL import GL, GLU
 from basics import Vec3
 
+NEAR = 0.001
+FAR = 1000.0
+
 class Camera( object ):
     def __init__( self, fov, origin, focus, up ):
         self.fov = fov
+        self.near = NEAR
+        self.far = FAR
         self.set( origin, focus, up )
 
     def set( self, origin, focus, up ):
@@ -38,7 +46,26 @@ class Camera( object ):
             aspect = float(w)/float(h)
         else:
             aspect = 1.0
-        GLU.gluPerspective(self.fov * 180.0 / pi, aspect, 0.001, 1000.0)
+        GLU.gluPerspective(self.fov * 180.0 / pi, aspect, self.near, self.far)
+
+    def fit( self, lo, hi, aspect=1.0 ):
+        """ Move the camera along its view direction so the bounding box lo-hi fills the view """
+        center = Vec3( float(lo[0]+hi[0])*0.5, float(lo[1]+hi[1])*0.5, float(lo[2]+hi[2])*0.5 )
+        radius = max( 0.5 * sqrt( sum( [ float(hi[i]-lo[i])**2 for i in range(3) ] ) ), 1e-3 )
+
+        # the bounding sphere must fit in the narrowest field of view
+        fov = self.fov
+        if aspect < 1.0:
+            fov = 2.0 * atan( tan( fov * 0.5 ) * aspect )
+        distance = radius / sin( fov * 0.5 )
+
+        direction = self.origin - self.focus
+        length = sqrt( direction * direction )
+        if length < 1e-9:
+            direction = Vec3( 20, 30, 30 )
+            length = sqrt( direction * direction )
+        self.set( center + direction * (distance / length), center, self.up )
+        self.far = max( FAR, (distance + radius) * 2.0 )
 
     def ortho2D( self, w, h ):
         GLU.gluOrtho2D(0, w/2, h/2, 0);        
@@ -0,0 +1,217 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+"""
+Conversion cache: the .icecache files are converted to SIH5 once and kept in a central folder, on a
+fast local drive preferably, instead of a .sih5 folder next to the sources. Converted files are
+named after a key of the source path, size and modification time so a modified source gets
+converted again:
+
+    <cache folder>/<source folder key>/<source file name>.<source key>.sih5
+
+The folder size is kept under a quota by deleting the least recently viewed files, the loader
+touches the files it reads.
+
+The size, modification time and hash of the source are saved in the header of the converted files,
+a conversion is reused only if it matches its source.
+"""
+
+import os
+import sys
+import hashlib
+
+DEFAULT_QUOTA_MB = 10240
+
+# HEADER attributes of the converted files
+SOURCE_SIZE = 'source_size'
+SOURCE_MTIME = 'source_mtime'
+SOURCE_HASH = 'source_hash'
+# bytes hashed at the start and at the end of a source file
+HASH_SAMPLE = 65536
+
+def default_folder():
+    """ per user cache folder """
+    if sys.platform.startswith('win'):
+        base = os.environ.get( 'LOCALAPPDATA' ) or os.path.expanduser( '~' )
+        return os.path.join( base, 'ICEExplorer', 'sih5cache' )
+    base = os.environ.get( 'XDG_CACHE_HOME' ) or os.path.join( os.path.expanduser( '~' ), '.cache' )
+    return os.path.join( base, 'iceexplorer', 'sih5' )
+
+def source_key( filename ):
+    """ key of a source file, changes with the file path, size and modification time """
+    st = os.stat( filename )
+    return _hash( '%s|%d|%d' % (_path( filename ), st.st_size, int( st.st_mtime * 1000 )) )
+
+def converted_filename( folder, filename ):
+    """ SIH5 file name of a source file in the conversion cache """
+    subfolder = _hash( _path( os.path.dirname( os.path.abspath( filename ) ) ) )
+    return os.path.join( folder, subfolder, '%s.%s.sih5' % (os.path.basename( filename ), source_key( filename )) )
+
+def source_hash( filename ):
+    """ fast hash of a source file from its size, first and last bytes. The gzip trailer holds the CRC of the whole data. """
+    size = os.path.getsize( filename )
+    h = hashlib.sha1( str(size) )
+    f = open( filename, 'rb' )
+    try:
+        h.update( f.read( HASH_SAMPLE ) )
+        if size > HASH_SAMPLE:
+            f.seek( max( HASH_SAMPLE, size - HASH_SAMPLE ) )
+            h.update( f.read( HASH_SAMPLE ) )
+    finally:
+        f.close()
+    return h.hexdigest()
+
+def write_source( group, filename ):
+    """ save the signature of a source file in the attributes of an HDF5 group """
+    st = os.stat( filename )
+    group.attrs[ SOURCE_SIZE ] = st.st_size
+    group.attrs[ SOURCE_MTIME ] = st.st_mtime
+    group.attrs[ SOURCE_HASH ] = source_hash( filename )
+
+def read_source( group ):
+    """ return the source signature saved in an HDF5 group as (size, mtime, hash), None if the file was converted without one """
+    attrs = group.attrs
+    if not SOURCE_SIZE in attrs:
+        return None
+    return (int( attrs[ SOURCE_SIZE ] ), float( attrs[ SOURCE_MTIME ] ), str( attrs[ SOURCE_HASH ] ))
+
+def is_stale( converted, source ):
+    """
+    True if a SIH5 file must be converted again from its source. The source size and modification time
+    are compared with the ones saved at conversion time, the hash tells if a source with a new time was
+    modified. The new time of an unmodified source is saved so the source is hashed once per change.
+    Files converted without signature are stale if older than their source.
+    """
+    try:
+        st = os.stat( source )
+    except OSError:
+        # nothing to convert from
+        return False
+    import h5py as h5
+    try:
+        f = h5.File( converted, 'r' )
+        try:
+            recorded = read_source( f[ 'HEADER' ] )
+        finally:
+            f.close()
+    except:
+        # unreadable, e.g. partially written
+        return True
+
+    if recorded == None:
+        return os.path.getmtime( converted ) < st.st_mtime
+    (size, mtime, hash) = recorded
+    if size != st.st_size:
+        return True
+    if mtime == st.st_mtime:
+        return False
+    # copied or touched
+    if hash != source_hash( source ):
+        return True
+    _update_mtime( converted, st.st_mtime )
+    return False
+
+def _update_mtime( converted, mtime ):
+    """ save the modification time of an unmodified source, skipped if the file can't be written """
+    import h5py as h5
+    try:
+        f = h5.File( converted, 'r+' )
+        try:
+            f[ 'HEADER' ].attrs[ SOURCE_MTIME ] = mtime
+        finally:
+            f.close()
+    except:
+        pass
+
+def is_cached( folder, filename ):
+    """ True if filename is located in the conversion cache folder """
+    if not folder:
+        return False
+    return _path( filename ).startswith( _path( folder ) + os.sep )
+
+def touch( folder, filename ):
+    """ mark a converted file as viewed, the files outside of the cache folder are left alone """
+    if not is_cached( folder, filename ):
+        return
+    try:
+        os.utime( filename, None )
+    except OSError:
+        pass
+
+def files( folder ):
+    """ return the converted files as (last view time, size, filename), least recently viewed first """
+    entries = []
+    for root, dirs, names in os.walk( folder ):
+        for name in names:
+            if not name.endswith( '.sih5' ):
+                continue
+            f = os.path.join( root, name )
+            try:
+                st = os.stat( f )
+            except OSError:
+                continue
+            entries.append( (st.st_mtime, st.st_size, f) )
+    entries.sort()
+    return entries
+
+def prune( folder, quota, keep=() ):
+    """
+    Delete the least recently viewed files until the size of the cache folder is under quota bytes. The
+    files in keep, i.e. the loaded caches, are never deleted. Returns (deleted files, freed bytes).
+    """
+    if not folder or not os.path.isdir( folder ):
+        return (0, 0)
+    entries = files( folder )
+    total = sum( [ e[1] for e in entries ] )
+    keep = set( [ _path( f ) for f in keep ] )
+    deleted = 0
+    freed = 0
+    for (mtime, size, f) in entries:
+        if total - freed <= quota:
+            break
+        if _path( f ) in keep:
+            continue
+        try:
+            os.remove( f )
+        except OSError:
+            # opened by another viewer
+            continue
+        deleted += 1
+        freed += size
+        _remove_empty_folder( folder, os.path.dirname( f ) )
+    return (deleted, freed)
+
+def _remove_empty_folder( folder, subfolder ):
+    """ remove a source folder entry once its last converted file is gone """
+    if _path( subfolder ) == _path( folder ):
+        return
+    try:
+        if os.listdir( subfolder ) != []:
+            # converted files or conversions in progress
+            return
+        os.rmdir( subfolder )
+    except OSError:
+        pass
+
+def _path( filename ):
+    return os.path.normcase( os.path.abspath( filename ) )
+
+def _hash( s ):
+    if isinstance( s, unicode ):
+        s = s.encode( 'utf-8' )
+    return hashlib.sha1( s ).hexdigest()[:16]
@@ -0,0 +1,141 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+from PyQt4 import QtCore
+from collections import OrderedDict
+import numpy
+
+# rows read from the file and added to the view at once
+PAGE_SIZE = 1000
+# pages kept in memory
+CACHED_PAGES = 16
+
+COMPONENT_NAMES = { 1 : ['Value'], 2 : ['X', 'Y'], 3 : ['X', 'Y', 'Z'], 4 : ['X', 'Y', 'Z', 'W'] }
+
+class AttributeTableModel(QtCore.QAbstractTableModel):
+    """
+    Table of the values of a cache attribute, one row per value and one column per component. Rows are
+    read from the SIH5 file by pages and formatted when the view asks for them, the view fetches more
+    rows as it gets scrolled.
+    """
+    def __init__( self, parent=None ):
+        super(AttributeTableModel,self).__init__(parent)
+        self.attribute = None
+        self.isconstant = None
+        self._file = None
+        self._data = None
+        self._count = 0
+        self._fetched = 0
+        self._components = 0
+        self._pages = OrderedDict()
+
+    def load( self, filename, attribute ):
+        """ show the values of attribute from a SIH5 file, the model opens its own file """
+        self.beginResetModel()
+        self._close()
+        self.attribute = attribute
+        import h5py as h5
+        self._file = h5.File( filename, 'r' )
+        group = self._file[ 'ATTRIBS' ][ attribute ]
+        self.isconstant = group.attrs[ 'isconstant' ]
+        if 'Data' in group:
+            self._data = group[ 'Data' ]
+            self._count = len(self._data)
+            self._components = int( numpy.prod( self._data.shape[1:] ) )
+            self._fetched = min( PAGE_SIZE, self._count )
+        self.endResetModel()
+
+    def clear( self ):
+        self.beginResetModel()
+        self._close()
+        self.attribute = None
+        self.isconstant = None
+        self.endResetModel()
+
+    @property
+    def count(self):
+        """ number of values of the attribute """
+        return self._count
+
+    def rowCount( self, parent=QtCore.QModelIndex() ):
+        if parent.isValid():
+            return 0
+        return self._fetched
+
+    def columnCount( self, parent=QtCore.QModelIndex() ):
+        if parent.isValid():
+            return 0
+        return self._components
+
+    def headerData( self, section, orientation, role=QtCore.Qt.DisplayRole ):
+        if role != QtCore.Qt.DisplayRole:
+            return QtCore.QVariant()
+        if orientation == QtCore.Qt.Vertical:
+            return QtCore.QVariant( str(section) )
+        names = COMPONENT_NAMES.get( self._components )
+        if names == None:
+            return QtCore.QVariant( str(section) )
+        return QtCore.QVariant( names[ section ] )
+
+    def data( self, index, role=QtCore.Qt.DisplayRole ):
+        if not index.isValid():
+            return QtCore.QVariant()
+        if role == QtCore.Qt.TextAlignmentRole:
+            return QtCore.QVariant( int( QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter ) )
+        if role != QtCore.Qt.DisplayRole:
+            return QtCore.QVariant()
+        row = index.row()
+        page = self._page( row // PAGE_SIZE )
+        return QtCore.QVariant( '%g' % page[ row % PAGE_SIZE, index.column() ] )
+
+    def canFetchMore( self, parent=QtCore.QModelIndex() ):
+        if parent.isValid():
+            return False
+        return self._fetched < self._count
+
+    def fetchMore( self, parent=QtCore.QModelIndex() ):
+        if parent.isValid():
+            return
+        n = min( PAGE_SIZE, self._count - self._fetched )
+        if n <= 0:
+            return
+        self.beginInsertRows( QtCore.QModelIndex(), self._fetched, self._fetched + n - 1 )
+        self._fetched += n
+        self.endInsertRows()
+
+    def _page( self, page ):
+        """ return the rows of a page as a 2D array, pages are read on demand """
+        rows = self._pages.pop( page, None )
+        if rows is None:
+            rows = self._data[ page*PAGE_SIZE : (page+1)*PAGE_SIZE ]
+            rows = numpy.asarray( rows ).reshape( len(rows), self._components )
+            while len(self._pages) >= CACHED_PAGES:
+                self._pages.popitem( last=False )
+        # most recently used pages are at the end
+        self._pages[ page ] = rows
+        return rows
+
+    def _close( self ):
+        self._pages.clear()
+        self._data = None
+        self._count = 0
+        self._fetched = 0
+        self._components = 0
+        if self._file != None:
+            self._file.close()
+            self._file = None
@@ -21,18 +21,25 @@ import shutil
 from icereader import *
 from h5reader import *
 from consts import CONSTS
+from process_worker import serve, TaskCancelled, check_cancel
 
-def main(argv):
-    
-    files = eval(argv[1])
-    exportdir = argv[2]
-    exportfmt = int(argv[3])
+def handle_task( args ):
+    """ 
+    Task arguments:
+    arg0: list of files
+    arg1: target export folder
+    arg2: export format {TEXT|SIH5}
+    """
+    files = args[0]
+    exportdir = args[1]
+    exportfmt = int(args[2])
 
     if not os.path.exists( exportdir ):
         os.mkdir( exportdir, 777 )
     
     # export input files
     for f in files:
+        check_cancel()
         ext = os.path.splitext(f)[1]
         r = None
         try:
@@ -47,14 +54,25 @@ def main(argv):
         
         try:
             r.export(exportdir,exportfmt)
+        except TaskCancelled:
+            raise
         except:
             sys.stderr.write( 'Export process failed to export: %s' % f )    
             sys.stderr.flush()     
             continue
     
         # send the exported file to process output
-        sys.stdout.write( f )
+        sys.stdout.write( f + '\n' )
         sys.stdout.flush()   
+
+def main(argv):
+    if len(argv) > 3:
+        # single task from the command line
+        handle_task( [eval(argv[1]), argv[2], int(argv[3])] )
+        return
+
+    # warm worker, process the tasks sent by the pool
+    serve( handle_task )
    
 if __name__ == '__main__':
     main(sys.argv)
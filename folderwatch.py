@@ -0,0 +1,189 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+"""
+Watch of a cache folder while a simulation is writing to it. New files of the loaded sequence are
+reported once they are completely written, the viewer appends them to the loaded caches.
+"""
+
+from PyQt4 import QtCore
+import os
+import time
+from sequences import parse_name, sort_files
+
+# milliseconds between two scans of the folder
+DEFAULT_POLL_INTERVAL = 1000
+# seconds a file size must stay unchanged before the file gets loaded
+DEFAULT_SETTLE_TIME = 2.0
+
+GZIP_MAGIC = '\x1f\x8b'
+HDF5_MAGIC = '\x89HDF\r\n\x1a\n'
+
+class PendingFiles(object):
+    """
+    New files of a sequence. The writers don't tell when a file is done, a file is ready once its size
+    and modification time have not changed for settle seconds and it starts with the gzip (or HDF5)
+    signature. Files still being written are checked again on the next scan. The caches are indexed in
+    load order, frames written before the last loaded frame are ignored. A file that looked complete but
+    failed to load, e.g. a gzip stream still being flushed, is put back with retry.
+    """
+    def __init__( self, sequence, settle=DEFAULT_SETTLE_TIME ):
+        self.folder = sequence.folder
+        self.prefix = sequence.prefix
+        self.ext = sequence.ext
+        self.settle = settle
+        self._known = set( [ os.path.normcase( f ) for f in sequence.files ] )
+        # (frame, substep) of the last file reported
+        self._last = (-1, 0)
+        if len(sequence):
+            item = sequence.items[-1]
+            self._last = (item[0], item[1] or 0)
+        # filename: ((size, mtime), time the file was first seen with this size)
+        self._pending = {}
+        # (size, mtime) of the files when reported
+        self._reported = {}
+        # files that failed to load: (size, mtime) when reported, they are reported again once modified
+        self._retry = {}
+        # files of the last scan written before the last loaded frame, they are not loaded
+        self.ignored = []
+
+    @property
+    def pending( self ):
+        """ files found but not ready yet """
+        return sorted( self._pending.keys() )
+
+    def retry( self, filename ):
+        """ report a file again once modified and settled, its frame may be before the last one reported """
+        key = os.path.normcase( filename )
+        self._known.discard( key )
+        self._retry[ key ] = self._reported.get( key )
+
+    def scan( self, now=None ):
+        """ return the new files ready to load sorted by frame, a file is returned once """
+        if now == None:
+            now = time.time()
+        try:
+            names = os.listdir( self.folder )
+        except OSError:
+            return []
+
+        ready = []
+        self.ignored = []
+        for name in names:
+            f = os.path.join( self.folder, name )
+            key = os.path.normcase( f )
+            if key in self._known:
+                continue
+            parsed = parse_name( name )
+            if parsed == None or parsed[0] != self.prefix or parsed[3] != self.ext:
+                continue
+            try:
+                st = os.stat( f )
+            except OSError:
+                # renamed or deleted by the writer
+                self._pending.pop( f, None )
+                continue
+
+            state = (st.st_size, st.st_mtime)
+            if key in self._retry and self._retry[ key ] == state:
+                # not modified since it failed to load
+                continue
+            prev = self._pending.get( f )
+            if prev == None or prev[0] != state:
+                self._pending[ f ] = (state, now)
+                continue
+            if st.st_size == 0 or now - prev[1] < self.settle or not self._has_signature( f ):
+                continue
+
+            del self._pending[ f ]
+            self._known.add( key )
+            retried = key in self._retry
+            self._retry.pop( key, None )
+            if not retried and (parsed[1], parsed[2] or 0) <= self._last:
+                self.ignored.append( f )
+                continue
+            self._reported[ key ] = state
+            ready.append( f )
+
+        ready = sort_files( ready )
+        if ready != []:
+            parsed = parse_name( ready[-1] )
+            self._last = max( self._last, (parsed[1], parsed[2] or 0) )
+        return ready
+
+    def _has_signature( self, filename ):
+        """ check the first bytes, the file may be locked by the writer """
+        magic = GZIP_MAGIC
+        if self.ext.endswith( '5' ):
+            magic = HDF5_MAGIC
+        try:
+            f = open( filename, 'rb' )
+            try:
+                return f.read( len(magic) ) == magic
+            finally:
+                f.close()
+        except IOError:
+            return False
+
+class FolderWatcher(QtCore.QObject):
+    """
+    Report the new files of a sequence. QFileSystemWatcher (inotify, ReadDirectoryChangesW) triggers a
+    scan as soon as a file gets created, a timer polls the folder for the file systems without change
+    notifications and to check the files still being written.
+    """
+    # arg: new files ready to load, sorted by frame
+    filesReady = QtCore.pyqtSignal( list )
+    # arg: new files written before the last loaded frame, not loaded
+    filesIgnored = QtCore.pyqtSignal( list )
+
+    def __init__( self, sequence, interval=DEFAULT_POLL_INTERVAL, settle=DEFAULT_SETTLE_TIME, parent=None ):
+        super(FolderWatcher,self).__init__(parent)
+        self.sequence = sequence
+        self._files = PendingFiles( sequence, settle )
+        self._watcher = QtCore.QFileSystemWatcher( self )
+        self._watcher.addPath( sequence.folder )
+        self._watcher.directoryChanged.connect( self._on_directory_changed )
+        self._timer = QtCore.QTimer( self )
+        self._timer.setInterval( interval )
+        self._timer.timeout.connect( self.scan )
+
+    @property
+    def folder( self ):
+        return self.sequence.folder
+
+    def start( self ):
+        self._timer.start()
+
+    def stop( self ):
+        self._timer.stop()
+        self._watcher.removePath( self.sequence.folder )
+
+    def retry( self, filename ):
+        """ load a file again that failed to load """
+        self._files.retry( filename )
+
+    def scan( self ):
+        files = self._files.scan()
+        if self._files.ignored != []:
+            self.filesIgnored.emit( self._files.ignored )
+        if files != []:
+            self.filesReady.emit( files )
+
+    def _on_directory_changed( self, path ):
+        # new files are registered right away, they get loaded by the timer once they are written
+        self.scan()
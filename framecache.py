@@ -0,0 +1,146 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+import threading
+from collections import OrderedDict
+import numpy
+
+DEFAULT_FRAME_CACHE_MB = 1024
+
+class Frame(object):
+    """ Decoded data of a cache ready to be drawn, arrays are contiguous float32 """
+    def __init__( self, index, points, colors=None, sizes=None, grid=None, values=None, attribute=None ):
+        self.index = index
+        self.points = _as_float_array( points )
+        self.colors = _as_float_array( colors )
+        self.sizes = _as_float_array( sizes )
+        # spatial.GridIndex of the points
+        self.grid = grid
+        # values of the attribute used for coloring the particles
+        self.values = _as_float_array( values )
+        self.attribute = attribute
+        self._value_range = None
+
+    def __len__( self ):
+        return len(self.points)
+
+    @property
+    def nbytes(self):
+        n = 0
+        for a in (self.points, self.colors, self.sizes, self.values):
+            if len(a):
+                n += a.nbytes
+        if self.grid != None:
+            n += self.grid.nbytes
+        return n
+
+    @property
+    def value_range(self):
+        """ (min, max) of the values, or of their magnitude for vectors """
+        if self._value_range == None and len(self.values):
+            v = self.values
+            if v.ndim > 1:
+                v = numpy.sqrt( (v.astype( numpy.float64 )**2).sum( axis=-1 ) )
+            self._value_range = (float( numpy.nanmin( v ) ), float( numpy.nanmax( v ) ))
+        return self._value_range
+
+def _as_float_array( data ):
+    if data is None or len(data) == 0:
+        return []
+    return numpy.ascontiguousarray( data, numpy.float32 )
+
+class FrameCache(object):
+    """
+    Decoded frames indexed by cache index. The least recently used frames are dropped when the
+    total size goes over the memory budget, the most recent frame is always kept. Frames decoded on
+    another thread are put with the generation read before decoding, they are dropped if the cache
+    was cleared or the frame removed in the meantime.
+    """
+    def __init__( self, budget=DEFAULT_FRAME_CACHE_MB*1024*1024 ):
+        self._lock = threading.RLock()
+        self._frames = OrderedDict()
+        self._nbytes = 0
+        self._budget = budget
+        # incremented by clear and remove
+        self._generation = 0
+
+    def __contains__( self, index ):
+        return index in self._frames
+
+    def __len__( self ):
+        return len(self._frames)
+
+    @property
+    def nbytes(self):
+        """ memory used by the cached frames """
+        return self._nbytes
+
+    @property
+    def budget(self):
+        return self._budget
+
+    @property
+    def generation(self):
+        return self._generation
+
+    @budget.setter
+    def budget(self, value):
+        with self._lock:
+            self._budget = value
+            self._evict()
+
+    def get( self, index ):
+        """ return the frame for index or None if it's not cached """
+        with self._lock:
+            frame = self._frames.pop( index, None )
+            if frame != None:
+                # most recently used frames are at the end
+                self._frames[ index ] = frame
+            return frame
+
+    def put( self, frame, generation=None ):
+        """ add frame, returns False if the frame was decoded before generation changed """
+        with self._lock:
+            if generation != None and generation != self._generation:
+                return False
+            self._remove( frame.index )
+            self._frames[ frame.index ] = frame
+            self._nbytes += frame.nbytes
+            self._evict()
+            return True
+
+    def remove( self, index ):
+        with self._lock:
+            self._generation += 1
+            self._remove( index )
+
+    def clear( self ):
+        with self._lock:
+            self._generation += 1
+            self._frames.clear()
+            self._nbytes = 0
+
+    def _remove( self, index ):
+        frame = self._frames.pop( index, None )
+        if frame != None:
+            self._nbytes -= frame.nbytes
+
+    def _evict( self ):
+        while self._nbytes > self._budget and len(self._frames) > 1:
+            (index,frame) = self._frames.popitem( last=False )
+            self._nbytes -= frame.nbytes
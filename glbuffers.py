@@ -0,0 +1,212 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+from collections import OrderedDict
+import numpy
+from OpenGL.GL import *
+from OpenGL.arrays import vbo
+from shaders import DEFAULT_SIZE
+from profiler import TRACER
+
+DEFAULT_GPU_BUFFERS_MB = 512
+
+# used when a cache has no color attribute
+DEFAULT_COLOR = (0.0, 0.7, 0.0, 1.0)
+
+class FrameBuffers(object):
+    """ Vertex buffer objects holding the data of a frame, the data is uploaded on the first draw """
+    def __init__( self, frame ):
+        self.index = frame.index
+        # the points order of the frame, replaced with the culling grid
+        self.grid = frame.grid
+        self.count = len(frame.points)
+        self.points = vbo.VBO( frame.points )
+        self.nbytes = frame.points.nbytes
+        self.colors = None
+        self.color = DEFAULT_COLOR
+        self.color_size = 4
+        if len(frame.colors) == self.count:
+            self.colors = vbo.VBO( frame.colors )
+            self.color_size = frame.colors.shape[-1]
+            self.nbytes += frame.colors.nbytes
+        elif len(frame.colors):
+            # constant color
+            self.color = tuple( numpy.ravel( frame.colors )[:4] )
+        self.sizes = None
+        self.size = DEFAULT_SIZE
+        if len(frame.sizes) == self.count:
+            self.sizes = vbo.VBO( frame.sizes )
+            self.nbytes += frame.sizes.nbytes
+        elif len(frame.sizes):
+            # constant size
+            self.size = float( numpy.ravel( frame.sizes )[0] )
+        # values of the color mapped attribute
+        self.values = None
+        self.value = None
+        self.value_size = 1
+        if len(frame.values):
+            self.value_size = value_components( frame.values )
+            if len(frame.values) == self.count:
+                self.values = vbo.VBO( frame.values )
+                self.nbytes += frame.values.nbytes
+            else:
+                # constant value
+                self.value = tuple( numpy.ravel( frame.values )[:self.value_size] )
+
+    def draw( self, count=None, size_location=None, ranges=None, value_location=None ):
+        """
+        draw the first count points, all points are drawn by default. The sizes are passed to the size_location vertex attribute
+        and the color mapped values to value_location.
+        ranges: (firsts, counts) arrays to draw several ranges of points at once instead
+        """
+        if count == None:
+            count = self.count
+        if size_location != None:
+            _bind_attribute( size_location, self.sizes, 1, (self.size,) )
+        if value_location != None and (self.values != None or self.value != None):
+            _bind_attribute( value_location, self.values, self.value_size, self.value )
+        if self.colors != None:
+            glEnableClientState(GL_COLOR_ARRAY)
+            self.colors.bind()
+            glColorPointer( self.color_size, GL_FLOAT, 0, self.colors )
+        else:
+            glColor4f( *self.color )
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        self.points.bind()
+        glVertexPointer( 3, GL_FLOAT, 0, self.points )
+        if ranges != None:
+            glMultiDrawArrays( GL_POINTS, ranges[0], ranges[1], len(ranges[0]) )
+        else:
+            glDrawArrays( GL_POINTS, 0, count )
+        self.points.unbind()
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+        if self.colors != None:
+            self.colors.unbind()
+            glDisableClientState(GL_COLOR_ARRAY)
+
+        if size_location != None:
+            _unbind_attribute( size_location, self.sizes )
+        if value_location != None:
+            _unbind_attribute( value_location, self.values )
+
+    def upload( self ):
+        """ copy the data to the GPU now instead of on the first draw """
+        for buffer in (self.points, self.colors, self.sizes, self.values):
+            if buffer != None:
+                buffer.bind()
+                buffer.unbind()
+
+    def delete( self ):
+        """ release the GPU memory, must be called with the GL context current """
+        self.points.delete()
+        if self.colors != None:
+            self.colors.delete()
+        if self.sizes != None:
+            self.sizes.delete()
+        if self.values != None:
+            self.values.delete()
+
+def value_components( values ):
+    """ number of components of a per-particle attribute array """
+    if values.ndim == 1:
+        return 1
+    return values.shape[-1]
+
+def _bind_attribute( location, buffer, size, constant ):
+    """ pass a vertex buffer or a constant value to a shader vertex attribute """
+    if buffer != None:
+        glEnableVertexAttribArray( location )
+        buffer.bind()
+        glVertexAttribPointer( location, size, GL_FLOAT, GL_FALSE, 0, buffer )
+    else:
+        # missing components default to (0,0,0,1)
+        value = list( constant ) + [ 0.0, 0.0, 0.0, 1.0 ][ len(constant): ]
+        glVertexAttrib4f( location, *value )
+
+def _unbind_attribute( location, buffer ):
+    if buffer != None:
+        buffer.unbind()
+        glDisableVertexAttribArray( location )
+
+class VBOCache(object):
+    """
+    Frame buffers indexed by cache index. Redrawing a frame already uploaded doesn't send any vertex
+    data to the GPU. The least recently used buffers are deleted when the total size goes over the
+    GPU memory budget. Buffers can be dropped anytime, they are deleted on the next get call since
+    this requires the GL context.
+    """
+    def __init__( self, budget=DEFAULT_GPU_BUFFERS_MB*1024*1024 ):
+        self._buffers = OrderedDict()
+        self._garbage = []
+        self._nbytes = 0
+        self.budget = budget
+
+    def __contains__( self, index ):
+        return index in self._buffers
+
+    def __len__( self ):
+        return len(self._buffers)
+
+    @property
+    def nbytes(self):
+        """ GPU memory used by the cached buffers """
+        return self._nbytes
+
+    def get( self, frame ):
+        """ return the buffers of frame, uploading the frame data if needed. Must be called with the GL context current. """
+        self._collect()
+        buffers = self._buffers.pop( frame.index, None )
+        if buffers != None and buffers.grid is not frame.grid:
+            # frame reordered by its culling grid
+            self._nbytes -= buffers.nbytes
+            self._garbage.append( buffers )
+            buffers = None
+        if buffers == None:
+            with TRACER.span( 'gpu upload', 'gpu', cache=frame.index ):
+                buffers = FrameBuffers( frame )
+                buffers.upload()
+            self._nbytes += buffers.nbytes
+        # most recently used buffers are at the end
+        self._buffers[ frame.index ] = buffers
+        self._evict()
+        self._collect()
+        return buffers
+
+    def remove( self, index ):
+        buffers = self._buffers.pop( index, None )
+        if buffers != None:
+            self._nbytes -= buffers.nbytes
+            self._garbage.append( buffers )
+
+    def clear( self ):
+        self._garbage.extend( self._buffers.values() )
+        self._buffers.clear()
+        self._nbytes = 0
+
+    def _evict( self ):
+        while self._nbytes > self.budget and len(self._buffers) > 1:
+            (index,buffers) = self._buffers.popitem( last=False )
+            self._nbytes -= buffers.nbytes
+            self._garbage.append( buffers )
+
+    def _collect( self ):
+        for buffers in self._garbage:
+            buffers.delete()
+        self._garbage = []
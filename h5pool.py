@@ -0,0 +1,113 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+import threading
+from collections import OrderedDict
+
+# keep well below the usual per-process file descriptor limit
+DEFAULT_MAX_OPEN_FILES = 256
+
+class H5FilePool(object):
+    """
+    Map of cache index to SIH5 file. At most max_open files are kept open, the least recently used
+    file gets closed when the limit is reached and is reopened transparently on the next access.
+    """
+    def __init__( self, max_open=DEFAULT_MAX_OPEN_FILES ):
+        self._lock = threading.RLock()
+        self._filenames = {}
+        self._open = OrderedDict()
+        self._max_open = max(1,max_open)
+
+    def __contains__( self, key ):
+        return key in self._filenames
+
+    def __len__( self ):
+        return len(self._filenames)
+
+    def __getitem__( self, key ):
+        """ return the open h5 file for key """
+        with self._lock:
+            f = self._open.pop( key, None )
+            if f == None:
+                # imported on first use, h5py is not needed to start the application
+                import h5py as h5
+                f = h5.File( self._filenames[ key ], 'r' )
+                while len(self._open) >= self._max_open:
+                    (k,lru) = self._open.popitem( last=False )
+                    lru.close()
+            # most recently used files are at the end
+            self._open[ key ] = f
+            return f
+
+    @property
+    def max_open(self):
+        return self._max_open
+
+    @max_open.setter
+    def max_open(self, value):
+        with self._lock:
+            self._max_open = max(1,value)
+            while len(self._open) > self._max_open:
+                (k,lru) = self._open.popitem( last=False )
+                lru.close()
+
+    @property
+    def lock(self):
+        """ hold while using a file returned by [], the pool may close it from another thread otherwise """
+        return self._lock
+
+    @property
+    def open_count(self):
+        return len(self._open)
+
+    def add( self, key, filename ):
+        """ register a file, the file gets opened on first access """
+        with self._lock:
+            self.remove( key )
+            self._filenames[ key ] = filename
+
+    def remove( self, key ):
+        with self._lock:
+            self._filenames.pop( key, None )
+            f = self._open.pop( key, None )
+            if f != None:
+                f.close()
+
+    def filename( self, key ):
+        return self._filenames.get( key )
+
+    def keys( self ):
+        return self._filenames.keys()
+
+    def read( self, key, path ):
+        """ read the whole dataset at path, returns None if the file or the dataset doesn't exist """
+        with self._lock:
+            if not key in self._filenames:
+                return None
+            f = self[ key ]
+            if not path in f:
+                return None
+            return f[ path ][:]
+
+    def clear( self ):
+        """ close all files """
+        with self._lock:
+            for f in self._open.values():
+                f.close()
+            self._open.clear()
+            self._filenames.clear()
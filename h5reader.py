@@ -22,12 +22,6 @@ from consts import CONSTS
 from icereader_util import *
 import shutil
 
-try:
-    import h5py as h5
-except:
-    print "ERROR: h5py not installed properly."
-    sys.exit()
-
 class H5Reader(object):    
     """ H5 file format reader """
     
@@ -36,6 +30,10 @@ class H5Reader(object):
         self._filename = None
         self._file = None
 
+        h5 = import_h5py()
+        if h5 == None:
+            raise Exception('ERROR: h5py not installed properly.')
+
         if isinstance(obj, h5.highlevel.File):
             self._file = obj
         else:
@@ -156,6 +154,15 @@ class H5Reader(object):
 def is_valid_file( cachefile ):
     return cachefile.endswith('.sih5') or cachefile.endswith('.hdf5')
 
+# prefixes of the HEADER attributes added to the converted files: source signature and bounding box
+HEADER_EXTRAS = ('source_', 'bbox_')
+# prefix of the attribute statistics
+ATTRIB_EXTRAS = ('stats_',)
+
+def _cache_attrs( attrs, extras ):
+    """ names of the HDF5 attributes holding the cache data, the ones added at conversion are left out """
+    return [ name for name in attrs if not name.startswith( extras ) ]
+
 class Header(object):
     """ H5 Header object """
     def __init__(self,h5_header):
@@ -167,16 +174,16 @@ class Header(object):
 
     def __iter__(self):
         """ Iterate over the names of attributes. """
-        for name in self.h5_header.attrs:
+        for name in _cache_attrs( self.h5_header.attrs, HEADER_EXTRAS ):
             yield name
 
     def __contains__(self, name):
         """ Test if a member name exists """
-        return name in self.h5_header.attrs
+        return name in self.h5_header.attrs and not name.startswith( HEADER_EXTRAS )
     
     def __str__(self):
         s = '[Header info]\n'
-        for a in self.h5_header.attrs:
+        for a in self:
             s += '%s = %s\n' % ( a, str(self.h5_header.attrs[a]) )
         return  s
 
@@ -192,12 +199,12 @@ class Attribute(object):
 
     def __iter__(self):
         """ Iterate over the names of attributes. """
-        for name in self.h5_attrib.attrs:
+        for name in _cache_attrs( self.h5_attrib.attrs, ATTRIB_EXTRAS ):
             yield name
 
     def __contains__(self, name):
         """ Test if a member name exists """
-        return name in self.h5_attrib.attrs
+        return name in self.h5_attrib.attrs and not name.startswith( ATTRIB_EXTRAS )
 
     @property
     def data(self):
@@ -207,7 +214,7 @@ class Attribute(object):
             return []
         
     def __str__(self):
-        return attribs_to_str( self.h5_attrib.attrs )
+        return attribs_to_str( self )
 
 def test1(): 
     #file = r'C:\dev\icecache_data\test_14.sih5'
@@ -227,7 +234,7 @@ def test1():
     r.close()
     
     file = r'C:\dev\icecache_data\test_16.sih5'
-    obj = h5.File( file, 'r' )
+    obj = import_h5py().File( file, 'r' )
     r = H5Reader( obj )
     
     r.load( )
@@ -0,0 +1,234 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+"""
+Command line tool for converting and inspecting ICE cache files without PyQt/OpenGL,
+typically used on render nodes right after caching.
+
+    python -m icebatch convert <files or folders> -o <folder> [-f text|sih5] [-j N] [--force]
+    python -m icebatch inspect <files or folders>
+    python -m icebatch stats <files or folders>
+    python -m icebatch trajectory <SIH5 files or folders> --id <particle ID> [-a attribute]
+
+The exit code is non-zero if any file failed.
+"""
+
+import sys
+import os
+import time
+import argparse
+import multiprocessing as mp
+from consts import CONSTS
+from icereader_util import get_files_from_cache_folder, get_files, get_export_file_path, EXT
+import icereader as icer
+import h5reader as h5r
+from icestats import attribute_stats, format_values, POSITION
+from h5pool import H5FilePool
+from particleindex import ParticleIndex
+
+FORMATS = { 'text' : CONSTS.TEXT_FMT, 'sih5' : CONSTS.SIH5_FMT }
+
+def open_reader( filename ):
+    """ Return a reader object for a .icecache or .sih5 file """
+    if icer.is_valid_file( filename ):
+        return icer.ICEReader( filename )
+    if h5r.is_valid_file( filename ):
+        return h5r.H5Reader( filename )
+    raise Exception('Error - Invalid file: %s' % filename )
+
+def collect_files( paths ):
+    """ Expand folders and return the cache files to process, sorted by frame number """
+    files = []
+    for path in paths:
+        if os.path.isdir( path ):
+            t = get_files_from_cache_folder( path )
+            if t != ():
+                files.extend( t[0] )
+        elif os.path.isfile( path ) and (icer.is_valid_file( path ) or h5r.is_valid_file( path )):
+            files.append( path )
+        else:
+            sys.stderr.write( 'Error - Invalid file: %s\n' % path )
+
+    if files == []:
+        return []
+    return get_files( files )[0]
+
+def convert_file( args ):
+    """
+    Convert one cache file, meant to be called from a worker process.
+    args: (filename, destination folder, format, force)
+    Returns a dictionary describing the outcome.
+    """
+    (filename, destination, fmt, force) = args
+    result = { 'filename' : filename, 'export_filename' : None, 'ok' : False, 'error' : None, 'bytes' : 0, 'particles' : 0, 'seconds' : 0.0 }
+    t1 = time.time()
+    try:
+        result['bytes'] = os.path.getsize( filename )
+        reader = open_reader( filename )
+        reader.export( destination, fmt, force )
+        if h5r.is_valid_file( filename ) and fmt == CONSTS.SIH5_FMT:
+            result['export_filename'] = get_export_file_path( destination, filename, None )
+        else:
+            result['export_filename'] = get_export_file_path( destination, filename, EXT[ fmt ] )
+        if reader.header != None:
+            result['particles'] = int(reader.header['particle_count'])
+        # exporters don't always report their errors, make sure something was written
+        result['ok'] = os.path.isfile( result['export_filename'] )
+        if not result['ok']:
+            result['error'] = 'nothing exported'
+    except:
+        result['error'] = str(sys.exc_info()[1])
+    result['seconds'] = time.time() - t1
+    return result
+
+def _convert( options ):
+    files = collect_files( options.paths )
+    if files == []:
+        sys.stderr.write( 'No cache files to convert\n' )
+        return 1
+
+    if not os.path.exists( options.output ):
+        os.makedirs( options.output )
+
+    fmt = FORMATS[ options.format ]
+    tasks = [ (f, options.output, fmt, options.force) for f in files ]
+    jobs = max( 1, min( options.jobs, len(tasks) ) )
+
+    t1 = time.time()
+    failures = 0
+    total_bytes = 0
+    total_particles = 0
+    pool = mp.Pool( jobs )
+    try:
+        for i,result in enumerate( pool.imap_unordered( convert_file, tasks ) ):
+            if result['ok']:
+                total_bytes += result['bytes']
+                total_particles += result['particles']
+                print '[%d/%d] %s -> %s (%0.3f s)' % (i+1, len(tasks), result['filename'], result['export_filename'], result['seconds'])
+            else:
+                failures += 1
+                sys.stderr.write( '[%d/%d] Error converting %s: %s\n' % (i+1, len(tasks), result['filename'], result['error']) )
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    pool.join()
+    elapsed = max( time.time() - t1, 1e-6 )
+
+    print 'Converted %d/%d files with %d processes in %0.3f s' % (len(tasks)-failures, len(tasks), jobs, elapsed)
+    print 'Throughput: %0.2f files/s, %0.2f MB/s, %0.0f particles/s' % ((len(tasks)-failures)/elapsed, total_bytes/elapsed/(1024*1024), total_particles/elapsed)
+    if failures:
+        return 1
+    return 0
+
+def _inspect( options ):
+    files = collect_files( options.paths )
+    failures = 0
+    for f in files:
+        try:
+            reader = open_reader( f )
+            reader.load( )
+        except:
+            failures += 1
+            sys.stderr.write( 'Error loading %s: %s\n' % (f, sys.exc_info()[1]) )
+            continue
+
+        print '[File]\n%s\n' % f
+        print str(reader.header)
+        for a in reader.attributes:
+            print str(a)
+    if failures or files == []:
+        return 1
+    return 0
+
+def _stats( options ):
+    files = collect_files( options.paths )
+    failures = 0
+    for f in files:
+        try:
+            reader = open_reader( f )
+            reader.load( )
+        except:
+            failures += 1
+            sys.stderr.write( 'Error loading %s: %s\n' % (f, sys.exc_info()[1]) )
+            continue
+
+        print '[File]\n%s' % f
+        for a in reader.attributes:
+            s = attribute_stats( a.data )
+            if s == None:
+                print '%s: <no data>' % a['name']
+                continue
+            print '%s: count=%d min=%s max=%s mean=%s nan=%s' % (a['name'], s['count'], format_values(s['min']), format_values(s['max']), format_values(s['mean']), format_values(s['nan_count']))
+        print ''
+    if failures or files == []:
+        return 1
+    return 0
+
+def _trajectory( options ):
+    files = [ f for f in collect_files( options.paths ) if h5r.is_valid_file( f ) ]
+    if files == []:
+        sys.stderr.write( 'No SIH5 files, convert the cache files first\n' )
+        return 1
+
+    pool = H5FilePool()
+    for i,f in enumerate( files ):
+        pool.add( i, f )
+    try:
+        (frames, values) = ParticleIndex( pool ).trajectory( options.id, options.attribute )
+    finally:
+        pool.clear()
+    if len(frames) == 0:
+        sys.stderr.write( 'Particle %d not found\n' % options.id )
+        return 1
+
+    for i,frame in enumerate( frames ):
+        print '%s: %s' % (files[ frame ], format_values( values[i] ))
+    return 0
+
+def main( argv ):
+    parser = argparse.ArgumentParser( prog='icebatch', description='Convert and inspect ICE cache files.' )
+    commands = parser.add_subparsers( dest='command' )
+
+    p = commands.add_parser( 'convert', help='convert cache files to text or SIH5' )
+    p.add_argument( 'paths', nargs='+', help='cache files or folders' )
+    p.add_argument( '-o', '--output', required=True, help='destination folder' )
+    p.add_argument( '-f', '--format', choices=sorted(FORMATS.keys()), default='sih5', help='export format' )
+    p.add_argument( '-j', '--jobs', type=int, default=mp.cpu_count(), help='number of processes' )
+    p.add_argument( '--force', action='store_true', help='overwrite existing files' )
+    p.set_defaults( func=_convert )
+
+    p = commands.add_parser( 'inspect', help='print header and attribute descriptions' )
+    p.add_argument( 'paths', nargs='+', help='cache files or folders' )
+    p.set_defaults( func=_inspect )
+
+    p = commands.add_parser( 'stats', help='print attribute statistics' )
+    p.add_argument( 'paths', nargs='+', help='cache files or folders' )
+    p.set_defaults( func=_stats )
+
+    p = commands.add_parser( 'trajectory', help='print the values of an attribute for a particle ID across SIH5 files' )
+    p.add_argument( 'paths', nargs='+', help='SIH5 files or folders' )
+    p.add_argument( '--id', type=int, required=True, help='particle ID' )
+    p.add_argument( '-a', '--attribute', default=POSITION, help='attribute name' )
+    p.set_defaults( func=_trajectory )
+
+    options = parser.parse_args( argv[1:] )
+    return options.func( options )
+
+if __name__ == '__main__':
+    sys.exit( main(sys.argv) )
@@ -20,13 +20,14 @@ from PyQt4 import QtCore, QtGui
 
 from iceviewer import ICEViewer
 from icereader import ICEReader
-from icereader_util import get_files_from_cache_folder
+from sequences import list_sequences
 from iceexporter import ICEExporter
-from icedataloader import ICEDataLoader
+from datamodel import AttributeTableModel
 from playback import PlaybackWidget
 from consts import CONSTS
 from icereader_util import *
-from h5reader import H5Reader
+from icestats import format_values
+from profiler import TRACER
 from preferences import *
 
 import sys
@@ -56,6 +57,7 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
         # setup the OGL window
         self.viewer = ICEViewer(self)
         self.viewer.cacheLoaded.connect(self._on_cache_loaded)
+        self.viewer.cacheAppended.connect(self._on_cache_appended)
         self.viewer.beginCacheLoading.connect(self._on_begin_cache_loading)
         self.viewer.endCacheLoading.connect(self._on_end_cache_loading)        
         self.setCentralWidget(self.viewer)
@@ -66,11 +68,8 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
         self.exporter.beginCacheExporting.connect(self._on_begin_cache_exporting)
         self.exporter.endCacheExporting.connect(self._on_end_cache_exporting)
         
-        # create object responsible for loading attributes data in the browser
-        self.data_loader = ICEDataLoader(self)        
-        self.data_loader.cacheDataLoaded.connect(self._on_cache_data_loaded)
-        self.data_loader.beginCacheDataLoading.connect(self._on_begin_cache_data_loading)
-        self.data_loader.endCacheDataLoading.connect(self._on_end_cache_data_loading)
+        # attribute values shown in the data window
+        self.data_model = AttributeTableModel(self)
         
         self._create_actions()
         self._create_menus()
@@ -90,9 +89,24 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
         fileDialog.setOptions(QtGui.QFileDialog.ShowDirsOnly)
         if not fileDialog.exec_():
             return
+
+        folder = str(fileDialog.directory().absolutePath())
+        sequences = list_sequences(folder)
+        if sequences == []:
+            self.statusBar().showMessage('Error - No cache files in %s' % folder)
+            return
+
+        sequence = sequences[0]
+        if len(sequences) > 1:
+            # several emitters cached in the same folder, the largest sequence is selected by default
+            items = [s.describe() for s in sequences]
+            (item, ok) = QtGui.QInputDialog.getItem(self, 'Select Sequence', 'Sequences in %s:' % folder, items, 0, False)
+            if not ok:
+                return
+            sequence = sequences[items.index(str(item))]
                 
         self.current_job = self.LOAD
-        self.viewer.load_files_from_folder(fileDialog.directory().absolutePath())                
+        self.viewer.load_sequence(sequence, self.watch_folder_act.isChecked())
         
     def _load_cache(self):
         """ Load cache file from a file dialog """
@@ -148,15 +162,6 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
         self._stop_progressbar()
 
     # slots for the cache data load job
-    def _on_begin_cache_data_loading(self, cache_attrib, num ):
-        self._start_progressbar( num, 'Loading data: %s' % (cache_attrib) )
-
-    def _on_cache_data_loaded(self ):
-        self._update_progressbar()
-
-    def _on_end_cache_data_loading(self):
-        self._stop_progressbar()
-
     # slots for the cache load job
     def _on_begin_cache_loading(self, count, start, end ):
         self.current_job = self.LOAD
@@ -177,7 +182,14 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
             return
 
         self._update_progressbar()
+        self._add_cache_item(cacheindex, filename)
 
+    def _on_cache_appended(self, cacheindex, filename):
+        """update the browser when a new cache of the watched folder has finished loading"""
+        self._add_cache_item(cacheindex, filename)
+        self.statusBar().showMessage( 'Cache %d loaded: %s' % (cacheindex, filename) )
+
+    def _add_cache_item(self, cacheindex, filename):
         self._cache_files.append( filename )
         
         # Creates browser top level items only, rest will be filled when items get expanded
@@ -193,6 +205,29 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
         headeritem.setText(0, 'Header')
         headeritem.setText(1, "ICECACHE")
                 
+    def _export_trace(self):
+        """ save the recorded timings for chrome://tracing """
+        filename = QtGui.QFileDialog.getSaveFileName(self, "Export Timings Trace", "iceexplorer_trace.json", "Trace Files (*.json)")
+        if filename:
+            count = TRACER.save_chrome_trace( str(filename) )
+            self.statusBar().showMessage( '%d spans saved to %s' % (count, filename) )
+
+    def _fill_color_by_menu(self):
+        """ list the attributes of the current cache that can be mapped to colors """
+        self.colorByMenu.clear()
+        group = QtGui.QActionGroup(self.colorByMenu)
+        current = self.viewer.cache.color_attribute
+        names = [None] + self.viewer.cache.color_attributes( self.viewer.current_cache )
+        for name in names:
+            if name == None:
+                act = QtGui.QAction("Particle Color", group)
+            else:
+                act = QtGui.QAction(name, group)
+            act.setCheckable(True)
+            act.setChecked(name == current)
+            act.triggered.connect( lambda checked, name=name: self.viewer.set_color_attribute(name) )
+            self.colorByMenu.addAction(act)
+
     def _cancel_current_job(self):
         """ cancel the current executing I/O job """
         if self.current_job == self.LOAD:
@@ -212,6 +247,7 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
         self.export_selected_cache_to_sih5_act = QtGui.QAction(QtGui.QIcon(r'./resources/export-cache.png'), "Export Selected Cache To &SIH5", self, statusTip="Export To SIH5")
         self.cancel_current_job_act = QtGui.QAction(QtGui.QIcon(r'./resources/cancel_loading.png'), "Cancel", self, statusTip="Cancel", triggered=self._cancel_current_job)
         self.cancel_current_job_act.setDisabled(True)
+        self.watch_folder_act = QtGui.QAction("&Watch Loaded Folder", self, statusTip="Load The New Cache Files Written To The Loaded Folder", checkable=True, toggled=self.viewer.watch_folder)
         
         self.prefs_act = QtGui.QAction(QtGui.QIcon(r'./resources/preferences.png'), "&Preferences...", self, statusTip="ICE Explorer Preferences", triggered=self.preferences)
         self.quit_act = QtGui.QAction("&Quit", self, shortcut="Ctrl+Q", statusTip="Quit ICE Explorer", triggered=self.close)
@@ -221,6 +257,10 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
         self.show_top_act = QtGui.QAction(QtGui.QIcon(r'./resources/top.png'), "&Top", self, statusTip="Show Top View", triggered=self.viewer.top_view)
         self.show_front_act = QtGui.QAction(QtGui.QIcon(r'./resources/front.png'), "&Front", self, statusTip="Show Front View", triggered=self.viewer.front_view)
         self.show_right_act = QtGui.QAction(QtGui.QIcon(r'./resources/right.png'), "&Right", self, statusTip="Show Right View", triggered=self.viewer.right_view)
+        self.frame_current_act = QtGui.QAction("Frame &Current Cache", self, statusTip="Fit The View To The Current Cache (F6)", triggered=self.viewer.frame_current)
+        self.frame_sequence_act = QtGui.QAction("Frame &All Caches", self, statusTip="Fit The View To All Caches (F7)", triggered=self.viewer.frame_sequence)
+        self.show_timings_act = QtGui.QAction("Show &Timings", self, statusTip="Show The Frame Timings Overlay", checkable=True, toggled=self.viewer.show_timings)
+        self.export_trace_act = QtGui.QAction("Export Timings &Trace...", self, statusTip="Save The Recorded Timings As A Chrome Trace File", triggered=self._export_trace)
 
         self.zoom_tool_act = QtGui.QAction(QtGui.QIcon(r'./resources/zoom.png'), "&Zoom", self, statusTip="Zoom Tool", triggered=self.viewer.zoom_tool)
         self.orbit_tool_act = QtGui.QAction(QtGui.QIcon(r'./resources/orbit.png'), "&Orbit", self, statusTip="Orbit Tool", triggered=self.viewer.orbit_tool)
@@ -234,6 +274,7 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
  
         self.fileMenu.addAction(self.load_cache_folder_act)
         self.fileMenu.addAction(self.load_cache_act)
+        self.fileMenu.addAction(self.watch_folder_act)
         self.fileMenu.addSeparator()
         self.fileMenu.addAction(self.export_caches_to_text_act)
         self.fileMenu.addAction(self.export_caches_to_sih5_act)
@@ -251,6 +292,16 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
         
         self.viewMenu = self.menuBar().addMenu("&View")
         self.viewMenu.setStyleSheet(CONSTS.SS_MENU)
+        self.viewMenu.addAction(self.frame_current_act)
+        self.viewMenu.addAction(self.frame_sequence_act)
+        self.viewMenu.addSeparator()
+        # filled with the attributes of the current cache when shown
+        self.colorByMenu = self.viewMenu.addMenu("Color &By")
+        self.colorByMenu.setStyleSheet(CONSTS.SS_MENU)
+        self.colorByMenu.aboutToShow.connect(self._fill_color_by_menu)
+        self.viewMenu.addSeparator()
+        self.viewMenu.addAction(self.show_timings_act)
+        self.viewMenu.addAction(self.export_trace_act)
 
         self.helpMenu = self.menuBar().addMenu("&Help")
         self.helpMenu.addAction(self.about_act)
@@ -317,6 +368,17 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
         self.addDockWidget(QtCore.Qt.RightDockWidgetArea, dock)
         self.viewMenu.addAction(dock.toggleViewAction())
 
+        # Attribute values, the rows are formatted on demand by the model
+        self.data_dock = QtGui.QDockWidget("Data", self)
+        self.data_dock.setAllowedAreas(QtCore.Qt.LeftDockWidgetArea | QtCore.Qt.RightDockWidgetArea | QtCore.Qt.BottomDockWidgetArea)
+        self.dataView = QtGui.QTableView(self.data_dock)
+        self.dataView.setModel(self.data_model)
+        self.dataView.setStyleSheet(CONSTS.SS_BACKGROUND)
+        self.dataView.verticalHeader().setDefaultSectionSize(18)
+        self.data_dock.setWidget(self.dataView)
+        self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.data_dock)
+        self.viewMenu.addAction(self.data_dock.toggleViewAction())
+
         # Playback widget
         dock = QtGui.QDockWidget("Play Back", self)
         dock.setAllowedAreas(QtCore.Qt.BottomDockWidgetArea)        
@@ -334,24 +396,31 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
         
         #Fill this item with cache attributes
         (cacheindex,flag) = var.toInt()
-        h5cache = self.viewer.cache[ cacheindex ]
         
         if item.text(0) == 'Data':
-            self.data_loader.load(h5cache,item)                  
+            # show the values in the data window, the model opens its own file
+            attrib_name = str(item.parent().text(1))
+            self.data_model.load(self.viewer.cache.filename( cacheindex ), attrib_name)
+            self.data_dock.setWindowTitle('Data - Cache %d: %s' % (cacheindex, attrib_name))
+            self.data_dock.show()
+            self.data_dock.raise_()
+            item.child(0).setText(1, '%d values in the Data window' % self.data_model.count)
+            return
+
+        # metadata sent by the loader, the file is not read
+        metadata = self.viewer.cache.metadata( cacheindex )
+        if metadata == None:
             return
 
         #done with the user data
         item.setData(0, QtCore.Qt.UserRole, None)
-
-        reader = H5Reader( h5cache )
-        reader.load()
         
         # Cache
         #    > Header
         #         <header items>
         headeritem = item.child(0)
         headeritem.setText(0, 'Header')
-        headeritem.setText(1, reader.header['name'])
+        headeritem.setText(1, metadata.header['name'])
         
         version = QtGui.QTreeWidgetItem(headeritem)
         type = QtGui.QTreeWidgetItem(headeritem)
@@ -363,21 +432,28 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
         attribute_count = QtGui.QTreeWidgetItem(headeritem)
 
         version.setText(0, 'Version')
-        version.setText(1, str(reader.header['version']))
+        version.setText(1, str(metadata.header['version']))
         type.setText(0, 'Type')
-        type.setText(1, objtype_to_string(reader.header['type']))
+        type.setText(1, objtype_to_string(metadata.header['type']))
         particle_count.setText(0, 'Particle Count')
-        particle_count.setText(1, str(reader.header['particle_count']))
+        particle_count.setText(1, str(metadata.header['particle_count']))
         edge_count.setText(0, 'Edge Count')
-        edge_count.setText(1, str(reader.header['edge_count']))
+        edge_count.setText(1, str(metadata.header['edge_count']))
         polygon_count.setText(0, 'Polygon Count')
-        polygon_count.setText(1, str(reader.header['polygon_count']))
+        polygon_count.setText(1, str(metadata.header['polygon_count']))
         sample_count.setText(0, 'Sample Count')
-        sample_count.setText(1, str(reader.header['sample_count']))
+        sample_count.setText(1, str(metadata.header['sample_count']))
         blob_count.setText(0, 'Blob Count')
-        blob_count.setText(1, str(reader.header['blob_count']))
+        blob_count.setText(1, str(metadata.header['blob_count']))
         attribute_count.setText(0, 'Attribute Count')
-        attribute_count.setText(1, str(reader.header['attribute_count']))
+        attribute_count.setText(1, str(metadata.header['attribute_count']))
+
+        # precomputed statistics, not available for files exported by older versions
+        bbox = self.viewer.cache.stats.bbox( cacheindex )
+        if bbox != None:
+            bbox_item = QtGui.QTreeWidgetItem(headeritem)
+            bbox_item.setText(0, 'Bounding Box')
+            bbox_item.setText(1, '(%s) - (%s)' % (format_values(bbox[0]), format_values(bbox[1])))
 
         # attribute items
         # Cache
@@ -386,7 +462,7 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
         #    > Attribute <name>
         #         <attribute items>        
 
-        for attrib in reader.attributes:
+        for attrib in metadata.attributes:
             attribitem = QtGui.QTreeWidgetItem(item)
             attribitem.setText(0, 'Attribute')
             attribitem.setText(1, attrib['name'] )
@@ -419,9 +495,8 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
             blobtype_count.setText(1, str(attrib['blobtype_count']))
             blobtype_names.setText(0, 'Blob Type Name')
             blobtype_names.setText(1, str(attrib['blobtype_names']))
-            # will be filled when the data gets loaded by the user
             isconstant.setText(0, 'Constant Data')            
-            isconstant.setText(1, '')
+            isconstant.setText(1, str(attrib['isconstant']))
             
             # attribute data items, empty for now
             # Cache
@@ -435,6 +510,15 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
             var = QtCore.QVariant(cacheindex)
             dataitem.setData(0, QtCore.Qt.UserRole, var )            
 
+            # attribute statistics, inserted before the data item
+            stats = self.viewer.cache.stats.attribute( attrib['name'], cacheindex )
+            if stats != None:
+                for (label,key) in (('Min','min'), ('Max','max'), ('Mean','mean'), ('NaN Count','nan_count')):
+                    statitem = QtGui.QTreeWidgetItem()
+                    statitem.setText(0, label)
+                    statitem.setText(1, format_values(stats[key]))
+                    attribitem.insertChild( attribitem.indexOfChild(dataitem), statitem )
+
             # add dummy value so data item can get filled with values when it get expanded
             emptyvalue = QtGui.QTreeWidgetItem( dataitem )
             emptyvalue.setText( 0, '' )
@@ -459,8 +543,7 @@ class ICECacheExplorerWindow(QtGui.QMainWindow):
         else:
             return
         
-        h5cache = self.viewer.cache[ cache_index ]
-        self.exporter.export_files( [h5cache.filename], self.prefs.export_folder, fmt)                
+        self.exporter.export_files( [self.viewer.cache.filename( cache_index )], self.prefs.export_folder, fmt)                
 
     # Progress bar helpers
     def _start_progressbar(self,num,msg=''):        
@@ -27,6 +27,7 @@ import ui_export_file
 import sys
 import os
 import time
+from profiler import TRACER, clock
 
 class ICEExporter(QtCore.QObject):
     """ Class to manage processes for exporting ICE cache data to ascii. """
@@ -65,6 +66,9 @@ class ICEExporter(QtCore.QObject):
     
     def cancel(self):
         self.pool.cancel()
+        if self.state == self.RUN:
+            self.state = self.STOP
+            self.endCacheExporting.emit( )
 
     def export_folder( self, folder, destination, fmt=CONSTS.TEXT_FMT ):    
         """ Export the cache files contained in a folder """
@@ -100,7 +104,7 @@ class ICEExporter(QtCore.QObject):
             import multiprocessing as mp
             cpu_count = mp.cpu_count() 
             
-        self.pool.init( cpu_count, self._on_process_callback )
+        self.pool.init( cpu_count, self._on_process_callback, ExportTask.COMMAND )
         self.state = self.STOP
         file_count = len(self.files)
         self.files_processed = 0
@@ -117,7 +121,7 @@ class ICEExporter(QtCore.QObject):
         if notif == Pool.STARTED:
             #print 'Pool.STARTED'
             if self.state == self.STOP:
-                self.t1 = time.time()
+                self.t1 = clock()
                 self.beginCacheExporting.emit( len(self.files) )
                 self.state = self.RUN
                 
@@ -132,13 +136,11 @@ class ICEExporter(QtCore.QObject):
         elif notif == Pool.OUTPUT_MSG:
             if self.state == self.ERROR:
                 return
-            s_out = bytes.decode( bytes( sender.readAllStandardOutput() ) )
-            #print 'Pool.OUTPUT_MSG: %s' % s_out
-            self.cacheExporting.emit( s_out )            
+            #print 'Pool.OUTPUT_MSG: %s' % arg
+            self.cacheExporting.emit( arg )            
                 
         elif notif == Pool.OUTPUT_ERROR_MSG:
-            s_out = bytes.decode( bytes( sender.readAllStandardError() ) )
-            print 'process error output: %s - %s\nRetry your operation.' % ((repr(sender)),s_out)
+            print 'process error output: %s - %s\nRetry your operation.' % ((repr(sender)),arg)
                 
         elif notif == Pool.FINISHED:
             #print 'Pool.FINISHED'
@@ -147,13 +149,17 @@ class ICEExporter(QtCore.QObject):
                 return
             self.files_processed += self.file_block
             if self.files_processed >= len(self.files):
-                self.t2 = time.time()
+                self.t2 = clock()
+                TRACER.record( 'export job', self.t1, self.t2 - self.t1, 'io', { 'files' : len(self.files) } )
                 self.endCacheExporting.emit( )            
                 self.state = self.STOP
                 print 'Export time %0.3f s' % (self.t2-self.t1)
         
 class ExportTask(object):
     """ Task to export cache files from a process """
+    # worker process command
+    COMMAND = 'python.exe export_process.py'
+
     def __init__(self,args):        
         """ 
         Process arguments:
@@ -161,11 +167,11 @@ class ExportTask(object):
         arg1: target export folder
         arg2: export format {TEXT|SIH5}
         """ 
-        self._cmd = 'python.exe export_process.py "%s" %s %d' % (repr(args[0]),args[1],int(args[2]))
+        self._msg = repr( [args[0], args[1], int(args[2])] )
 
     def __call__(self):
-        """ Returns the process command """
-        return self._cmd
+        """ Returns the task message sent to the worker process """
+        return self._msg
 
 class ICEExportFolderDialog( QtGui.QDialog ):
     """Dialog for exporting folder data to text or hdf5 format"""
@@ -0,0 +1,325 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+"""
+Job server for spreading cache conversions over several machines. The server hands out
+conversion tasks to workers connecting over TCP; every task is leased to a worker for a limited
+time and goes back in the queue if the lease expires or the worker connection drops.
+
+    python -m icejobs serve <files or folders> -o <folder> [-f text|sih5] [--port 5005] [--local-workers N]
+    python -m icejobs work <host>:<port>
+
+Workers convert with icebatch.convert_file, the destination folder must be reachable from every node.
+Messages are JSON objects, one per line.
+"""
+
+import sys
+import os
+import time
+import json
+import socket
+import threading
+import subprocess
+import SocketServer
+from collections import deque
+
+DEFAULT_PORT = 5005
+LEASE_TIMEOUT = 60.0
+MAX_ATTEMPTS = 3
+
+class JobServer(object):
+    """ Hands conversion tasks to TCP workers and collects the results """
+
+    # task states
+    PENDING = 0
+    LEASED = 1
+    DONE = 2
+    FAILED = 3
+
+    def __init__( self, tasks, host='', port=DEFAULT_PORT, lease_timeout=LEASE_TIMEOUT, max_attempts=MAX_ATTEMPTS ):
+        """ tasks: list of icebatch.convert_file arguments """
+        self._lock = threading.Lock()
+        self._tasks = list(tasks)
+        self._state = [ self.PENDING ] * len(self._tasks)
+        self._attempts = [ 0 ] * len(self._tasks)
+        self._results = [ None ] * len(self._tasks)
+        self._pending = deque( range(len(self._tasks)) )
+        # task id -> (worker id, lease deadline)
+        self._leases = {}
+        self._lease_timeout = lease_timeout
+        self._max_attempts = max_attempts
+        self._done_count = 0
+        self._worker_count = 0
+        self._server = _TCPServer( (host, port), _WorkerHandler )
+        self._server.job_server = self
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    @property
+    def results(self):
+        return self._results
+
+    def finished( self ):
+        with self._lock:
+            return self._done_count == len(self._tasks)
+
+    def run( self, poll=0.5 ):
+        """ Serve workers until every task is completed or failed, returns the list of results """
+        thread = threading.Thread( target=self._server.serve_forever, kwargs={ 'poll_interval' : poll } )
+        thread.daemon = True
+        thread.start()
+        try:
+            while not self.finished():
+                time.sleep( poll )
+                self._expire_leases()
+        finally:
+            self._server.shutdown()
+            self._server.server_close()
+        return self._results
+
+    # Worker requests, called from the server threads
+    def _new_worker( self ):
+        with self._lock:
+            self._worker_count += 1
+            return self._worker_count
+
+    def _lease( self, worker ):
+        with self._lock:
+            if self._pending:
+                tid = self._pending.popleft()
+                self._state[tid] = self.LEASED
+                self._attempts[tid] += 1
+                self._leases[tid] = (worker, time.time() + self._lease_timeout)
+                return { 'op' : 'task', 'id' : tid, 'args' : self._tasks[tid], 'lease' : self._lease_timeout }
+            if self._done_count == len(self._tasks):
+                return { 'op' : 'done' }
+            # tasks still leased to other workers could come back in the queue
+            return { 'op' : 'wait', 'seconds' : 1.0 }
+
+    def _renew( self, worker, tid ):
+        with self._lock:
+            if tid in self._leases and self._leases[tid][0] == worker:
+                self._leases[tid] = (worker, time.time() + self._lease_timeout)
+
+    def _complete( self, worker, tid, result ):
+        with self._lock:
+            if self._state[tid] in (self.DONE, self.FAILED):
+                # late result from an expired lease
+                return
+            self._leases.pop( tid, None )
+            if tid in self._pending:
+                self._pending.remove( tid )
+            self._results[tid] = result
+            if result['ok']:
+                self._state[tid] = self.DONE
+            else:
+                self._state[tid] = self.FAILED
+            self._done_count += 1
+        if result['ok']:
+            print '[%d/%d] worker %d: %s (%0.3f s)' % (self._done_count, len(self._tasks), worker, result['filename'], result['seconds'])
+        else:
+            sys.stderr.write( '[%d/%d] worker %d: Error converting %s: %s\n' % (self._done_count, len(self._tasks), worker, result['filename'], result['error']) )
+
+    def _release_worker( self, worker ):
+        """ The worker went away, put its tasks back in the queue """
+        with self._lock:
+            for tid in [ t for t,(w,d) in self._leases.items() if w == worker ]:
+                self._requeue( tid, 'worker %d disconnected' % worker )
+
+    def _expire_leases( self ):
+        now = time.time()
+        with self._lock:
+            for tid in [ t for t,(w,d) in self._leases.items() if d < now ]:
+                self._requeue( tid, 'lease expired' )
+
+    def _requeue( self, tid, reason ):
+        """ called with the lock held """
+        del self._leases[tid]
+        if self._attempts[tid] >= self._max_attempts:
+            self._state[tid] = self.FAILED
+            self._results[tid] = { 'filename' : self._tasks[tid][0], 'ok' : False, 'error' : '%s after %d attempts' % (reason, self._attempts[tid]) }
+            self._done_count += 1
+            sys.stderr.write( 'Giving up on %s: %s\n' % (self._tasks[tid][0], self._results[tid]['error']) )
+            return
+        self._state[tid] = self.PENDING
+        self._pending.appendleft( tid )
+        sys.stderr.write( 'Requeued %s: %s\n' % (self._tasks[tid][0], reason) )
+
+class _TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+class _WorkerHandler(SocketServer.StreamRequestHandler):
+    """ One instance per worker connection """
+    def handle( self ):
+        server = self.server.job_server
+        worker = server._new_worker()
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    break
+                msg = json.loads( line )
+                op = msg.get( 'op' )
+                if op == 'get':
+                    self._send( server._lease( worker ) )
+                elif op == 'renew':
+                    server._renew( worker, msg['id'] )
+                elif op == 'result':
+                    server._complete( worker, msg['id'], msg['result'] )
+        except (socket.error, ValueError):
+            pass
+        finally:
+            server._release_worker( worker )
+
+    def _send( self, msg ):
+        self.wfile.write( json.dumps( msg ) + '\n' )
+        self.wfile.flush()
+
+class _Heartbeat(threading.Thread):
+    """ Renew the task lease while the worker is busy converting """
+    def __init__( self, send, tid, period ):
+        super(_Heartbeat,self).__init__()
+        self.daemon = True
+        self._send = send
+        self._tid = tid
+        self._period = period
+        self._stopped = threading.Event()
+
+    def run( self ):
+        while not self._stopped.wait( self._period ):
+            try:
+                self._send( { 'op' : 'renew', 'id' : self._tid } )
+            except socket.error:
+                return
+
+    def stop( self ):
+        self._stopped.set()
+
+def run_worker( host, port ):
+    """ Convert tasks from the job server until there is nothing left to do. Returns the number of tasks processed. """
+    from icebatch import convert_file
+
+    sock = socket.create_connection( (host, port) )
+    rfile = sock.makefile( 'r' )
+    lock = threading.Lock()
+
+    def send( msg ):
+        with lock:
+            sock.sendall( json.dumps( msg ) + '\n' )
+
+    count = 0
+    try:
+        while True:
+            send( { 'op' : 'get' } )
+            line = rfile.readline()
+            if not line:
+                # server is gone
+                break
+            msg = json.loads( line )
+            if msg['op'] == 'done':
+                break
+            if msg['op'] == 'wait':
+                time.sleep( msg['seconds'] )
+                continue
+
+            heartbeat = _Heartbeat( send, msg['id'], msg['lease'] / 3.0 )
+            heartbeat.start()
+            try:
+                result = convert_file( msg['args'] )
+            finally:
+                heartbeat.stop()
+            send( { 'op' : 'result', 'id' : msg['id'], 'result' : result } )
+            count += 1
+    finally:
+        rfile.close()
+        sock.close()
+    return count
+
+def _serve( options ):
+    from icebatch import collect_files, FORMATS
+
+    files = collect_files( options.paths )
+    if files == []:
+        sys.stderr.write( 'No cache files to convert\n' )
+        return 1
+    if not os.path.exists( options.output ):
+        os.makedirs( options.output )
+
+    fmt = FORMATS[ options.format ]
+    output = os.path.abspath( options.output )
+    tasks = [ (os.path.abspath(f), output, fmt, options.force) for f in files ]
+    server = JobServer( tasks, options.host, options.port, options.lease )
+    print 'Serving %d tasks on %s:%d' % ((len(tasks),) + server.address)
+
+    workers = []
+    for i in range( options.local_workers ):
+        workers.append( subprocess.Popen( [sys.executable, os.path.abspath(__file__), 'work', 'localhost:%d' % server.address[1]] ) )
+
+    t1 = time.time()
+    results = server.run()
+    elapsed = max( time.time() - t1, 1e-6 )
+    for w in workers:
+        w.wait()
+
+    ok = [ r for r in results if r['ok'] ]
+    print 'Converted %d/%d files in %0.3f s' % (len(ok), len(results), elapsed)
+    print 'Throughput: %0.2f files/s, %0.2f MB/s, %0.0f particles/s' % (len(ok)/elapsed, sum([r['bytes'] for r in ok])/elapsed/(1024*1024), sum([r['particles'] for r in ok])/elapsed)
+    if len(ok) != len(results):
+        return 1
+    return 0
+
+def _work( options ):
+    (host, port) = options.server.rsplit( ':', 1 )
+    try:
+        count = run_worker( host, int(port) )
+    except socket.error:
+        sys.stderr.write( 'Cannot reach job server %s: %s\n' % (options.server, sys.exc_info()[1]) )
+        return 1
+    print 'Worker done, %d tasks processed' % count
+    return 0
+
+def main( argv ):
+    import argparse
+    from icebatch import FORMATS
+
+    parser = argparse.ArgumentParser( prog='icejobs', description='Distribute cache conversions to TCP workers.' )
+    commands = parser.add_subparsers( dest='command' )
+
+    p = commands.add_parser( 'serve', help='serve conversion tasks to workers' )
+    p.add_argument( 'paths', nargs='+', help='cache files or folders' )
+    p.add_argument( '-o', '--output', required=True, help='destination folder, shared by all workers' )
+    p.add_argument( '-f', '--format', choices=sorted(FORMATS.keys()), default='sih5', help='export format' )
+    p.add_argument( '--force', action='store_true', help='overwrite existing files' )
+    p.add_argument( '--host', default='', help='interface to listen on' )
+    p.add_argument( '--port', type=int, default=DEFAULT_PORT, help='port to listen on, 0 picks a free port' )
+    p.add_argument( '--lease', type=float, default=LEASE_TIMEOUT, help='task lease timeout in seconds' )
+    p.add_argument( '--local-workers', type=int, default=0, help='number of workers to start on this machine' )
+    p.set_defaults( func=_serve )
+
+    p = commands.add_parser( 'work', help='process tasks from a job server' )
+    p.add_argument( 'server', help='<host>:<port>' )
+    p.set_defaults( func=_work )
+
+    options = parser.parse_args( argv[1:] )
+    return options.func( options )
+
+if __name__ == '__main__':
+    sys.exit( main(sys.argv) )
@@ -17,15 +17,23 @@
 ###############################################################################
 
 from PyQt4 import QtCore
-import time
+import json
 import sys
-import os
 from process_pool import Pool
-import h5py as h5
+from h5pool import H5FilePool
+from framecache import Frame, FrameCache
+import lod
+from spatial import build_grid, bounds_grid
+from icestats import SequenceStats, POSITION
+from metadata import CacheMetadata, file_metadata
+from particleindex import ParticleIndex
+import convcache
+from profiler import TRACER, clock
 
 POINT_DATA = '/ATTRIBS/PointPosition___/Data'
 COLOR_DATA = '/ATTRIBS/Color___/Data'
 SIZE_DATA = '/ATTRIBS/Size/Data'
+ATTRIB_DATA = '/ATTRIBS/%s/Data'
 
 class ICECacheLoader(QtCore.QObject):
     """ Class for loading cache files. Files are loaded through processes managed by the Pool class. The data loaded
@@ -35,6 +43,8 @@ class ICECacheLoader(QtCore.QObject):
     # tuple: (reader, points, colors, sizes)
     #cacheLoaded = QtCore.pyqtSignal( int, tuple ) 
     cacheLoaded = QtCore.pyqtSignal( int, str ) 
+    # int: cache index, str: cache file appended by append_cache_files that failed to load
+    cacheFailed = QtCore.pyqtSignal( int, str )
     beginCacheLoading = QtCore.pyqtSignal()
     endCacheLoading = QtCore.pyqtSignal()
 
@@ -48,14 +58,42 @@ class ICECacheLoader(QtCore.QObject):
         self._pool = None
         self._state = self.STOP
         self._files = []
-        self._cache = {}
+        # loaded SIH5 files, opened on demand
+        self._cache = H5FilePool()
+        # decoded frames, the viewer draws from memory
+        self._frames = FrameCache()
+        # statistics of the loaded caches
+        self._stats = SequenceStats()
+        # CacheMetadata by cache index, sent by the workers with the load results
+        self._metadata = {}
+        # particle ID lookups across the loaded caches
+        self._ids = ParticleIndex( self._cache )
+        # attribute decoded with the frames for coloring, None for Color___
+        self._color_attribute = None
+        # task dispatch time per worker
+        self._task_start = {}
+        # appended files that failed to load by file name, loaded again with the same cache index
+        self._failed = {}
+        # .icecache files are converted to this folder, None for a .sih5 folder next to the files
+        self._conversion_folder = None
+        self._conversion_quota = 0
         
     def init_process_server( self ):
         self._state = self.STOP
         self._files = []
-        self._cache = {}
-        self._pool = Pool(self)
-        self._pool.init(self.parent().prefs.process_count, self._on_process_callback)
+        self._cache.clear()
+        self._cache.max_open = self.parent().prefs.max_open_files
+        self._frames.clear()
+        self._frames.budget = self.parent().prefs.frame_cache_size
+        self._conversion_folder = self.parent().prefs.conversion_cache_folder
+        self._conversion_quota = self.parent().prefs.conversion_cache_quota
+        self._stats.clear()
+        self._metadata.clear()
+        self._ids.clear()
+        if self._pool == None:
+            self._pool = Pool(self)
+        # workers from the previous load are kept alive
+        self._pool.init(self.parent().prefs.process_count, self._on_process_callback, LoaderTask.COMMAND)
 
     def cancel(self):
         self._state = self.STOP
@@ -65,24 +103,143 @@ class ICECacheLoader(QtCore.QObject):
         print "Operation was cancelled."
 
     def points( self, cache_index ):            
-        if cache_index in self._cache and self._cache[ cache_index ] != None and POINT_DATA in self._cache[ cache_index ]:
-            return self._cache[ cache_index ][ POINT_DATA ][:]
-        return []
+        frame = self.frame( cache_index )
+        if frame == None:
+            return []
+        return frame.points
 
     def colors( self, cache_index ):
-        if cache_index in self._cache and self._cache[ cache_index ] != None and COLOR_DATA in self._cache[ cache_index ]:
-            return self._cache[ cache_index ][ COLOR_DATA ][:]
-        return []
+        frame = self.frame( cache_index )
+        if frame == None:
+            return []
+        return frame.colors
             
     def sizes( self, cache_index ):
-        if cache_index in self._cache and self._cache[ cache_index ] != None and SIZE_DATA in self._cache[ cache_index ]:
-            return self._cache[ cache_index ][ SIZE_DATA ][:]
-        return []            
+        frame = self.frame( cache_index )
+        if frame == None:
+            return []
+        return frame.sizes
+
+    def frame( self, cache_index, culling=False ):
+        """
+        return the decoded frame of a cache, the data is read from the SIH5 file only if the frame is not in memory. Note: the particles are not in the file order.
+        The culling grid is built if culling is True, i.e. by the prefetch thread. Frames decoded on the GUI thread get a single cell grid until the prefetcher replaces them.
+        """
+        # a load started while decoding clears the frames, the frame of the previous files is dropped
+        generation = self._frames.generation
+        frame = self._frames.get( cache_index )
+        if frame != None and frame.attribute != self._color_attribute:
+            # decoded before the color attribute changed
+            frame = None
+        if frame != None and culling and frame.grid != None and frame.grid.coarse:
+            with TRACER.span( 'grid', 'cpu', cache=cache_index ):
+                (cell_order, grid) = build_grid( frame.points )
+                (points, colors, sizes, values) = lod.reorder( cell_order, frame.points, frame.colors, frame.sizes, frame.values )
+                frame = Frame( cache_index, points, colors, sizes, grid, values, frame.attribute )
+            self._frames.put( frame, generation )
+        if frame == None and cache_index in self._cache:
+            with TRACER.span( 'hdf5 read', 'io', cache=cache_index ):
+                points = self._read( cache_index, POINT_DATA )
+                colors = self._read( cache_index, COLOR_DATA )
+                sizes = self._read( cache_index, SIZE_DATA )
+                values = []
+                if self._color_attribute != None:
+                    values = self._read( cache_index, ATTRIB_DATA % self._color_attribute )
+
+            # least recently viewed files are the first evicted from the conversion cache
+            convcache.touch( self._conversion_folder, self._cache.filename( cache_index ) )
+
+            with TRACER.span( 'decode', 'cpu', cache=cache_index ):
+                # particles are shuffled, the viewer draws a prefix of the frame while interacting
+                order = lod.permutation( len(points) )
+                grid = None
+                if len(points) and culling:
+                    # then sorted by grid cell for culling, the shuffled order is kept within a cell
+                    (cell_order, grid) = build_grid( points[ order ] )
+                    order = order[ cell_order ]
+                elif len(points):
+                    grid = bounds_grid( points )
+                (points, colors, sizes, values) = lod.reorder( order, points, colors, sizes, values )
+                frame = Frame( cache_index, points, colors, sizes, grid, values, self._color_attribute )
+            self._frames.put( frame, generation )
+        return frame
+
+    @property
+    def frames( self ):
+        return self._frames
+
+    @property
+    def color_attribute( self ):
+        return self._color_attribute
+
+    @color_attribute.setter
+    def color_attribute( self, name ):
+        """ select the attribute decoded with the frames for coloring, the decoded frames are dropped """
+        if name != self._color_attribute:
+            self._color_attribute = name
+            self._frames.clear()
+
+    def color_attributes( self, cache_index ):
+        """ names of the attributes of a cache that can be used for coloring """
+        metadata = self.metadata( cache_index )
+        if metadata == None:
+            return []
+        names = []
+        for attrib in metadata.attributes:
+            data = attrib['Data']
+            if data == None:
+                continue
+            # scalars and vectors up to 4 components
+            shape = data['shape']
+            if data['kind'] in 'biuf' and (len(shape) == 1 or (len(shape) == 2 and shape[1] <= 4)):
+                names.append( attrib['name'] )
+        return sorted( names )
+
+    def metadata( self, cache_index ):
+        """ return the CacheMetadata of a cache or None, read from the file only if the worker didn't send it """
+        if not cache_index in self._metadata:
+            if not cache_index in self._cache:
+                return None
+            with self._cache.lock:
+                self._metadata[ cache_index ] = file_metadata( self._cache[ cache_index ] )
+        return self._metadata[ cache_index ]
+
+    def trajectory( self, particle_id, attribute=POSITION ):
+        """ return (cache indices, values) of attribute for a particle ID across the loaded caches, see ParticleIndex.trajectory """
+        return self._ids.trajectory( particle_id, attribute )
+
+    @property
+    def stats( self ):
+        """ SequenceStats of the loaded caches, empty for files exported without statistics """
+        return self._stats
+
+    def filename( self, cache_index ):
+        """ return the SIH5 file name of a cache """
+        return self._cache.filename( cache_index )
 
     def __getitem__( self, arg ):
-        """ return item cache by index """
+        """ return the open h5 file of a cache by index. Note: the file may get closed by the next access to another cache. """
         return self._cache[ arg ]
+
+    def _read( self, cache_index, path ):
+        data = self._cache.read( cache_index, path )
+        if data is None:
+            return []
+        return data
     
+    def _prune_conversions( self ):
+        """ keep the conversion cache under its quota, the loaded files are kept """
+        if self._conversion_folder == None:
+            return
+        keep = [ self._cache.filename( key ) for key in self._cache.keys() ]
+        try:
+            (count, size) = convcache.prune( self._conversion_folder, self._conversion_quota, keep )
+        except:
+            print 'Error pruning the conversion cache: %s' % sys.exc_info()[1]
+            return
+        if count:
+            print 'Conversion cache: %d files deleted, %0.1f MB freed' % (count, size / (1024.0*1024.0))
+
     def load_cache_files( self, files, start, end ):    
         """ Start the loading process. """         
         # initialize the process server first
@@ -91,6 +248,9 @@ class ICECacheLoader(QtCore.QObject):
         self._files = files
         self.startindex = start
         self.endindex = end        
+        # caches after _load_end are appended
+        self._load_end = end
+        self._failed = {}
 
         # file_block can be used to assing multiple files per process. 
         # note: Normally this would make poor load-balancing and affect performance load
@@ -101,7 +261,9 @@ class ICECacheLoader(QtCore.QObject):
         # note: 1 file / task gives very good performance in general.
         self._state = self.STOP
         file_count = len(self._files)
-        self._files_processed = 0
+        # the job is done once every task submitted, appends and retries included, is finished
+        self._tasks_submitted = len(self.indexset)
+        self._tasks_finished = 0
         index = self.startindex
         for i in self.indexset:
             file_list = []
@@ -111,13 +273,34 @@ class ICECacheLoader(QtCore.QObject):
                     file_list.append( self._files[i+j] )
                     file_index.append( index )
                     index += 1                    
-            self._pool.submit( LoaderTask( [ file_list, file_index ] ) )
+            self._pool.submit( LoaderTask( [ file_list, file_index, self._conversion_folder ] ) )
+
+    def append_cache_files( self, files ):
+        """
+        Load files after the loaded caches, only the new files are sent to the workers. The files that
+        failed to load before keep their cache index. Returns the indices of the new caches.
+        """
+        if self._pool == None or files == []:
+            return []
+        indices = []
+        for f in files:
+            index = self._failed.pop( f, None )
+            if index == None:
+                self._files = self._files + [ f ]
+                self.endindex += 1
+                index = self.endindex
+                indices.append( index )
+            self._tasks_submitted += 1
+            self._pool.submit( LoaderTask( [ [f], [index], self._conversion_folder ] ) )
+        return indices
         
     def _on_process_callback( self, sender, notif, arg ):
         """ Called when an event occurs from a process """        
         if notif == Pool.STARTED:
+            # a task was sent to the worker
+            self._task_start[ sender ] = clock()
             if self._state == self.STOP:
-                self.t1 = time.time()
+                self.t1 = clock()
                 self._state = self.RUN
                 self.beginCacheLoading.emit()
             return 
@@ -133,11 +316,27 @@ class ICECacheLoader(QtCore.QObject):
             if self._state == self.ERROR:
                 return 
             # Process has finished loading the file
-            s_data = bytes.decode( bytes( sender.readAllStandardOutput() ) )
             try:
-                data = eval(s_data) 
+                data = json.loads(arg)
+                if data[1] == None:
+                    self._on_load_failed( data[0], data[2] )
+                    return
+                # time from the task dispatch to the worker answer, i.e. conversion and IPC
+                now = clock()
+                start = self._task_start.get( sender, now )
+                TRACER.record( 'load task', start, now - start, 'ipc', { 'cache' : data[0] } )
+                self._task_start[ sender ] = now
+
                 # save cache
-                self._cache[ data[0] ] = h5.File( data[1], 'r' )
+                self._cache.add( data[0], data[1] )
+                self._frames.remove( data[0] )
+                self._metadata.pop( data[0], None )
+                self._ids.remove( data[0] )
+                metadata = CacheMetadata.from_json( data[2] )
+                if metadata != None:
+                    self._metadata[ data[0] ] = metadata
+                self._stats.remove( data[0] )
+                self._stats.add( data[0], self.metadata( data[0] ).stats )
                 
                 # notify clients                
                 self.cacheLoaded.emit( data[0], data[1] )
@@ -149,8 +348,7 @@ class ICECacheLoader(QtCore.QObject):
                          
         elif notif == Pool.OUTPUT_ERROR_MSG:
             self._state = self.ERROR
-            s_out = bytes.decode( bytes( sender.readAllStandardError() ) )
-            print 'process error output: %s - %s\nRetry your operation.' % ((repr(sender)),s_out)
+            print 'process error output: %s - %s\nRetry your operation.' % ((repr(sender)),arg)
             
         elif notif == Pool.FINISHED:
             if self._state == self.STOP:
@@ -162,24 +360,40 @@ class ICECacheLoader(QtCore.QObject):
                 return 
                         
             #print 'process finished: %s\n' % (repr(sender))
-            self._files_processed += self.file_block
-            if self._files_processed >= len(self._files):
-                self.t2 = time.time()
+            self._tasks_finished += 1
+            if self._tasks_finished >= self._tasks_submitted:
+                self.t2 = clock()
+                TRACER.record( 'load job', self.t1, self.t2 - self.t1, 'io', { 'files' : len(self._files) } )
                 self._state = self.STOP
+                self._prune_conversions()
                 self.endCacheLoading.emit()
                 print 'Processes %d Loading time %0.3f s' % (self._pool.process_count,self.t2-self.t1)
             return 
+
+    def _on_load_failed( self, cache_index, error ):
+        """ a file failed to load, an appended file is reported and the other files keep loading """
+        print 'Error loading cache %s: %s' % (cache_index, error)
+        if cache_index == None or cache_index <= self._load_end:
+            self._state = self.ERROR
+            return
+        filename = self._files[ cache_index - self.startindex ]
+        self._failed[ filename ] = cache_index
+        self.cacheFailed.emit( cache_index, filename )
         
 class LoaderTask(object):
     """ Task for loading cache files from a process """
+    # worker process command
+    COMMAND = 'python.exe loader_process.py'
+
     def __init__(self,args):        
         """ 
         Process arguments:
         arg0: list of files
         arg1: list of file indices
+        arg2: conversion cache folder or None
         """ 
-        self._cmd = 'python.exe loader_process.py "%s" "%s"' % (repr(args[0]),repr(args[1]))
+        self._msg = repr( [args[0], args[1], args[2]] )
 
     def __call__(self):
-        """ Returns the process command """
-        return self._cmd
+        """ Returns the task message sent to the worker process """
+        return self._msg
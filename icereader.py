@@ -21,6 +21,8 @@ import os
 import gzip
 from consts import CONSTS
 from icereader_util import *
+from process_worker import TaskCancelled, check_cancel
+import convcache
 
 try:
     import numpy 
@@ -28,12 +30,6 @@ except:
     print "ERROR: numpy not installed properly."
     sys.exit()
 
-try:
-    import h5py as h5
-except:
-    print "ERROR: h5py not installed properly."
-    h5 = None
-
 """
 import gc
  gc.set_debug(gc.DEBUG_LEAK)
@@ -104,7 +100,8 @@ class ICEReader(object):
         return None
     
     def export(self, destination_folder, fmt=CONSTS.TEXT_FMT, force = True ):                
-        if fmt==CONSTS.SIH5_FMT and h5 == None:
+        if fmt==CONSTS.SIH5_FMT and import_h5py() == None:
+            print "ERROR: h5py not installed properly."
             return
 
         if fmt!=CONSTS.SIH5_FMT and fmt!=CONSTS.TEXT_FMT:
@@ -114,12 +111,15 @@ class ICEReader(object):
         self._export_filename = get_export_file_path( destination_folder, self._filename,  EXT[ fmt ] )        
 
         if force == False and os.path.isfile( self._export_filename ):
-            # reuse existing file
-            return
+            # reuse existing file, unless the SIH5 file doesn't match the cache file anymore
+            if fmt != CONSTS.SIH5_FMT or not convcache.is_stale( self._export_filename, self._filename ):
+                return
         
         try:
             # load the requested attributes
             self.load( )
+        except TaskCancelled:
+            raise
         except:
             raise Exception('Error loading data: %s' % self._export_filename )
             return
@@ -129,6 +129,13 @@ class ICEReader(object):
                 to_ascii( self._export_filename, self )
             elif fmt == CONSTS.SIH5_FMT:
                 to_sih5( self._export_filename, self )
+        except TaskCancelled:
+            # a partial file would be reused by the next export
+            try:
+                os.remove( self._export_filename )
+            except OSError:
+                pass
+            raise
         except:
             pass
             #raise Exception('Error exporting file: %s' % self.filename )
@@ -182,6 +189,7 @@ class ICEReader(object):
             return None
                 
         for i in range(self._header.attribute_count):    
+            check_cancel()
             attrib = self._attributes[i]            
             try:
                 accessor = dataAccessorPool.accessor( attrib.datatype, attrib.structtype )
@@ -238,6 +246,7 @@ class ICEReader(object):
                 chunks = self.handler.chunks( elemCount )
                 index = 0
                 for chunk in chunks:                    
+                    check_cancel()
                     # Note: the constant flag value is stored per chunk, which is a shame as the const flag will always be the same.
                     # Therefore we need to read 4 extra bytes at every chunk
                     attrib.isconstant = bool(self.handler.read_int())
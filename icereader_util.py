@@ -23,8 +23,11 @@ import struct
 import numpy as np
 from cStringIO import StringIO 
 from consts import CONSTS
-import re
-import h5py as h5
+import icestats
+import sequences
+import convcache
+import particleindex
+from process_worker import check_cancel
 
 __all__ = [
     'ICECacheDataReadError',
@@ -43,6 +46,7 @@ __all__ = [
     'to_ascii',
     'attribs_to_str',
     'traceit',
+    'import_h5py',
     'EXT'
     ]
 
@@ -52,51 +56,35 @@ EXT.append( '.sih5' )
 EXT.append( '.icecache' )
 
 def get_files_from_cache_folder( dir ):
-    """ Get all cache files from dir and sort them by frame number """                
+    """ Get all cache files from dir and sort them by frame number, see sequences.list_sequences for folders holding several sequences """
     files = []
-    # grab the files
-    for dirname, dirnames, filenames in os.walk(dir):
-        if dirname == dir:
-            filenames = filter( lambda x: x.endswith( '.icecache' ) or x.endswith( '.sih5' ) or x.endswith( '.hdf5' ), filenames )        
-            for filename in filenames:
-                files.append( os.path.join(dirname, filename) ) 
-    
+    for seq in sequences.list_sequences( dir ):
+        files.extend( seq.files )
     return get_files( files )
     
 def get_files( files ):
-    """ sort function by the cache frame number embedded in the file name """
-    def cmp_by_num (x,y):
-        def get_nums(str): 
-            ext = os.path.splitext( x )[1]            
-            idx = -1
-            if ext == '.sih5':
-                idx = -2
-            return float(re.findall(r'\d+',str)[idx])
-        
-        nx = get_nums(x)
-        ny = get_nums(y)
-        if nx < ny:
-            return -1
-        elif nx > ny:
-            return 1
-        return 0
-    
-    files.sort( cmp_by_num )
- 
+    """ 
+    Sort files by the cache frame number embedded in the file name. Returns (files, start, end) where
+    start is the first frame number, the files get the cache indices start..end. Returns () if files is empty.
+    """
+    files = sequences.sort_files( files )
     if files == []:
         # no files to process
         return ()
-        
-    # extract start and end cache number    
-    first = os.path.splitext( files[0] )[0]
-    last = os.path.splitext( files[-1] )[0]
-    start = int(re.findall(r'\d+',first)[-1])        
-    end = int(re.findall(r'\d+',last)[-1])
-    
-    if end > len(files):
-        end = (start + len(files)) -1 
 
-    return (files,start,end)
+    parsed = sequences.parse_name( files[0] )
+    start = 0
+    if parsed != None:
+        start = parsed[1]
+    return (files, start, start + len(files) - 1)
+
+def import_h5py():
+    """ return the h5py module or None if it is not installed. h5py is only imported when SIH5 files are used, decoding doesn't need it. """
+    try:
+        import h5py
+    except ImportError:
+        return None
+    return h5py
 
 def get_export_file_path( dst, fname, ext='.txt' ):
     """ create export file path """
@@ -115,6 +103,10 @@ def to_sih5( target, src ):
     if target == None:
         return
 
+    h5 = import_h5py()
+    if h5 == None:
+        raise Exception('Error exporting to SIH5: h5py not installed properly')
+
     h5_obj = None
     ish5 = isinstance(target, h5.highlevel.File)
     if ish5:
@@ -125,7 +117,16 @@ def to_sih5( target, src ):
         except:
             raise Exception('Error exporting to SIH5: invalid arguments')
             return
-    
+
+    try:
+        _write_sih5( h5_obj, src )
+    finally:
+        if not ish5:
+            # close file only if we opened the file
+            h5_obj.close()
+
+def _write_sih5( h5_obj, src ):
+    """ write the header and the attributes of src to an open sih5 file """
     # create the header group
     hg = h5_obj.create_group('HEADER')
         
@@ -139,9 +140,15 @@ def to_sih5( target, src ):
     hg.attrs['blob_count'] = src.header['blob_count']
     hg.attrs['attribute_count'] = src.header['attribute_count']
     hg.attrs['substeps_count'] = src.header['substeps_count']
+
+    # source file signature, conversions are reused only while they match their source
+    source = getattr( src, 'filename', None )
+    if source != None and os.path.isfile( source ):
+        convcache.write_source( hg, source )
             
     attrib_group = h5_obj.create_group('ATTRIBS')
     for a in src.attributes:
+        check_cancel()
         g = attrib_group.create_group(a['name'])
         g.attrs['name'] = a['name']
         g.attrs['datatype'] = a['datatype']
@@ -159,9 +166,16 @@ def to_sih5( target, src ):
         if len(data_array):
             g.create_dataset('Data', data = data_array, compression='gzip', compression_opts=9, shuffle=True )
 
-    if not ish5:
-        # close file only if we opened the file
-        h5_obj.close()
+            # statistics for the viewer, computed while the data is in memory
+            stats = icestats.attribute_stats( data_array )
+            if stats != None:
+                icestats.write_stats( g, stats )
+                if a['name'] == icestats.POSITION:
+                    icestats.write_bbox( hg, stats )
+
+            if a['name'] == particleindex.ID and len(data_array) > 1:
+                # particle lookups by ID read a block of the index instead of the whole attribute
+                particleindex.write_index( h5_obj, data_array )
     
 def to_ascii( target, src ):    
     """ 
@@ -175,6 +189,7 @@ def to_ascii( target, src ):
     f.write( '\n' )
                 
     for a in src.attributes:
+        check_cancel()
         # description
         f.write( str(a) )
         f.flush()
@@ -690,7 +705,8 @@ class ICECacheFileHandler( object ):
     def read( self, format, size ):
         file = self.__fileptr__()
         try:
-            val = struct.unpack( format, file.read( size ) )
+            # ICE caches are little-endian with 4 byte longs, don't rely on the native struct sizes
+            val = struct.unpack( '<' + format, file.read( size ) )
             return val
         except:
             report_error( 'unpack %s %d' % (format,size), sys.exc_info() )
@@ -714,10 +730,12 @@ class ICECacheFileHandler( object ):
     def read_name( self ):
         length = self.read_long( )
         
+        # names are padded to 4 bytes
+        padded = length
         if (length % 4) > 0 :
-            length += 4- (length % 4)
+            padded += 4- (length % 4)
 
-        return self.read_bytes( length )
+        return self.read_bytes( padded )[ :length ]
         
     def read_int(self):
         (value,) = self.read( 'i', 4 )
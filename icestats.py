@@ -0,0 +1,207 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+"""
+Per-frame statistics computed when a cache gets decoded. The statistics are stored as attributes of
+the SIH5 file and read with the file metadata, the browser, the camera framing and the color ranges
+don't have to scan the particle data.
+"""
+
+import warnings
+import numpy
+
+POSITION = 'PointPosition___'
+
+# SIH5 attribute names
+STATS_KEYS = ('count', 'min', 'max', 'mean', 'nan_count')
+BBOX_MIN = 'bbox_min'
+BBOX_MAX = 'bbox_max'
+
+def attribute_stats( data ):
+    """
+    Return a dict with the count, min, max, mean and nan_count per component of a numeric attribute
+    array, or None if the array is empty or not numeric. NaN values are left out of min/max/mean.
+    """
+    data = numpy.asarray( data )
+    if len(data) == 0 or data.dtype.kind not in 'biuf':
+        return None
+    values = data.astype( 'float64' )
+    with warnings.catch_warnings():
+        # all-NaN components give NaN
+        warnings.simplefilter( 'ignore', RuntimeWarning )
+        return {
+            'count' : len(values),
+            'min' : numpy.nanmin( values, axis=0 ),
+            'max' : numpy.nanmax( values, axis=0 ),
+            'mean' : numpy.nanmean( values, axis=0 ),
+            'nan_count' : numpy.isnan( values ).sum( axis=0 )
+            }
+
+def write_stats( group, stats ):
+    """ store stats in the attributes of a SIH5 group """
+    for key in STATS_KEYS:
+        group.attrs[ 'stats_' + key ] = stats[ key ]
+
+def read_stats( group ):
+    """ return the stats stored in a SIH5 group or None """
+    if not 'stats_count' in group.attrs:
+        return None
+    return dict( [ (key, group.attrs[ 'stats_' + key ]) for key in STATS_KEYS ] )
+
+def write_bbox( group, stats ):
+    """ store the bounding box of the position stats in the attributes of a SIH5 group """
+    group.attrs[ BBOX_MIN ] = stats['min']
+    group.attrs[ BBOX_MAX ] = stats['max']
+
+def read_file_stats( h5file ):
+    """
+    Return the statistics of an open SIH5 file as a dict:
+        'bbox': (min, max) of the positions or None
+        'attributes': {attribute name: stats}
+    Files exported before the statistics were added return None.
+    """
+    header = h5file[ 'HEADER' ]
+    bbox = None
+    if BBOX_MIN in header.attrs:
+        bbox = (header.attrs[ BBOX_MIN ], header.attrs[ BBOX_MAX ])
+    attributes = {}
+    for name, group in h5file[ 'ATTRIBS' ].items():
+        stats = read_stats( group )
+        if stats != None:
+            attributes[ name ] = stats
+    if bbox == None and attributes == {}:
+        return None
+    return { 'bbox' : bbox, 'attributes' : attributes }
+
+def stats_to_json( stats ):
+    """ file stats as returned by read_file_stats to JSON compatible values """
+    return _to_json( stats )
+
+def stats_from_json( obj ):
+    """ file stats saved with stats_to_json, the values are converted back to numpy arrays """
+    if obj == None:
+        return None
+    bbox = obj['bbox']
+    if bbox != None:
+        bbox = (numpy.array( bbox[0], numpy.float64 ), numpy.array( bbox[1], numpy.float64 ))
+    attributes = dict( [ (n, dict( [ (k, numpy.array( v, numpy.float64 )) for k,v in s.items() ] )) for n,s in obj['attributes'].items() ] )
+    return { 'bbox' : bbox, 'attributes' : attributes }
+
+def union_bbox( boxes ):
+    """ bounding box of a list of (min, max) boxes, None entries are skipped """
+    boxes = [ b for b in boxes if b != None ]
+    if boxes == []:
+        return None
+    return ( numpy.min( [ b[0] for b in boxes ], axis=0 ), numpy.max( [ b[1] for b in boxes ], axis=0 ) )
+
+def union_stats( stats ):
+    """ combine the stats of an attribute over several frames """
+    stats = [ s for s in stats if s != None ]
+    if stats == []:
+        return None
+    counts = numpy.array( [ s['count'] for s in stats ], numpy.float64 )
+    with warnings.catch_warnings():
+        warnings.simplefilter( 'ignore', RuntimeWarning )
+        means = numpy.array( [ s['mean'] for s in stats ], numpy.float64 )
+        weights = counts.reshape( (-1,) + (1,) * (means.ndim-1) )
+        return {
+            'count' : int( counts.sum() ),
+            'min' : numpy.nanmin( [ s['min'] for s in stats ], axis=0 ),
+            'max' : numpy.nanmax( [ s['max'] for s in stats ], axis=0 ),
+            'mean' : numpy.nansum( means * weights, axis=0 ) / max( counts.sum(), 1 ),
+            'nan_count' : numpy.sum( [ s['nan_count'] for s in stats ], axis=0 )
+            }
+
+class SequenceStats(object):
+    """ Statistics of the frames of a sequence indexed by cache index, with their union """
+    def __init__( self ):
+        self.frames = {}
+        # sequence bounding box and attribute stats, computed on demand
+        self._bbox = None
+        self._attributes = {}
+
+    def __contains__( self, index ):
+        return index in self.frames
+
+    def __getitem__( self, index ):
+        return self.frames[ index ]
+
+    def __len__( self ):
+        return len(self.frames)
+
+    def add( self, index, stats ):
+        if stats != None:
+            self.frames[ index ] = stats
+            self._bbox = None
+            self._attributes = {}
+
+    def remove( self, index ):
+        if self.frames.pop( index, None ) != None:
+            self._bbox = None
+            self._attributes = {}
+
+    def clear( self ):
+        self.frames.clear()
+        self._bbox = None
+        self._attributes = {}
+
+    def bbox( self, index=None ):
+        """ bounding box of a frame, or of the whole sequence if index is None """
+        if index != None:
+            if not index in self.frames:
+                return None
+            return self.frames[ index ]['bbox']
+        if self._bbox == None:
+            self._bbox = union_bbox( [ f['bbox'] for f in self.frames.values() ] )
+        return self._bbox
+
+    def attribute( self, name, index=None ):
+        """ stats of an attribute for a frame, or over the whole sequence if index is None """
+        if index != None:
+            if not index in self.frames:
+                return None
+            return self.frames[ index ]['attributes'].get( name )
+        if not name in self._attributes:
+            self._attributes[ name ] = union_stats( [ f['attributes'].get( name ) for f in self.frames.values() ] )
+        return self._attributes[ name ]
+
+def value_range( stats ):
+    """ (min, max) of an attribute from its stats, vectors get an upper bound of their magnitude """
+    lo = numpy.ravel( stats['min'] )
+    hi = numpy.ravel( stats['max'] )
+    if len(lo) == 1:
+        return (float( lo[0] ), float( hi[0] ))
+    return (0.0, float( numpy.sqrt( ( numpy.maximum( abs(lo), abs(hi) )**2 ).sum() ) ))
+
+def format_values( values ):
+    """ compact string of a stats value, e.g. '0.5' or '1, 2, 3' for a vector """
+    return ', '.join( [ '%g' % v for v in numpy.ravel( values ) ] )
+
+def _to_json( obj ):
+    """ numpy values to JSON compatible values, NaN is saved as null """
+    if isinstance( obj, dict ):
+        return dict( [ (k, _to_json( v )) for k,v in obj.items() ] )
+    if isinstance( obj, (list, tuple) ):
+        return [ _to_json( v ) for v in obj ]
+    if isinstance( obj, numpy.ndarray ):
+        return _to_json( obj.tolist() )
+    if isinstance( obj, numpy.generic ):
+        obj = obj.item()
+    if isinstance( obj, float ) and obj != obj:
+        return None
+    return obj
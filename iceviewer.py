@@ -31,7 +31,6 @@ try:
     # to report data array copy as errors
     OpenGL.ERROR_ON_COPY = True
 
-    from OpenGL.GLUT import *
     from OpenGL.GL import *
     from OpenGL.GLU import *
 except:
@@ -48,9 +47,18 @@ from camera import Camera
 import icereader as icer 
 import h5reader as h5r 
 from basics import Vec3
-from icereader_util import traceit, get_files_from_cache_folder, get_files
+from icereader_util import traceit, get_files
+from sequences import list_sequences
 from view_tools import ToolManager
 from iceloader import ICECacheLoader
+from prefetch import Prefetcher
+from folderwatch import FolderWatcher
+from glbuffers import VBOCache, value_components
+from shaders import ParticleShader
+from lod import LODController
+from spatial import frustum_planes
+from icestats import value_range
+from profiler import TRACER, clock
 
 import time
 
@@ -61,6 +69,10 @@ class ICEViewer(QtOpenGL.QGLWidget):
     # arg: cache index, file reader object
     #cacheLoaded = QtCore.pyqtSignal(int, object) 
     cacheLoaded = QtCore.pyqtSignal(int, str) 
+    # arg: cache index, file name of a cache appended by the folder watch
+    cacheAppended = QtCore.pyqtSignal(int, str)
+    # args: previous last cache, new last cache
+    cacheRangeExtended = QtCore.pyqtSignal(int,int)
     # args: number of files, start cache, end cache
     beginCacheLoading = QtCore.pyqtSignal(int,int,int)
     endCacheLoading = QtCore.pyqtSignal(int,int,int)
@@ -89,6 +101,15 @@ class ICEViewer(QtOpenGL.QGLWidget):
         self._play_state = False
         self._loop_state = False
         
+        # last cache of the loaded range, the caches after it are being appended
+        self._last_cache = 0
+        # appended caches loaded after the loaded range
+        self._appended = set()
+        self._full_load = False
+        # loaded sequence and its folder watch
+        self._sequence = None
+        self._watcher = None
+
         self._statusbar = self.parentWidget().statusBar()
         self._right_msg = parent.right_msg
         self._cache_loading = False
@@ -101,6 +122,21 @@ class ICEViewer(QtOpenGL.QGLWidget):
         self._cache_loader.beginCacheLoading.connect( self.on_begin_cacheloading )
         self._cache_loader.cacheLoaded.connect( self.on_cache_loaded )                
         self._cache_loader.endCacheLoading.connect( self.on_end_cacheloading )
+        self._cache_loader.cacheFailed.connect( self.on_cache_failed )
+
+        # decode the frames ahead of the playback cursor
+        self._play_direction = 1
+        self._prefetcher = Prefetcher( self._cache_loader )
+        self._prefetcher.start()
+
+        # vertex buffers of the frames drawn
+        self._buffers = VBOCache()
+        self._shader = ParticleShader()
+        # level of detail while interacting
+        self._lod = LODController()
+        # timings overlay
+        self._show_timings = False
+        self._timings_font = QtGui.QFont( 'Courier', 9 )
 
         self.setAcceptDrops( True )                    
         self.setFocusPolicy( QtCore.Qt.StrongFocus )    
@@ -109,6 +145,7 @@ class ICEViewer(QtOpenGL.QGLWidget):
 
     def __del__(self):
         self._stop_playback_timer( )
+        self._prefetcher.stop()
 
     @property
     def cache(self):
@@ -118,6 +155,10 @@ class ICEViewer(QtOpenGL.QGLWidget):
     def camera(self):
         return self._camera
 
+    @property
+    def current_cache(self):
+        return self._current_cache
+
     @property
     def right_msg(self):
         return self._right_msg
@@ -125,6 +166,7 @@ class ICEViewer(QtOpenGL.QGLWidget):
     def stop_loading(self):
         """ cancel current loading job """
         self.__stop_playback__()
+        self.watch_folder( False )
         self._cache_loader.cancel()
         
     def load_files( self, files ):
@@ -132,10 +174,41 @@ class ICEViewer(QtOpenGL.QGLWidget):
         (files, startcache, endcache) = get_files( files )
         self._load_icecache_files( files, startcache, endcache )        
                     
-    def load_files_from_folder(self, dir ):
-        """ Load all cache files located in dir """        
-        (files,startcache,endcache) = get_files_from_cache_folder( dir )
-        self._load_icecache_files( files, startcache, endcache )
+    def load_files_from_folder(self, dir, watch=False ):
+        """ Load the largest cache sequence located in dir, the new files written to dir are loaded if watch is True """        
+        sequences = list_sequences( dir )
+        if sequences == []:
+            self._statusbar.showMessage( 'Error - No cache files in %s' % dir )
+            return
+        self.load_sequence( sequences[0], watch )
+
+    def load_sequence( self, sequence, watch=False ):
+        """ Load the files of a sequences.Sequence """
+        self._load_icecache_files( sequence.files, sequence.start, sequence.start + len(sequence) - 1 )
+        self._sequence = sequence
+        if watch:
+            self.watch_folder( True )
+
+    @property
+    def is_watching(self):
+        return self._watcher != None
+
+    def watch_folder( self, bFlag ):
+        """ Start or stop watching the folder of the loaded sequence, new frames are appended as they get written """
+        if bFlag == False:
+            if self._watcher != None:
+                self._watcher.stop()
+                self._watcher.deleteLater()
+                self._watcher = None
+            return
+
+        if self._watcher != None or self._sequence == None:
+            return
+        self._watcher = FolderWatcher( self._sequence, parent=self )
+        self._watcher.filesReady.connect( self._append_icecache_files )
+        self._watcher.filesIgnored.connect( self._on_files_ignored )
+        self._watcher.start()
+        self._statusbar.showMessage( 'Watching %s' % self._sequence.folder )
 
     def perspective_view(self): 
         """ Set the OGL view as a perspective view. """
@@ -167,6 +240,36 @@ class ICEViewer(QtOpenGL.QGLWidget):
         self._camera.set(Vec3(-40,0,0), Vec3(0,0,0), Vec3(0,1,0))            
         self._updateGL()
 
+    def show_timings( self, bFlag ):
+        """ Show or hide the frame timings overlay. """
+        self._show_timings = bFlag
+        self._updateGL()
+
+    def set_color_attribute( self, name ):
+        """ Color the particles by mapping an attribute to a colormap, None to use the particle colors. """
+        self._cache_loader.color_attribute = name
+        self._buffers.clear()
+        self._update_prefetcher()
+        self._updateGL()
+
+    def frame_current(self):
+        """ Fit the view to the bounding box of the current cache. """
+        bbox = self._cache_loader.stats.bbox( self._current_cache )
+        if bbox == None:
+            # file exported without statistics, use the grid of the decoded frame
+            frame = self._cache_loader.frame( self._current_cache )
+            if frame != None and len(frame):
+                bbox = (frame.grid.mins.min( axis=0 ), frame.grid.maxs.max( axis=0 ))
+        self._frame_bbox( bbox )
+
+    def frame_sequence(self):
+        """ Fit the view to the bounding box of all caches. """
+        bbox = self._cache_loader.stats.bbox()
+        if bbox == None:
+            self.frame_current()
+            return
+        self._frame_bbox( bbox )
+
     def orbit_tool(self):
         """ Activate the orbit tool """
         self._toolmgr.activate_tool( self._toolmgr[ 'ORBIT' ] ) 
@@ -182,15 +285,34 @@ class ICEViewer(QtOpenGL.QGLWidget):
     # internals
     def _load_icecache_files( self, files, startcache, endcache ):
         """ Start worker thread to load icecache files """
+        self.watch_folder( False )
+        self._sequence = None
         self._cache_count = len(files)
         self._start_cache = startcache
         self._end_cache = endcache
+        self._last_cache = endcache
+        self._appended.clear()
+        self._full_load = True
         self._current_cache = startcache
+        self._prefetcher.pause()
+        self._prefetcher.count = self.parentWidget().prefs.read_ahead
+        self._buffers.clear()
+        self._buffers.budget = self.parentWidget().prefs.gpu_buffers_size
         
         # start loading the file caches
         self._load_start_time = time.clock()
         self._cache_loader.load_cache_files( files, startcache, endcache )        
 
+    def _append_icecache_files( self, files ):
+        """ Load the new files of the watched folder after the loaded caches """
+        indices = self._cache_loader.append_cache_files( files )
+        self._cache_count += len(indices)
+        self._statusbar.showMessage( 'Loading %d new cache file(s) from %s' % (len(files), self._sequence.folder) )
+
+    def _on_files_ignored( self, files ):
+        """ New files of the watched folder written before the last loaded frame """
+        self._statusbar.showMessage( 'Ignoring %d file(s) written before the last loaded frame: %s' % (len(files), ', '.join( [ os.path.basename( f ) for f in files ] )) )
+
     def __start_playback__(self):
         """ Enables a timer to start the playback. The OGL view gets updated when the timer is triggered. """            
         if self._current_cache == self._end_cache:
@@ -217,17 +339,24 @@ class ICEViewer(QtOpenGL.QGLWidget):
     # All signal slots (i.e. callbacks)
     def on_cache_change( self, cache ):
         """ Called when the playback cursor changes """
+        if cache < self._current_cache:
+            self._play_direction = -1
+        elif cache > self._current_cache:
+            self._play_direction = 1
         self._current_cache = cache
+        self._update_prefetcher()
         self._updateGL()
 
     def on_start_cache_change( self, cache ):
         """ Called when the playback start cache edit box has changed """
         self._start_cache = cache
+        self._update_prefetcher()
         self._updateGL()
 
     def on_end_cache_change( self, cache ):
         """ Called when the playback end cache edit box has changed """
         self._end_cache = cache
+        self._update_prefetcher()
         self._updateGL()
 
     def on_play( self ):
@@ -236,6 +365,7 @@ class ICEViewer(QtOpenGL.QGLWidget):
         if self._current_cache >= self._end_cache:            
             # reset to start cache
             self._current_cache = self._start_cache
+        self._play_direction = 1
         self.beginPlayback.emit( self._current_cache )
         self.__start_playback__()
 
@@ -247,24 +377,58 @@ class ICEViewer(QtOpenGL.QGLWidget):
     def on_loop( self, bFlag ):
         """ Called when the playback loop button is pressed or depressed. """
         self._loop_state = bFlag
+        self._update_prefetcher()
 
     def on_begin_cacheloading(self):
         """ Called by the ICECacheLoader object at the beginning of the file loading process """
+        if self._full_load == False:
+            # appended files, the clients keep the loaded caches
+            return
+        self._full_load = False
         self._cache_loading = True
         self.beginCacheLoading.emit( self._cache_count, self._start_cache, self._end_cache )
 
     def on_end_cacheloading(self):
         """ Called by the ICECacheLoader object at the end of the file loading process """
-        self.endCacheLoading.emit( self._cache_count, self._start_cache, self._end_cache )        
-        self._cache_loading = False
+        if self._cache_loading:
+            self.endCacheLoading.emit( self._cache_count, self._start_cache, self._end_cache )        
+            self._cache_loading = False
+
+        # the range grows up to the first appended cache not loaded yet
+        last = self._last_cache
+        while last + 1 in self._appended:
+            self._appended.remove( last + 1 )
+            last += 1
+        if last > self._last_cache:
+            # the playback range follows the appended caches if it ended on the last cache
+            previous = self._last_cache
+            self._last_cache = last
+            if self._end_cache == previous:
+                self._end_cache = self._last_cache
+            self.cacheRangeExtended.emit( previous, self._last_cache )
+        self._update_prefetcher()
 
     def on_cache_loaded(self, cacheindex, filename ):
         """ Called by the ICECacheLoader object for every file loaded """
+        # the cache data might have changed
+        self._buffers.remove( cacheindex )
+        if cacheindex > self._last_cache:
+            # appended by the folder watch, the playback cursor doesn't move
+            self._appended.add( cacheindex )
+            self.cacheAppended.emit( cacheindex, filename )
+            return
         self._current_cache = cacheindex
         # re-emit to viewer clients
         self.cacheLoaded.emit( cacheindex, filename )        
         self._updateGL()
 
+    def on_cache_failed(self, cacheindex, filename ):
+        """ Called by the ICECacheLoader object when an appended file failed to load, e.g. not completely written """
+        if self._watcher != None:
+            # loaded again once the writer is done with it
+            self._watcher.retry( str(filename) )
+        self._statusbar.showMessage( 'Cache %d not loaded yet: %s' % (cacheindex, filename) )
+
     # widget callbacks
     def dragEnterEvent(self, e):
         """ Accept DnD event for files only """
@@ -283,9 +447,10 @@ class ICEViewer(QtOpenGL.QGLWidget):
             if os.path.isfile( f ):                
                 files.append( f )            
             elif os.path.isdir( f ):
-                t = get_files_from_cache_folder( f )
-                if t != ():
-                    (files,st,end) = t
+                # largest sequence of the folder
+                sequences = list_sequences( f )
+                if sequences != []:
+                    files = sequences[0].files
                 break
             else: 
                 self._statusbar.showMessage( 'Error - Invalid file: %s\n' % f )
@@ -322,6 +487,14 @@ class ICEViewer(QtOpenGL.QGLWidget):
             self.right_view()
             return
             
+        if key == QtCore.Qt.Key_F6:
+            self.frame_current()
+            return
+            
+        if key == QtCore.Qt.Key_F7:
+            self.frame_sequence()
+            return
+            
         if key == QtCore.Qt.Key_Up:
             self._camera.move( 0.02 )
             self._updateGL()
@@ -356,7 +529,11 @@ class ICEViewer(QtOpenGL.QGLWidget):
 
     def mouseReleaseEvent(self, event):        
         """ Handler called when a mouse button is up. We just delegate to the tool mananger for handling the current interactive tool. """
+        interacting = self._toolmgr.interacting
         self._toolmgr.mouseReleaseEvent( event )
+        if interacting:
+            # redraw all points
+            self._updateGL()
 
     def mouseMoveEvent(self, event):        
         """ Handler called when a mouse is moving. We just delegate to the tool mananger for handling the current interactive tool. If the tool is managed then the OGL view is updated."""        
@@ -370,6 +547,7 @@ class ICEViewer(QtOpenGL.QGLWidget):
         glDepthFunc(GL_LESS)
         glEnable(GL_DEPTH_TEST)
         glShadeModel(GL_SMOOTH)	
+        self._shader.init()
         
     def minimumSizeHint(self):
         """ OGL view minimum size """
@@ -393,6 +571,7 @@ class ICEViewer(QtOpenGL.QGLWidget):
 
     def paintGL(self):
         """ This function draws the particles and the view grid. Signals are sent before and after a frame is drawn. """
+        paint_start = clock()
         
         # Clear the view  and the depth buffer    
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
@@ -436,35 +615,75 @@ class ICEViewer(QtOpenGL.QGLWidget):
 
         self.beginDrawCache.emit( self._current_cache, self._cache_loading )
                 
-        points = self._cache_loader.points( self._current_cache )            
-        num_points = len(points)
-        if num_points:
+        frame = self._cache_loader.frame( self._current_cache )
+        if frame != None and len(frame):
             # Draw the particles for the current cache (i.e. frame)
             glPushMatrix()
 
-            # use fixed point size for now
-            # todo: we should use a GLSL shader to render the particle sizes
-            glPointSize( 2.0 )
-
-            glEnableClientState(GL_COLOR_ARRAY)            
-            try:
-                colors = self._cache_loader.colors( self._current_cache )
-                glColorPointerf(colors)
-            except:
-                # default color
-                # todo: should be optional
-                glColor3f( 0.0, 0.7, 0.0 )
-
-            glEnableClientState(GL_VERTEX_ARRAY)                
-            glVertexPointerf( points )                                                                
-            glDrawArrays(GL_POINTS, 0, num_points )            
-            glDisableClientState(GL_VERTEX_ARRAY)
-
-            glDisableClientState(GL_COLOR_ARRAY)
+            # skip the grid cells out of view
+            planes = frustum_planes( glGetFloatv( GL_MODELVIEW_MATRIX ), glGetFloatv( GL_PROJECTION_MATRIX ) )
+            ranges = frame.grid.ranges( planes )
+            total = int( ranges[1].sum() )
+            count = total
+
+            # draw a subset of the points in view while a tool is active
+            interacting = self._toolmgr.interacting
+            if interacting and total:
+                count = self._lod.count( total )
+                ranges = frame.grid.ranges( planes, float(count) / total )
+            t1 = clock()
+
+            # the particles are drawn as sprites sized and colored by the shader in a single draw call
+            color_range = self._color_range( frame )
+            self._shader.begin( self.height(), color_range, value_components( frame.values ) )
+            # the frame data is uploaded once, orbiting or panning redraws from the GPU buffers
+            self._buffers.get( frame ).draw( size_location=self._shader.size_location, ranges=ranges, value_location=self._shader.value_location )
+            self._shader.end()
+
+            if interacting or self._show_timings:
+                # wait for the GPU to measure the real draw time
+                glFinish()
+            TRACER.record( 'draw', t1, clock() - t1, 'gpu', { 'cache' : self._current_cache, 'points' : int( ranges[1].sum() ) } )
+            if interacting:
+                self._lod.update( clock() - t1, int( ranges[1].sum() ), total )
             
             glPopMatrix()
 
         self.endDrawCache.emit( self._current_cache, self._cache_loading )
+        TRACER.record( 'paint', paint_start, clock() - paint_start, 'gpu', { 'cache' : self._current_cache } )
+
+        if self._show_timings:
+            self._draw_timings()
+
+    def _draw_timings( self ):
+        """ overlay with the last and average duration of the recorded spans """
+        glColor3f( 1.0, 1.0, 0.6 )
+        lines = [ 'Cache %d' % self._current_cache ]
+        for (name, last, average, count) in TRACER.summary():
+            lines.append( '%-12s %8.2f ms  (avg %8.2f ms)' % (name, last*1000.0, average*1000.0) )
+        for (i, line) in enumerate( lines ):
+            self.renderText( 10, 20 + i*16, line, self._timings_font )
+
+    def _color_range( self, frame ):
+        """ range of the color attribute values, the same for all caches when the statistics are available """
+        name = self._cache_loader.color_attribute
+        if name == None or len(frame.values) == 0:
+            return None
+        stats = self._cache_loader.stats.attribute( name )
+        if stats != None:
+            return value_range( stats )
+        return frame.value_range
+
+    def _frame_bbox( self, bbox ):
+        if bbox == None:
+            self._statusbar.showMessage( 'Nothing to frame' )
+            return
+        self._toolmgr['PAN' ].panning_vec = Vec3(0,0,0)
+        self._camera.fit( bbox[0], bbox[1], float(self.width()) / max( 1, self.height() ) )
+        # the far plane may have changed
+        self.makeCurrent()
+        self.resizeGL( self.width(), self.height() )
+        self._updateGL()
 
     def _create_grid_data(self, size ):
         self.grid_array = numpy.zeros( ((size+1)*4,3), numpy.float32 )
@@ -493,8 +712,16 @@ class ICEViewer(QtOpenGL.QGLWidget):
         if self._current_cache != self._end_cache:
             self._current_cache += 1
             
+        self._update_prefetcher()
         self._updateGL()
         
+    def _update_prefetcher( self ):
+        """ read ahead from the current cache """
+        if self._cache_loading:
+            # the viewer draws every cache as it gets loaded
+            return
+        self._prefetcher.update( self._current_cache, self._start_cache, self._end_cache, self._play_direction, self._loop_state )
+
     def _updateGL( self ):
         """ update the OGL view """
         #traceit()
@@ -0,0 +1,215 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+"""
+Synthetic .icecache writer, used to generate reproducible caches for the benchmarks.
+
+    python -m icewriter <folder> [-n frames] [-p particles] [-v 102|103] [-a Size:float,Mass:float:const]
+
+Files are written with the layout read by ICEReader: gzip stream, header, attribute descriptions
+then the data of every attribute. PointPosition___ is written in one block, the other attributes
+per chunk of ICECACHE_CHUNK_SIZE values with their constant flag in front of every chunk.
+"""
+
+import os
+import sys
+import gzip
+import struct
+import argparse
+import numpy
+from consts import CONSTS
+from icereader_util import ICECacheFileHandler
+
+POSITION = 'PointPosition___'
+
+# data type: (number of components, array type)
+DATATYPES = {
+    CONSTS.siICENodeDataLong        : (1, '<i4'),
+    CONSTS.siICENodeDataFloat       : (1, '<f4'),
+    CONSTS.siICENodeDataVector2     : (2, '<f4'),
+    CONSTS.siICENodeDataVector3     : (3, '<f4'),
+    CONSTS.siICENodeDataVector4     : (4, '<f4'),
+    CONSTS.siICENodeDataQuaternion  : (4, '<f4'),
+    CONSTS.siICENodeDataRotation    : (4, '<f4'),
+    CONSTS.siICENodeDataColor4      : (4, '<f4'),
+    CONSTS.siICENodeDataMatrix33    : (9, '<f4'),
+    CONSTS.siICENodeDataMatrix44    : (16, '<f4')
+}
+
+# data type names used on the command line
+TYPE_NAMES = {
+    'long' : CONSTS.siICENodeDataLong,
+    'float' : CONSTS.siICENodeDataFloat,
+    'vector2' : CONSTS.siICENodeDataVector2,
+    'vector3' : CONSTS.siICENodeDataVector3,
+    'vector4' : CONSTS.siICENodeDataVector4,
+    'quaternion' : CONSTS.siICENodeDataQuaternion,
+    'rotation' : CONSTS.siICENodeDataRotation,
+    'color4' : CONSTS.siICENodeDataColor4,
+    'matrix33' : CONSTS.siICENodeDataMatrix33,
+    'matrix44' : CONSTS.siICENodeDataMatrix44
+}
+
+BUILTIN = (POSITION, 'PointVelocity___', 'Color___', 'Size')
+
+# (name, data type, constant), PointPosition___ is always written first
+DEFAULT_ATTRIBUTES = (
+    ('PointVelocity___', CONSTS.siICENodeDataVector3, False),
+    ('Color___', CONSTS.siICENodeDataColor4, False),
+    ('Size', CONSTS.siICENodeDataFloat, False),
+    ('Mass', CONSTS.siICENodeDataFloat, True),
+    ('Kind', CONSTS.siICENodeDataLong, False)
+    )
+
+def parse_attributes( spec ):
+    """ attribute list from a string like 'Size:float,Mass:float:const' """
+    attributes = []
+    for item in spec.split( ',' ):
+        fields = item.strip().split( ':' )
+        if len(fields) < 2 or not fields[1].lower() in TYPE_NAMES:
+            raise ValueError( 'invalid attribute: %s (expected name:type[:const], types: %s)' % (item, ', '.join( sorted( TYPE_NAMES ) )) )
+        attributes.append( (fields[0], TYPE_NAMES[ fields[1].lower() ], len(fields) > 2 and fields[2] == 'const') )
+    return tuple( attributes )
+
+def chunk_sizes( count ):
+    """ sizes of the chunks read by ICECacheFileHandler.chunks, multiples of the chunk size end with an empty chunk """
+    size = ICECacheFileHandler.ICECACHE_CHUNK_SIZE
+    if count < size:
+        return [count]
+    return [size] * (count // size) + [count % size]
+
+def data_size( particle_count, attributes=DEFAULT_ATTRIBUTES ):
+    """ number of bytes of attribute data written by write_icecache """
+    attributes = _with_position( attributes )
+    size = 0
+    for (name, datatype, constant) in attributes:
+        (length, type) = DATATYPES[ datatype ]
+        if particle_count == 0:
+            continue
+        if name == POSITION or not constant:
+            size += particle_count * length * 4
+        else:
+            size += len( chunk_sizes( particle_count ) ) * length * 4
+    return size
+
+def write_icecache( filename, particle_count, version=CONSTS.siICECacheV103, attributes=DEFAULT_ATTRIBUTES, seed=0, frame=0 ):
+    """
+    Write a point cloud cache with random values. The values only depend on seed and frame, the
+    positions move with the frame number. Returns the number of bytes of attribute data.
+    """
+    if not version in (CONSTS.siICECacheV102, CONSTS.siICECacheV103):
+        raise ValueError( 'unsupported ICE cache version: %d' % version )
+    attributes = _with_position( attributes )
+    rand = numpy.random.RandomState( seed + frame )
+
+    f = gzip.open( filename, 'wb' )
+    try:
+        # header
+        f.write( 'ICECACHE' )
+        counts = [ version, CONSTS.siICENodeObjectPointCloud, particle_count, 0, 0, 0 ]
+        if version == CONSTS.siICECacheV103:
+            # substeps
+            counts.append( 1 )
+        counts += [ 0, len(attributes) ]
+        f.write( struct.pack( '<%di' % len(counts), *counts ) )
+
+        # attribute descriptions
+        for (name, datatype, constant) in attributes:
+            category = CONSTS.siICEAttributeCategoryCustom
+            if name in BUILTIN:
+                category = CONSTS.siICEAttributeCategoryBuiltin
+            f.write( _name( name ) )
+            f.write( struct.pack( '<5i', datatype, CONSTS.siICENodeStructureSingle, CONSTS.siICENodeContextComponent0D, 0, category ) )
+
+        if particle_count == 0:
+            return 0
+
+        # attribute data
+        data_bytes = 0
+        for (name, datatype, constant) in attributes:
+            (length, type) = DATATYPES[ datatype ]
+            if name == POSITION:
+                data = rand.uniform( -1.0, 1.0, (particle_count, 3) ) + frame * 0.01
+                f.write( struct.pack( '<i', 0 ) )
+                data_bytes += _write_values( f, data, type )
+                continue
+
+            if name == 'ID':
+                # unique IDs, the particles are not in the same order from a frame to the next
+                data = rand.permutation( particle_count ).reshape( particle_count, 1 )
+            elif type == '<i4':
+                data = rand.randint( 0, 100, (particle_count, length) )
+            else:
+                data = rand.uniform( 0.0, 1.0, (particle_count, length) )
+            start = 0
+            for size in chunk_sizes( particle_count ):
+                f.write( struct.pack( '<i', int(constant) ) )
+                if constant:
+                    data_bytes += _write_values( f, data[:1], type )
+                else:
+                    data_bytes += _write_values( f, data[ start : start+size ], type )
+                start += size
+        return data_bytes
+    finally:
+        f.close()
+
+def write_sequence( folder, frame_count, particle_count, version=CONSTS.siICECacheV103, attributes=DEFAULT_ATTRIBUTES, seed=0, name='synthetic' ):
+    """ write frames 1..frame_count as <name>_<frame>.icecache, returns the file names """
+    if not os.path.exists( folder ):
+        os.makedirs( folder )
+    files = []
+    for frame in range( 1, frame_count+1 ):
+        filename = os.path.join( folder, '%s_%d.icecache' % (name, frame) )
+        write_icecache( filename, particle_count, version, attributes, seed, frame )
+        files.append( filename )
+    return files
+
+def _with_position( attributes ):
+    """ PointPosition___ followed by the other attributes """
+    return ((POSITION, CONSTS.siICENodeDataVector3, False),) + tuple( [ a for a in attributes if a[0] != POSITION ] )
+
+def _name( name ):
+    """ length prefixed name padded to 4 bytes """
+    pad = (4 - len(name) % 4) % 4
+    return struct.pack( '<i', len(name) ) + name + '\0' * pad
+
+def _write_values( f, data, type ):
+    buf = numpy.ascontiguousarray( data, type ).tostring()
+    f.write( buf )
+    return len(buf)
+
+def main( argv ):
+    parser = argparse.ArgumentParser( prog='icewriter', description='Write synthetic ICE cache files.' )
+    parser.add_argument( 'folder', help='destination folder' )
+    parser.add_argument( '-n', '--frames', type=int, default=10, help='number of frames' )
+    parser.add_argument( '-p', '--particles', type=int, default=100000, help='particles per frame' )
+    parser.add_argument( '-v', '--version', type=int, choices=(CONSTS.siICECacheV102, CONSTS.siICECacheV103), default=CONSTS.siICECacheV103, help='ICE cache version' )
+    parser.add_argument( '-a', '--attributes', help='attributes besides PointPosition___, e.g. Size:float,Mass:float:const' )
+    parser.add_argument( '--seed', type=int, default=0, help='random seed' )
+    parser.add_argument( '--name', default='synthetic', help='file name prefix' )
+    options = parser.parse_args( argv[1:] )
+
+    attributes = DEFAULT_ATTRIBUTES
+    if options.attributes:
+        attributes = parse_attributes( options.attributes )
+    files = write_sequence( options.folder, options.frames, options.particles, options.version, attributes, options.seed, options.name )
+    print 'Wrote %d files to %s' % (len(files), options.folder)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit( main(sys.argv) )
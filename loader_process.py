@@ -16,31 +16,27 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ###############################################################################
 
-from PyQt4 import QtCore, QtNetwork
-import ctypes
-import ctypes.util
-import pickle
+import json
 import sys
-import numpy as np
-import struct
 import icereader as icer
 import h5reader as h5r
+from metadata import file_metadata
+from icereader_util import to_sih5, import_h5py
+import convcache
+import particleindex
 from consts import CONSTS
+from process_worker import serve, check_cancel, TaskCancelled
 import os
 
-PACKET_LEN = struct.calcsize('L')  # 4 bytes
-SERVER = 'ICE-CACHE-LOADER'
-CLIB = ctypes.cdll.LoadLibrary(ctypes.util.find_library('c'))
-TIMEOUT = 5000
-
-theApp = QtCore.QCoreApplication(sys.argv)
-
-def handle_file( filename, index ):                        
-    """ cache file handling. """
+def handle_file( filename, index, cache_folder=None ):                        
+    """ cache file handling. The .icecache files are converted to the conversion cache folder if any, to a .sih5 folder next to the file otherwise. """
     if h5r.is_valid_file( filename ):
         # SIH5 file: nothing to do, the file will be loaded later
         return ( index, filename )
 
+    if icer.is_valid_file( filename ) and cache_folder != None:
+        return ( index, convert( filename, cache_folder ) )
+
     if icer.is_valid_file( filename ):        
         # load .icecache and save to SIH5 folder
         data_folder = os.path.join( os.path.dirname( filename ), '.sih5' )
@@ -55,17 +51,103 @@ def handle_file( filename, index ):
     # unsupported file format 
     return ( None, None )    
 
-def main(argv):
-    
-    files = eval(argv[1])
-    indices = eval(argv[2])
+def convert( filename, cache_folder ):
+    """ convert a .icecache file to the conversion cache unless already converted, returns the SIH5 file name """
+    target = convcache.converted_filename( cache_folder, filename )
+    if os.path.isfile( target ):
+        if not convcache.is_stale( target, filename ):
+            convcache.touch( cache_folder, target )
+            return target
+        # same size and time but modified
+        try:
+            os.remove( target )
+        except OSError:
+            pass
+
+    folder = os.path.dirname( target )
+    if not os.path.exists( folder ):
+        try:
+            os.makedirs( folder )
+        except OSError:
+            # created by another worker
+            pass
+
+    reader = icer.ICEReader( filename )
+    reader.load( )
+    # written under a temporary name, a viewer may look for the same file
+    tmp = '%s.%d.tmp' % (target, os.getpid())
+    try:
+        to_sih5( tmp, reader )
+    except:
+        # cancelled or failed
+        if os.path.isfile( tmp ):
+            os.remove( tmp )
+        raise
+    try:
+        os.rename( tmp, target )
+    except OSError:
+        # already converted by another process
+        os.remove( tmp )
+    return target
+
+def load_file( f, index, cache_folder ):
+    """ convert a cache file if needed and read its metadata, returns (index, SIH5 file name, JSON metadata) """
+    (index, filename) = handle_file( f, index, cache_folder )
+
+    # metadata read once here, the application doesn't have to open the file for browsing
+    metadata = None
+    if filename != None:
+        h5file = import_h5py().File( filename, 'r' )
+        try:
+            metadata = file_metadata( h5file ).to_json()
+            indexed = not particleindex.needs_index( h5file )
+        finally:
+            h5file.close()
+        if not indexed and convcache.is_cached( cache_folder, filename ):
+            # converted before the index existed, the SIH5 files of the users are never modified
+            try:
+                particleindex.add_index( filename )
+            except:
+                # the trajectories read the IDs of the frame instead
+                pass
+    return (index, filename, metadata)
+
+def handle_task( args ):
+    """ 
+    Task arguments:
+    arg0: list of files
+    arg1: list of file indices
+    arg2: conversion cache folder, optional
+    A [index, SIH5 file name, metadata] message is written per file, [index, None, error] if the file
+    failed to load, e.g. still being written by a simulation.
+    """
+    files = args[0]
+    indices = args[1]
+    cache_folder = None
+    if len(args) > 2:
+        cache_folder = args[2]
 
     for i,f in enumerate(files):
-        data = handle_file( f, indices[i] )
+        check_cancel()
+        try:
+            (index, filename, metadata) = load_file( f, indices[i], cache_folder )
+        except TaskCancelled:
+            raise
+        except:
+            (index, filename, metadata) = (indices[i], None, '%s - %s' % (f, sys.exc_info()[1]))
 
-        # tell process about the new file
-        sys.stdout.write( str(data) )
+        # tell process about the new file, JSON as the stats may hold NaN values
+        sys.stdout.write( json.dumps( [index, filename, metadata] ) + '\n' )
         sys.stdout.flush()  
+
+def main(argv):
+    if len(argv) > 2:
+        # single task from the command line
+        handle_task( [eval(arg) for arg in argv[1:4]] )
+        return
+
+    # warm worker, process the tasks sent by the pool
+    serve( handle_task )
    
 if __name__ == '__main__':
     main(sys.argv)
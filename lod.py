@@ -0,0 +1,69 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+import numpy
+
+# 60 fps while interacting
+TARGET_FRAME_TIME = 1.0 / 60.0
+# never draw less points than this while interacting
+MIN_POINTS = 10000
+# same seed for every frame, frames with the same particle count get the same order
+SEED = 0
+
+def permutation( count ):
+    """ stable random permutation, any prefix of the reordered particles is an even subsampling of the frame """
+    return numpy.random.RandomState( SEED ).permutation( count )
+
+def reorder( order, *arrays ):
+    """ reorder the per-particle arrays, arrays not holding len(order) items (e.g. constant values) are returned as is """
+    count = len(order)
+    result = []
+    for a in arrays:
+        if len(a) == count and count > 1:
+            a = numpy.ascontiguousarray( a[ order ] )
+        result.append( a )
+    return result
+
+class LODController(object):
+    """
+    Chooses how many points of a frame are drawn while a view tool is active. The fraction of points
+    is adjusted from the measured draw time to keep the frame time close to target.
+    """
+    def __init__( self, target=TARGET_FRAME_TIME, fraction=0.05 ):
+        self.target = target
+        self.fraction = fraction
+        # smoothed draw time per point
+        self._point_time = None
+
+    def count( self, total ):
+        """ number of points to draw out of total """
+        return min( total, max( MIN_POINTS, int( total * self.fraction ) ) )
+
+    def update( self, seconds, count, total ):
+        """ adjust the fraction from the time taken to draw count points out of total """
+        if count <= 0 or total <= 0:
+            return
+        point_time = seconds / count
+        if self._point_time == None:
+            self._point_time = point_time
+        else:
+            self._point_time = 0.7 * self._point_time + 0.3 * point_time
+        if self._point_time > 0:
+            self.fraction = min( 1.0, max( 0.001, self.target / ( self._point_time * total ) ) )
+        else:
+            self.fraction = 1.0
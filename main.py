@@ -16,6 +16,13 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ###############################################################################
 
+# startup time, the imports and the time to window are recorded in the tracer
+import os
+import sys
+from profiler import TRACER, IMPORTS, clock
+START = clock()
+IMPORTS.start()
+
 # This is only needed for Python v2 but is harmless for Python v3.
 import sip
 sip.setapi('QString', 2)
@@ -26,12 +33,22 @@ logging.basicConfig()
 from PyQt4 import QtCore, QtGui
 from iceexplorer import ICECacheExplorerWindow
 
+IMPORTS.stop()
+TRACER.record('startup imports', START, IMPORTS.total, 'startup')
+
+def _window_shown():
+    """ called once the window got its first events """
+    TRACER.record('time to window', START, clock() - START, 'startup')
+    if os.environ.get('ICEX_IMPORTTIME'):
+        # same report as python -X importtime
+        sys.stderr.write(IMPORTS.report())
+
 if __name__ == '__main__':
 
-    import sys
     notice = 'ICE Cache Explorer Copyright (C) 2010  M.A.Belzile'
     print notice
     app = QtGui.QApplication(sys.argv)
     mainWin = ICECacheExplorerWindow()
     mainWin.show()
+    QtCore.QTimer.singleShot(0, _window_shown)
     sys.exit(app.exec_())
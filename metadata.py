@@ -0,0 +1,84 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+"""
+Metadata of the loaded caches: the header, the attribute descriptions and the statistics of a SIH5
+file. The metadata is read by the loader worker right after the conversion and sent with the load
+result, the browser and the menus read it from memory instead of opening the files.
+"""
+
+import numpy
+from icestats import read_file_stats, stats_to_json, stats_from_json, BBOX_MIN, BBOX_MAX
+
+class CacheMetadata(object):
+    """ Header and attributes of a cache as plain python values """
+    def __init__( self, header, attributes, stats=None ):
+        # header attributes by name
+        self.header = header
+        # attribute descriptions in file order, Data holds the shape and kind of the data set or None
+        self.attributes = attributes
+        # file stats as returned by read_file_stats, None for files exported without statistics
+        self.stats = stats
+
+    def attribute( self, name ):
+        """ return the description of an attribute by name or None """
+        for a in self.attributes:
+            if a['name'] == name:
+                return a
+        return None
+
+    def to_json( self ):
+        return { 'header' : self.header, 'attributes' : self.attributes, 'stats' : stats_to_json( self.stats ) }
+
+    @staticmethod
+    def from_json( obj ):
+        """ metadata saved with to_json """
+        if obj == None:
+            return None
+        return CacheMetadata( obj['header'], obj['attributes'], stats_from_json( obj['stats'] ) )
+
+def file_metadata( h5file ):
+    """ read the metadata of an open SIH5 file, only the HDF5 attributes are read """
+    header = _attrs( h5file[ 'HEADER' ].attrs, (BBOX_MIN, BBOX_MAX) )
+    attributes = []
+    for name, group in h5file[ 'ATTRIBS' ].items():
+        attrib = _attrs( group.attrs )
+        attrib.setdefault( 'name', name )
+        attrib['Data'] = None
+        if 'Data' in group:
+            data = group[ 'Data' ]
+            attrib['Data'] = { 'kind' : data.dtype.kind, 'shape' : list( data.shape ) }
+        attributes.append( attrib )
+    return CacheMetadata( header, attributes, read_file_stats( h5file ) )
+
+def _attrs( attrs, skip=() ):
+    """ HDF5 attributes to a dict of plain values, the stats and source attributes are left out """
+    values = {}
+    for name, value in attrs.items():
+        if name in skip or name.startswith( 'stats_' ) or name.startswith( 'source_' ):
+            continue
+        values[ str(name) ] = _plain( value )
+    return values
+
+def _plain( value ):
+    """ numpy value to a JSON compatible value """
+    if isinstance( value, numpy.ndarray ):
+        return value.tolist()
+    if isinstance( value, numpy.generic ):
+        return value.item()
+    return value
@@ -0,0 +1,175 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+"""
+Particle ID index. The SIH5 frames holding an ID attribute get an index of their IDs when converted,
+the loader adds it to the conversion cache files converted before the index existed. Files from
+other tools are left as is and searched by a linear scan of their IDs:
+
+    /INDEX/ID/Sorted    IDs of the frame sorted
+    /INDEX/ID/Rows      row of every sorted ID in the attribute data sets
+    /INDEX/ID/Fence     every BLOCK_SIZE'th sorted ID
+
+ParticleIndex keeps the fences of a sequence in memory. Finding a particle in a frame reads a single
+block of Sorted and a single value of Rows, the trajectory of a particle then reads one row of the
+attribute per frame instead of the whole frames.
+"""
+
+import numpy
+import threading
+from icestats import POSITION
+
+ID = 'ID'
+ID_DATA = '/ATTRIBS/ID/Data'
+INDEX_PATH = '/INDEX/ID'
+SORTED = INDEX_PATH + '/Sorted'
+ROWS = INDEX_PATH + '/Rows'
+FENCE = INDEX_PATH + '/Fence'
+ATTRIB_DATA = '/ATTRIBS/%s/Data'
+
+# IDs per block of the sorted IDs
+BLOCK_SIZE = 1024
+
+def build_index( ids ):
+    """ return (sorted IDs, rows, fence) for the IDs of a frame """
+    ids = numpy.asarray( ids ).reshape( -1 )
+    rows = numpy.argsort( ids, kind='mergesort' ).astype( numpy.int32 )
+    sorted_ids = ids[ rows ]
+    return (sorted_ids, rows, sorted_ids[ ::BLOCK_SIZE ])
+
+def has_index( h5file ):
+    return SORTED in h5file
+
+def needs_index( h5file ):
+    """ True for the frames with an ID attribute but no index """
+    return ID_DATA in h5file and not SORTED in h5file and h5file[ ID_DATA ].shape[0] > 1
+
+def write_index( h5file, ids=None ):
+    """ add the ID index to an SIH5 file open for writing, the IDs are read from the file if not given """
+    if ids is None:
+        ids = h5file[ ID_DATA ][:]
+    (sorted_ids, rows, fence) = build_index( ids )
+    if INDEX_PATH in h5file:
+        del h5file[ INDEX_PATH ]
+    group = h5file.require_group( INDEX_PATH )
+    group.attrs[ 'block_size' ] = BLOCK_SIZE
+    group.create_dataset( 'Sorted', data=sorted_ids, chunks=(min( BLOCK_SIZE, max( 1, len(sorted_ids) ) ),) )
+    group.create_dataset( 'Rows', data=rows )
+    group.create_dataset( 'Fence', data=fence )
+
+def add_index( filename ):
+    """ add the ID index to an SIH5 file if missing, returns False if the file can't be written, e.g. on read-only storage """
+    import h5py as h5
+    try:
+        f = h5.File( filename, 'r+' )
+    except IOError:
+        return False
+    try:
+        if needs_index( f ):
+            write_index( f )
+    finally:
+        f.close()
+    return True
+
+def find_row( h5file, particle_id, fence=None ):
+    """ return the row of a particle in a frame or None, fence can be given to save its read """
+    if fence is None:
+        fence = h5file[ FENCE ][:]
+    block = numpy.searchsorted( fence, particle_id, side='right' ) - 1
+    if block < 0:
+        return None
+    start = block * BLOCK_SIZE
+    ids = h5file[ SORTED ][ start : start + BLOCK_SIZE ]
+    i = numpy.searchsorted( ids, particle_id )
+    if i >= len(ids) or ids[i] != particle_id:
+        return None
+    return int( h5file[ ROWS ][ start + i ] )
+
+class ParticleIndex(object):
+    """
+    ID index of a sequence: maps a particle ID to its (frame, row) in every frame. files is an
+    h5pool.H5FilePool or any object mapping the frame numbers to open SIH5 files with keys().
+    Frames without index are searched by reading their ID attribute.
+    """
+    def __init__( self, files ):
+        self._files = files
+        # held while reading, the pool may close its files from another thread
+        self._lock = getattr( files, 'lock', None ) or threading.RLock()
+        # fence by frame, None for the frames without index or ID
+        self._fences = {}
+
+    def clear( self ):
+        self._fences.clear()
+
+    def remove( self, frame ):
+        """ forget a frame, e.g. loaded again """
+        self._fences.pop( frame, None )
+
+    def rows( self, particle_id ):
+        """ return the [(frame, row)] of a particle, sorted by frame """
+        rows = []
+        for frame in sorted( self._files.keys() ):
+            row = self.row( frame, particle_id )
+            if row != None:
+                rows.append( (frame, row) )
+        return rows
+
+    def row( self, frame, particle_id ):
+        """ return the row of a particle in a frame or None """
+        with self._lock:
+            return self._row( self._files[ frame ], frame, particle_id )
+
+    def _row( self, h5file, frame, particle_id ):
+        if not frame in self._fences:
+            self._fences[ frame ] = None
+            if has_index( h5file ):
+                self._fences[ frame ] = h5file[ FENCE ][:]
+        fence = self._fences[ frame ]
+        if fence is not None:
+            return find_row( h5file, particle_id, fence )
+        if not ID_DATA in h5file:
+            return None
+        # not indexed
+        rows = numpy.nonzero( h5file[ ID_DATA ][:].reshape( -1 ) == particle_id )[0]
+        if len(rows) == 0:
+            return None
+        return int( rows[0] )
+
+    def trajectory( self, particle_id, attribute=POSITION ):
+        """
+        Return (frames, values) of a particle: the frames where the particle exists and the values of
+        attribute in these frames, one row per frame.
+        """
+        frames = []
+        values = []
+        path = ATTRIB_DATA % attribute
+        for frame in sorted( self._files.keys() ):
+            with self._lock:
+                h5file = self._files[ frame ]
+                row = self._row( h5file, frame, particle_id )
+                if row == None or not path in h5file:
+                    continue
+                data = h5file[ path ]
+                if data.shape[0] == 1:
+                    # constant
+                    row = 0
+                values.append( numpy.asarray( data[ row ] ).reshape( -1 ) )
+            frames.append( frame )
+        if values == []:
+            return (numpy.zeros( 0, numpy.int32 ), numpy.zeros( (0,0), numpy.float32 ))
+        return (numpy.array( frames ), numpy.vstack( values ))
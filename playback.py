@@ -127,6 +127,7 @@ class PlaybackWidget( QtGui.QWidget ):
         viewer.beginCacheLoading.connect(self.on_begin_cache_loading)
         viewer.cacheLoaded.connect(self.on_cache_loaded)
         viewer.endCacheLoading.connect(self.on_end_cache_loading)
+        viewer.cacheRangeExtended.connect(self.on_cache_range_extended)
         viewer.beginDrawCache.connect(self.on_begin_drawcache)
         viewer.endDrawCache.connect(self.on_end_drawcache)
         viewer.beginPlayback.connect(self.on_begin_playback)
@@ -223,6 +224,17 @@ class PlaybackWidget( QtGui.QWidget ):
     def on_end_cache_loading( self, cache_count, start_cache, end_cache ):
         self.__block_signals__(False)
 
+    def on_cache_range_extended( self, previous, last ):
+        """ caches were appended to the sequence, the range is extended if it ended on the previous last cache """
+        if self.end_cache != previous:
+            return
+        self.end_cache = last
+        self.endcache.setText( str(self.end_cache) )
+        self.timeline.setRange(self.start_cache, self.end_cache)        
+        if self.current_cache == previous and self.playtoggle.isChecked() == False:
+            # follow the simulation
+            self.timeline.setValue( last )
+
     def on_begin_drawcache( self, cache, bFileLoading ):
         #print '\nPlaybackWidget.on_begin_drawcache %d loading=%d' % (cache,bFileLoading)
         pass
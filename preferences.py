@@ -20,6 +20,11 @@ from PyQt4 import QtCore, QtGui
 import multiprocessing as mp
 import ui_prefs
 import sys,os
+from h5pool import DEFAULT_MAX_OPEN_FILES
+from framecache import DEFAULT_FRAME_CACHE_MB
+from prefetch import DEFAULT_READ_AHEAD
+from glbuffers import DEFAULT_GPU_BUFFERS_MB
+import convcache
 
 _default_export_folder = r'c:\temp'
 if not sys.platform.startswith('win'):
@@ -34,6 +39,12 @@ class ICEPreferences( QtGui.QDialog ):
         self.ui.setupUi( self )        
         self.ui.process_count_edit.setText( str(mp.cpu_count()) )
         self.ui.export_folder_edit.setText( _default_export_folder )
+        self.ui.max_open_files_edit.setText( str(DEFAULT_MAX_OPEN_FILES) )
+        self.ui.frame_cache_edit.setText( str(DEFAULT_FRAME_CACHE_MB) )
+        self.ui.read_ahead_edit.setText( str(DEFAULT_READ_AHEAD) )
+        self.ui.gpu_buffers_edit.setText( str(DEFAULT_GPU_BUFFERS_MB) )
+        self.ui.conversion_cache_edit.setText( convcache.default_folder() )
+        self.ui.conversion_quota_edit.setText( str(convcache.DEFAULT_QUOTA_MB) )
         self.ui.default_export_folder_btn.pressed.connect( self._on_select_default_export_folder )
         
     @property
@@ -44,6 +55,39 @@ class ICEPreferences( QtGui.QDialog ):
     def export_folder(self):
         return self.ui.export_folder_edit.text()
 
+    @property
+    def max_open_files(self):
+        """ maximum number of cache files kept open by the viewer """
+        return int(self.ui.max_open_files_edit.text())
+
+    @property
+    def frame_cache_size(self):
+        """ memory budget in bytes for the decoded frames kept by the viewer """
+        return int(self.ui.frame_cache_edit.text())*1024*1024
+
+    @property
+    def read_ahead(self):
+        """ number of frames decoded ahead of the playback cursor """
+        return int(self.ui.read_ahead_edit.text())
+
+    @property
+    def gpu_buffers_size(self):
+        """ GPU memory budget in bytes for the vertex buffers of the drawn frames """
+        return int(self.ui.gpu_buffers_edit.text())*1024*1024
+
+    @property
+    def conversion_cache_folder(self):
+        """ folder of the .icecache files converted to SIH5, None to convert to a .sih5 folder next to the files """
+        folder = self.ui.conversion_cache_edit.text().strip()
+        if folder == '':
+            return None
+        return folder
+
+    @property
+    def conversion_cache_quota(self):
+        """ size limit in bytes of the conversion cache folder """
+        return int(self.ui.conversion_quota_edit.text())*1024*1024
+
     def _on_select_default_export_folder(self):
         self.parent().statusBar().clearMessage()
         title = 'Select The Default Export Folder'        
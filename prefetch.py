@@ -0,0 +1,119 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+import threading
+import sys
+
+DEFAULT_READ_AHEAD = 16
+
+class Prefetcher(threading.Thread):
+    """
+    Background thread decoding the frames ahead of the playback cursor. The frames are decoded with
+    loader.frame and end up in the loader frame cache, the viewer then draws them from memory. The
+    culling grids are built here, starting with the current frame if it was decoded by the viewer.
+    The number of frames read ahead is limited to half of the frame cache budget so prefetching
+    never evicts the frames it just decoded.
+    """
+    def __init__( self, loader, count=DEFAULT_READ_AHEAD ):
+        super(Prefetcher,self).__init__()
+        self.daemon = True
+        self._loader = loader
+        self._count = count
+        self._cond = threading.Condition()
+        self._cursor = None
+        self._stopped = False
+
+    @property
+    def count(self):
+        return self._count
+
+    @count.setter
+    def count(self, value):
+        with self._cond:
+            self._count = max(0,value)
+            self._cond.notify()
+
+    def update( self, current, start, end, direction=1, loop=False ):
+        """ set the playback cursor, the thread starts reading ahead from current in direction (1 or -1) """
+        with self._cond:
+            self._cursor = (current, start, end, direction, loop)
+            self._cond.notify()
+
+    def pause( self ):
+        """ stop reading ahead until the next update """
+        with self._cond:
+            self._cursor = None
+
+    def stop( self ):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def run( self ):
+        while True:
+            with self._cond:
+                while not self._stopped and self._cursor == None:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                cursor = self._cursor
+                indices = [ cursor[0] ] + ahead( self._count, *cursor )
+
+            for (i,index) in enumerate( indices ):
+                with self._cond:
+                    # restart from the new cursor position
+                    if self._stopped or self._cursor != cursor:
+                        break
+                nbytes = self._fetch( index )
+                if nbytes * (i+1) > self._loader.frames.budget / 2:
+                    break
+
+            with self._cond:
+                # done reading ahead, wait for the cursor to move
+                if self._cursor == cursor:
+                    self._cursor = None
+
+    def _fetch( self, index ):
+        """ decode frame index, returns the frame size in bytes """
+        try:
+            frame = self._loader.frame( index, culling=True )
+        except:
+            print 'Prefetch error on cache %d: %s' % (index, sys.exc_info()[1])
+            return 0
+        if frame == None:
+            # not loaded yet
+            return 0
+        return frame.nbytes
+
+def ahead( count, current, start, end, direction=1, loop=False ):
+    """ return the count cache indices following current in the start-end range """
+    indices = []
+    index = current
+    for i in range(count):
+        index += direction
+        if index > end or index < start:
+            if not loop:
+                break
+            if direction > 0:
+                index = start
+            else:
+                index = end
+        if index == current:
+            break
+        indices.append( index )
+    return indices
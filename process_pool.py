@@ -19,12 +19,22 @@
 from PyQt4 import QtCore
 import sys
 import time
+from functools import partial
 
-from Queue import Queue, Empty
+from collections import deque
+from process_worker import TASK_END, WORKER_READY, TASK_CANCEL
+from profiler import TRACER, clock
+
+# milliseconds a stopped worker gets to exit by itself before it gets killed
+STOP_TIMEOUT = 1000
 
 class Pool(QtCore.QObject):
-    """ Class representing a process pool """
-    
+    """
+    Class representing a pool of warm worker processes. Workers are started once with the pool command
+    and receive their tasks on stdin (see process_worker.serve), they stay alive between jobs so
+    cancelling and reloading doesn't pay the process startup cost again.
+    """
+
     # process states
     STARTED = 0
     ERROR = 1
@@ -32,161 +42,253 @@ class Pool(QtCore.QObject):
     OUTPUT_MSG = 3
     OUTPUT_ERROR_MSG = 4
     FINISHED = 5
-    
+
     # callback exception
     class Error(Exception):
         pass
-    
+
     def __init__( self, parent ):
         super(Pool,self).__init__(parent)
         self._callback  = None
-        self._all_processes = None
-        self._in_processes = None
-        self._tasks = None
+        self._command = None
+        self._all_processes = []
+        self._in_processes = deque()
+        self._tasks = deque()
         self._proc_count = 1
-        self._callback = None
+        # processes which got a task and the task start time
+        self._busy = {}
+        # busy processes running a cancelled task, their output is ignored
+        self._cancelled = set()
+        # partial stdout lines per process
+        self._buffers = {}
+        # start time of the workers not ready yet
+        self._spawning = {}
+        # stopped workers not exited yet
+        self._stopping = set()
         self._serving = False
 
-    def init( self, process_count=1, callback=None ):    
-        self._kill_all_processes()                
+    def init( self, process_count=1, callback=None, command=None ):
+        """
+        Prepare the pool for a new job. Workers already running the same command are reused.
+        command: worker process command line, e.g. 'python.exe loader_process.py'
+        """
+        self.cancel()
+        if command != self._command:
+            self._kill_all_processes()
+            self._command = command
         self._proc_count = process_count
         if callback != None:
             self._callback = callback
-        self._tasks = Queue()
-        self._in_processes = Queue()
-        self._all_processes = Queue()
-        self._serving = False
         self._populate_pool()
 
-    def submit( self, task ):        
-        self._tasks.put( task )
+    def submit( self, task ):
+        self._tasks.append( task )
         self._process_tasks()
-    
+
     def cancel(self):
+        """ Drop the queued tasks. The workers running a task are told to stop it at their next cancel check, their output is discarded until they are done. """
+        self._tasks.clear()
+        for p in self._busy.keys():
+            if not p in self._cancelled:
+                p.write( TASK_CANCEL + '\n' )
+        self._cancelled.update( self._busy.keys() )
+
+    def shutdown(self):
+        """ Stop all worker processes """
+        self.cancel()
         self._kill_all_processes()
-        #self._populate_pool()
-                        
+
     @property
     def process_count(self):
         return self._proc_count
-        
+
     def _populate_pool(self):
-        for i in range(self._proc_count-self._in_processes.qsize()):
+        # release extra idle workers if the process count went down
+        while len(self._all_processes) > self._proc_count and self._in_processes:
+            self._stop_process( self._in_processes.pop() )
+
+        for i in range(self._proc_count-len(self._all_processes)):
             p = QtCore.QProcess(self.parent())
-            self._in_processes.put( p )
-            self._all_processes.put( p )
+            self._all_processes.append( p )
+            self._buffers[ p ] = ''
             # setup notif callbacks
             p.started.connect(self._on_process_started)
             p.error.connect( self._on_process_error )
             p.readyReadStandardOutput.connect( self._on_process_output )
             p.readyReadStandardError.connect( self._on_process_error_output )
-            p.stateChanged.connect(self._on_process_state_change)                   
-            p.finished.connect(self._on_process_finished)        
+            p.stateChanged.connect(self._on_process_state_change)
+            p.finished.connect(self._on_process_finished)
+            self._spawning[ p ] = clock()
+            p.start( self._command )
 
-    def _process_tasks(self): 
+    def _process_tasks(self):
         if self._serving:
-            return        
+            return
         self._serving = True
 
-        while not self._in_processes.empty():            
-            if self._tasks.empty():
-                self._serving = False
-                return
-            
-            p = self._in_processes.get()
-            t = self._tasks.get()
+        while self._in_processes and self._tasks:
+            p = self._in_processes.popleft()
+            t = self._tasks.popleft()
+            self._busy[ p ] = time.time()
             try:
-                # try with callable object 
-                p.start( t() )            
-            except:
-                try:
-                    # try with string type                    
-                    p.start( t )
-                except:
-                    raise
-        
+                # try with callable object
+                msg = t()
+            except TypeError:
+                # try with string type
+                msg = t
+            p.write( msg + '\n' )
+            self._notify( p, self.STARTED, None )
+
         self._serving = False
 
-    def _kill_all_processes(self):        
-        """ stop pending processes """
+    def _stop_process(self, p):
+        """ close the worker input channel, the worker gets killed if it doesn't exit by itself within STOP_TIMEOUT. Doesn't wait for the worker. """
+        if p in self._stopping:
+            return
         try:
-            while not self._all_processes.empty():
-                p = self._all_processes.get()
-                try:
-                    p.close()
-                except:
-                    print sys.exc_info()
-        except:
-            pass            
-
+            self._all_processes.remove( p )
+        except ValueError:
+            pass
+        self._buffers.pop( p, None )
+        self._spawning.pop( p, None )
+        self._busy.pop( p, None )
+        self._cancelled.discard( p )
         try:
-            while 1:
-                self._in_processes.get_nowait()
+            p.finished.disconnect( self._on_process_finished )
+            p.error.disconnect( self._on_process_error )
+            p.stateChanged.disconnect( self._on_process_state_change )
+            p.readyReadStandardOutput.disconnect( self._on_process_output )
+            p.readyReadStandardError.disconnect( self._on_process_error_output )
         except:
-            pass            
+            print sys.exc_info()
+        if p.state() == QtCore.QProcess.NotRunning:
+            p.deleteLater()
+            return
+        self._stopping.add( p )
+        p.finished.connect( partial( self._on_process_stopped, p ) )
+        p.closeWriteChannel()
+        QtCore.QTimer.singleShot( STOP_TIMEOUT, partial( self._kill_process, p ) )
+
+    def _kill_process(self, p):
+        """ a stopped worker didn't exit in time """
+        if p in self._stopping:
+            p.kill()
+
+    def _on_process_stopped(self, p, *args):
+        """ a stopped worker exited """
+        self._stopping.discard( p )
+        p.deleteLater()
+
+    def _kill_all_processes(self):
+        """ stop all worker processes """
+        for p in list(self._all_processes):
+            self._stop_process( p )
+        self._in_processes.clear()
+        self._tasks.clear()
+
+    def _notify( self, process, notif, arg ):
+        if self._callback != None and not process in self._cancelled:
+            self._callback( process, notif, arg )
+
+    def _task_done( self, p ):
+        """ worker p is done with its task, put it back in the pool """
+        cancelled = p in self._cancelled
+        self._cancelled.discard( p )
+        self._busy.pop( p, None )
+        if not cancelled and self._callback != None:
+            self._callback( p, self.FINISHED, None )
+
+        if len(self._all_processes) > self._proc_count:
+            self._stop_process( p )
+        elif p in self._all_processes:
+            self._in_processes.append( p )
+        # process other tasks if any
+        self._process_tasks( )
 
-        try:
-            while 1:
-                self._tasks.get_nowait()
-        except:
-            pass            
-            
     def _on_process_started( self ):
-        try:
-            #print 'process started: %d' % self.sender().pid()
-            if self._callback != None:            
-                self._callback( self.sender(), self.STARTED, None )
-        except:
-             print '_on_process_started error: %s' % sys.exc_info()[1]
-     
+        # the worker is ready to get tasks
+        if not self.sender() in self._all_processes:
+            return
+        self._in_processes.append( self.sender() )
+        self._process_tasks( )
+
     def _on_process_error(self,error):
-        errors = ["Failed to start", "Crashed", "Timedout", "Read error", "Write Error", "Unknown Error"]        
+        errors = ["Failed to start", "Crashed", "Timedout", "Read error", "Write Error", "Unknown Error"]
         try:
             #print 'process error: %d - %s' % (self.sender().pid(), errors[error])
-            if self._callback != None:            
-                self._callback( self.sender(), self.ERROR, errors[error] )
+            self._notify( self.sender(), self.ERROR, errors[error] )
         except:
              print '_on_process_error error: %s' % sys.exc_info()[1]
-             
+
     def _on_process_state_change(self,new_state):
         states = ["Not running", "Starting", "Running"]
         try:
             #print 'process in new state: %d - %s' % (self.sender().pid(), states[new_state])
-            if self._callback != None:
-                self._callback( self.sender(), self.STATE_CHANGE, states[new_state] )
+            self._notify( self.sender(), self.STATE_CHANGE, states[new_state] )
         except:
              print '_on_process_state_change error: %s' % sys.exc_info()[1]
-             
+
     def _on_process_output(self):
-        try:
-            if self._callback != None:            
-                self._callback( self.sender(), self.OUTPUT_MSG, None )
-        except Pool.Error:
-            self.cancel()
-        
+        p = self.sender()
+        if not p in self._buffers:
+            return
+        # split the worker output in messages, one per line
+        lines = (self._buffers[ p ] + bytes.decode( bytes( p.readAllStandardOutput() ) )).split( '\n' )
+        self._buffers[ p ] = lines.pop()
+        for line in lines:
+            line = line.rstrip( '\r' )
+            if line == WORKER_READY:
+                # process startup and worker imports
+                start = self._spawning.pop( p, None )
+                if start != None:
+                    TRACER.record( 'worker spawn', start, clock() - start, 'process' )
+            elif line == TASK_END:
+                self._task_done( p )
+            elif line:
+                try:
+                    self._notify( p, self.OUTPUT_MSG, line )
+                except Pool.Error:
+                    self.cancel()
+
     def _on_process_error_output(self):
-        try:            
-            if self._callback != None:            
-                self._callback( self.sender(), self.OUTPUT_ERROR_MSG, None )
+        p = self.sender()
+        try:
+            s_out = bytes.decode( bytes( p.readAllStandardError() ) )
+            self._notify( p, self.OUTPUT_ERROR_MSG, s_out )
         except:
             print '_on_process_error_output error: %s' % sys.exc_info()[1]
 
     def _on_process_finished(self):
-        #print 'process finished: %s' % (str(self.sender()))
-        if self._callback != None:            
-            self._callback( self.sender(), self.FINISHED, None )
-        
-        # put process back in the pool
-        self._in_processes.put( self.sender() )
-        # process other tasks if any
-        self._process_tasks( )
-        
+        """ a worker exited unexpectedly """
+        p = self.sender()
+        busy = p in self._busy
+        cancelled = p in self._cancelled
+        try:
+            self._in_processes.remove( p )
+        except ValueError:
+            pass
+        self._stop_process( p )
+
+        if busy:
+            # the task died with the worker
+            if not cancelled and self._callback != None:
+                self._callback( p, self.FINISHED, None )
+            # replace the worker and process other tasks if any
+            self._populate_pool()
+
 if __name__ == '__main__':
     import multiprocessing as mp
-    pool = Pool( )
-    pool.init( mp.cpu_count )
-    
-    pool.submit( 'python test.py "toto"' )
-    pool.submit( 'python test.py "toto2"' )
-    pool.submit( 'python test.py "toto3"' )
-    
\ No newline at end of file
+    app = QtCore.QCoreApplication( sys.argv )
+    pool = Pool( None )
+
+    def callback( sender, notif, arg ):
+        if notif == Pool.OUTPUT_MSG:
+            print arg
+
+    pool.init( mp.cpu_count(), callback, 'python loader_process.py' )
+    pool.submit( repr( [ ['test1.sih5'], [1] ] ) )
+    pool.submit( repr( [ ['test2.sih5'], [2] ] ) )
+    pool.submit( repr( [ ['test3.sih5'], [3] ] ) )
+    QtCore.QTimer.singleShot( 2000, app.quit )
+    app.exec_()
+    pool.shutdown()
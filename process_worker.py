@@ -0,0 +1,91 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+import sys
+import ast
+import threading
+import Queue
+
+# written on stdout by a worker once it is done with a task
+TASK_END = '<<ICEX-TASK-END>>'
+# written on stdout by a worker once its modules are imported and it waits for tasks
+WORKER_READY = '<<ICEX-WORKER-READY>>'
+# written on stdin by the pool to interrupt the running task
+TASK_CANCEL = '<<ICEX-TASK-CANCEL>>'
+
+class TaskCancelled(Exception):
+    pass
+
+# number of the running task, the tasks up to _cancelled were cancelled by the pool
+_current = 0
+_received = 0
+_cancelled = 0
+
+def check_cancel():
+    """ raise TaskCancelled if the pool cancelled the running task, called by the readers and writers between attributes and chunks """
+    if _current > 0 and _current <= _cancelled:
+        raise TaskCancelled
+
+def _read_input( tasks ):
+    """ stdin reader thread, a cancel line applies to the tasks received before it """
+    global _received, _cancelled
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            # the pool closed our input channel
+            tasks.put( None )
+            break
+        line = line.strip()
+        if line == TASK_CANCEL:
+            _cancelled = _received
+        elif line:
+            _received += 1
+            tasks.put( (_received, line) )
+
+def serve( handler ):
+    """ 
+    Process tasks sent by process_pool.Pool until stdin is closed. Each task is a single line holding 
+    the repr of the task arguments, handler is called with the evaluated arguments. The handler output 
+    must be written one message per line. stdin is read by a thread so a running task can be cancelled,
+    the handler stops at the next check_cancel call.
+    """
+    global _current
+    tasks = Queue.Queue()
+    reader = threading.Thread( target=_read_input, args=(tasks,) )
+    reader.daemon = True
+    reader.start()
+
+    sys.stdout.write( WORKER_READY + '\n' )
+    sys.stdout.flush()
+
+    while True:
+        item = tasks.get()
+        if item == None:
+            break
+        (_current, line) = item
+
+        try:
+            handler( ast.literal_eval( line ) )
+        except TaskCancelled:
+            pass
+        except:
+            sys.stderr.write( 'Task failed: %s - %s\n' % (line, sys.exc_info()[1]) )
+            sys.stderr.flush()
+
+        sys.stdout.write( TASK_END + '\n' )
+        sys.stdout.flush()
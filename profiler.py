@@ -0,0 +1,199 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+"""
+Lightweight instrumentation. Code sections are timed with spans:
+
+    with TRACER.span( 'draw', 'gpu', cache=12 ):
+        ...
+
+The tracer keeps the recent spans in memory for the viewer overlay and can save them in the Chrome
+trace format (chrome://tracing or https://ui.perfetto.dev).
+
+Module imports can be traced as well, like python -X importtime:
+
+    IMPORTS.start()
+    import iceexplorer
+    IMPORTS.stop()
+    sys.stderr.write( IMPORTS.report() )
+"""
+
+import os
+import sys
+import time
+import json
+import threading
+import __builtin__
+from collections import deque
+
+# number of spans kept for the trace export
+MAX_EVENTS = 100000
+# number of spans per name used for the averages
+HISTORY = 60
+# span categories left out of the averages, e.g. one span per imported module
+NO_SUMMARY = ('import',)
+
+if sys.platform == 'win32':
+    clock = time.clock
+else:
+    clock = time.time
+
+class Span(object):
+    """ Context manager recording a span in the tracer when it exits """
+    def __init__( self, tracer, name, cat, args ):
+        self._tracer = tracer
+        self._name = name
+        self._cat = cat
+        self._args = args
+        self._start = 0
+
+    def __enter__( self ):
+        self._start = clock()
+        return self
+
+    def __exit__( self, *exc ):
+        self._tracer.record( self._name, self._start, clock() - self._start, self._cat, self._args )
+        return False
+
+class Tracer(object):
+    """ Records timed spans, thread-safe """
+    def __init__( self, max_events=MAX_EVENTS ):
+        self._lock = threading.Lock()
+        self._events = deque( maxlen=max_events )
+        self._recent = {}
+        self._origin = clock()
+        self.enabled = True
+
+    def span( self, name, cat='app', **args ):
+        return Span( self, name, cat, args )
+
+    def record( self, name, start, duration, cat='app', args=None ):
+        """ record a span, start and duration in seconds """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._events.append( (name, cat, start, duration, threading.current_thread().ident, args) )
+            if cat in NO_SUMMARY:
+                return
+            if not name in self._recent:
+                self._recent[ name ] = deque( maxlen=HISTORY )
+            self._recent[ name ].append( duration )
+
+    def clear( self ):
+        with self._lock:
+            self._events.clear()
+            self._recent.clear()
+
+    def summary( self ):
+        """ return a list of (name, last duration, average duration, count) sorted by name, durations in seconds """
+        with self._lock:
+            return [ (name, d[-1], sum(d) / len(d), len(d)) for name, d in sorted( self._recent.items() ) if len(d) ]
+
+    def save_chrome_trace( self, filename ):
+        """ save the recorded spans as a Chrome trace JSON file """
+        with self._lock:
+            events = list( self._events )
+        pid = os.getpid()
+        trace = []
+        for (name, cat, start, duration, tid, args) in events:
+            trace.append( {
+                'name' : name,
+                'cat' : cat,
+                'ph' : 'X',
+                'ts' : (start - self._origin) * 1e6,
+                'dur' : duration * 1e6,
+                'pid' : pid,
+                'tid' : tid,
+                'args' : args or {} } )
+        with open( filename, 'w' ) as f:
+            json.dump( { 'traceEvents' : trace, 'displayTimeUnit' : 'ms' }, f )
+        return len(trace)
+
+class ImportTracer(object):
+    """
+    Times the first import of every module while started, by replacing the builtin __import__. Each
+    module gets an 'import <name>' span with its cumulative time and its self time, i.e. without the
+    modules it imported. Meant for the application startup, imports from other threads are not
+    told apart.
+    """
+    def __init__( self, tracer ):
+        self._tracer = tracer
+        self._import = None
+        # time spent in nested imports, per import in progress
+        self._stack = []
+        # (name, self seconds, cumulative seconds, depth) in the order the imports complete
+        self.modules = []
+
+    def start( self ):
+        if self._import == None:
+            self._import = __builtin__.__import__
+            __builtin__.__import__ = self._traced_import
+
+    def stop( self ):
+        if self._import != None:
+            __builtin__.__import__ = self._import
+            self._import = None
+
+    def __enter__( self ):
+        self.start()
+        return self
+
+    def __exit__( self, *exc ):
+        self.stop()
+        return False
+
+    @property
+    def total( self ):
+        """ seconds spent in top level imports """
+        return sum( [ m[2] for m in self.modules if m[3] == 0 ] )
+
+    def report( self ):
+        """ import times in the python -X importtime format """
+        lines = [ 'import time: self [us] | cumulative | imported package' ]
+        for (name, own, cumulative, depth) in self.modules:
+            lines.append( 'import time: %9d | %10d | %s%s' % (own * 1e6, cumulative * 1e6, '  ' * depth, name) )
+        return '\n'.join( lines ) + '\n'
+
+    def _traced_import( self, name, *args, **kwargs ):
+        if name in sys.modules:
+            return self._import( name, *args, **kwargs )
+        self._stack.append( 0.0 )
+        loaded = len(sys.modules)
+        module = None
+        start = clock()
+        try:
+            module = self._import( name, *args, **kwargs )
+            return module
+        finally:
+            duration = clock() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += duration
+            # python 2 looks up relative names first, lookups which didn't load anything are left out
+            if len(sys.modules) > loaded:
+                # relative imports are reported with their full name
+                full_name = getattr( module, '__name__', name )
+                if name == '' or full_name.endswith( '.' + name ):
+                    name = full_name
+                self.modules.append( (name, duration - children, duration, len(self._stack)) )
+                self._tracer.record( 'import ' + name, start, duration, 'import', { 'self_us' : int( (duration - children) * 1e6 ) } )
+
+# application tracer
+TRACER = Tracer()
+# startup imports
+IMPORTS = ImportTracer( TRACER )
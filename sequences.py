@@ -0,0 +1,182 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+"""
+Discovery of the cache sequences of a folder. Every file name is parsed once into a prefix, a frame
+number, a substep and an extension, the files are grouped by prefix and extension and sorted by
+(frame, substep):
+
+    cloud_12.icecache           -> ('cloud_', 12, None, '.icecache')
+    cloud_12.3.icecache         -> ('cloud_', 12, 3, '.icecache')
+    smoke.0012.icecache.sih5    -> ('smoke.', 12, None, '.icecache.sih5'), padded to 4 digits
+"""
+
+import os
+import re
+
+# longest extensions first
+EXTENSIONS = ('.icecache.sih5', '.icecache.hdf5', '.icecache', '.sih5', '.hdf5')
+
+# a whole file name is parsed by a single match:
+#   <prefix>_<frame>.<substep><ext>
+#   <prefix><frame><ext>, the prefix doesn't end with a digit
+#   <stem><ext>
+NAME_RE = re.compile( r'^(?:(.*_)(\d+)\.(\d+)|(.*?)(\d+)|(.*?))(%s)$' % '|'.join( [ re.escape( e ) for e in EXTENSIONS ] ), re.IGNORECASE )
+
+def split_extension( filename ):
+    """ return (stem, extension) of a cache file name, the extension is None for other files """
+    lower = filename.lower()
+    for ext in EXTENSIONS:
+        if lower.endswith( ext ):
+            return (filename[ : -len(ext) ], ext)
+    return (filename, None)
+
+def parse_name( filename ):
+    """
+    Parse the base name of a cache file into (prefix, frame, substep, ext, padding), or None if it's
+    not a cache file. padding is the number of digits of zero padded frames, 0 otherwise. Files
+    without frame number get frame 0.
+    """
+    return _parse_base( os.path.basename( filename ) )
+
+def _parse_base( name ):
+    m = NAME_RE.match( name )
+    if m == None:
+        return None
+    (prefix, digits, substep, stem, frame_digits, other, ext) = m.groups()
+    if digits != None:
+        substep = int( substep )
+    elif frame_digits != None:
+        (prefix, digits) = (stem, frame_digits)
+    else:
+        return (other, 0, None, ext.lower(), 0)
+    padding = 0
+    if len(digits) > 1 and digits[0] == '0':
+        padding = len(digits)
+    return (prefix, int( digits ), substep, ext.lower(), padding)
+
+class Sequence(object):
+    """ Files of a folder sharing a prefix and an extension, sorted by frame and substep """
+    def __init__( self, folder, prefix, ext ):
+        self.folder = folder
+        self.prefix = prefix
+        self.ext = ext
+        # (frame, substep, filename) sorted by frame and substep
+        self.items = []
+        self.padding = 0
+
+    def __len__( self ):
+        return len(self.items)
+
+    @property
+    def files( self ):
+        return [ item[2] for item in self.items ]
+
+    @property
+    def frames( self ):
+        """ frame numbers, without duplicates for the substeps """
+        frames = []
+        for item in self.items:
+            if frames == [] or frames[-1] != item[0]:
+                frames.append( item[0] )
+        return frames
+
+    @property
+    def start( self ):
+        return self.items[0][0]
+
+    @property
+    def end( self ):
+        return self.items[-1][0]
+
+    @property
+    def has_substeps( self ):
+        return any( [ item[1] != None for item in self.items ] )
+
+    @property
+    def gaps( self ):
+        """ missing frames as a list of (first, last) ranges """
+        gaps = []
+        frames = self.frames
+        for i in range( 1, len(frames) ):
+            if frames[i] > frames[i-1] + 1:
+                gaps.append( (frames[i-1] + 1, frames[i] - 1) )
+        return gaps
+
+    @property
+    def missing_count( self ):
+        return sum( [ last - first + 1 for (first, last) in self.gaps ] )
+
+    @property
+    def name( self ):
+        """ name pattern, e.g. cloud_####.icecache """
+        return '%s%s%s' % (self.prefix, '#' * max( 1, self.padding ), self.ext)
+
+    def describe( self ):
+        """ one line summary, e.g. 'cloud_#.icecache: 98 files, frames 1-100, 2 missing' """
+        s = '%s: %d files, frames %d-%d' % (self.name, len(self), self.start, self.end)
+        if self.has_substeps:
+            s += ' with substeps'
+        missing = self.missing_count
+        if missing:
+            s += ', %d missing' % missing
+        return s
+
+def find_sequences( files ):
+    """
+    Group cache files by folder, prefix and extension, returns the sequences sorted by size, largest
+    first. Costs a single regex match per file, about half a second for 100k files.
+    """
+    sequences = {}
+    for f in files:
+        (folder, name) = os.path.split( f )
+        parsed = _parse_base( name )
+        if parsed == None:
+            continue
+        (prefix, frame, substep, ext, padding) = parsed
+        key = (folder, prefix, ext)
+        seq = sequences.get( key )
+        if seq == None:
+            seq = sequences[ key ] = Sequence( folder, prefix, ext )
+        seq.items.append( (frame, substep, f) )
+        seq.padding = max( seq.padding, padding )
+
+    for seq in sequences.values():
+        # frames without substep first
+        seq.items.sort( key=lambda item: (item[0], item[1] or 0, item[2]) )
+    return sorted( sequences.values(), key=lambda s: (-len(s), s.folder, s.prefix, s.ext) )
+
+def list_sequences( folder ):
+    """ sequences of the cache files of a folder, sub folders are not searched """
+    try:
+        names = os.listdir( folder )
+    except OSError:
+        return []
+    return find_sequences( [ os.path.join( folder, name ) for name in names ] )
+
+def sort_files( files ):
+    """ sort cache files by frame and substep, the frame numbers are parsed once per file """
+    keyed = []
+    for f in files:
+        parsed = parse_name( f )
+        if parsed == None:
+            keyed.append( ((0, 0, f), f) )
+        else:
+            keyed.append( ((parsed[1], parsed[2] or 0, f), f) )
+    keyed.sort()
+    return [ k[1] for k in keyed ]
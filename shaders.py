@@ -0,0 +1,160 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+import sys
+import numpy
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+
+# particle size used when a cache has no Size attribute
+DEFAULT_SIZE = 0.05
+
+# colormap control points, from dark blue to yellow
+COLORMAP = [
+    (0.267, 0.005, 0.329),
+    (0.229, 0.322, 0.546),
+    (0.128, 0.567, 0.551),
+    (0.369, 0.789, 0.383),
+    (0.993, 0.906, 0.144) ]
+COLORMAP_SIZE = 256
+
+# Size is the particle radius in world units, the sprite covers the projected diameter.
+# With color_by, the value attribute (or its magnitude for vectors) is mapped to the colormap.
+VERTEX_SHADER = """
+#version 120
+attribute float size;
+attribute vec4 value;
+uniform float viewport_height;
+uniform bool color_by;
+uniform int value_components;
+uniform vec2 value_range;
+varying vec4 color;
+varying float colormap_coord;
+void main()
+{
+    gl_Position = ftransform();
+    color = gl_Color;
+    if ( color_by )
+    {
+        float v = value.x;
+        if ( value_components == 4 )
+            v = length( value );
+        else if ( value_components > 1 )
+            v = length( value.xyz );
+        colormap_coord = clamp( (v - value_range.x) / max( value_range.y - value_range.x, 1e-12 ), 0.0, 1.0 );
+    }
+    gl_PointSize = max( 1.0, size * gl_ProjectionMatrix[1][1] * viewport_height / gl_Position.w );
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 120
+uniform bool color_by;
+uniform sampler1D colormap;
+varying vec4 color;
+varying float colormap_coord;
+void main()
+{
+    vec2 p = gl_PointCoord * 2.0 - 1.0;
+    if ( dot( p, p ) > 1.0 )
+        discard;
+    if ( color_by )
+        gl_FragColor = texture1D( colormap, colormap_coord );
+    else
+        gl_FragColor = color;
+}
+"""
+
+def colormap_table( size=COLORMAP_SIZE ):
+    """ RGBA table interpolated from the colormap control points """
+    points = numpy.array( COLORMAP, numpy.float32 )
+    x = numpy.linspace( 0.0, 1.0, len(points) )
+    t = numpy.linspace( 0.0, 1.0, size )
+    table = numpy.ones( (size, 4), numpy.float32 )
+    for c in range(3):
+        table[:,c] = numpy.interp( t, x, points[:,c] )
+    return table
+
+class ParticleShader(object):
+    """
+    GLSL program drawing the particles as round sprites sized with the Size attribute, the particles
+    can be colored by mapping an attribute through a colormap texture. Falls back to fixed size points
+    if the program can't be built by the GL driver.
+    """
+    def __init__( self ):
+        self.program = None
+        self.size_location = None
+        self.value_location = None
+        self._uniforms = {}
+        self._colormap = None
+
+    @property
+    def available(self):
+        return self.program != None
+
+    def init( self ):
+        """ build the program, must be called with the GL context current """
+        try:
+            self.program = shaders.compileProgram(
+                shaders.compileShader( VERTEX_SHADER, GL_VERTEX_SHADER ),
+                shaders.compileShader( FRAGMENT_SHADER, GL_FRAGMENT_SHADER ) )
+            self.size_location = glGetAttribLocation( self.program, 'size' )
+            self.value_location = glGetAttribLocation( self.program, 'value' )
+            for name in ('viewport_height', 'color_by', 'value_components', 'value_range', 'colormap'):
+                self._uniforms[ name ] = glGetUniformLocation( self.program, name )
+            self._colormap = self._create_colormap()
+        except:
+            print 'Particle shader not available, using fixed point size: %s' % sys.exc_info()[1]
+            self.program = None
+            self.size_location = None
+            self.value_location = None
+
+    def begin( self, viewport_height, value_range=None, value_components=1 ):
+        """ value_range: (min, max) of the values mapped to the colormap, None to use the particle colors """
+        if self.program == None:
+            glPointSize( 2.0 )
+            return
+        glEnable( GL_VERTEX_PROGRAM_POINT_SIZE )
+        glEnable( GL_POINT_SPRITE )
+        glUseProgram( self.program )
+        glUniform1f( self._uniforms['viewport_height'], viewport_height )
+        glUniform1i( self._uniforms['color_by'], value_range != None )
+        if value_range != None:
+            glActiveTexture( GL_TEXTURE0 )
+            glBindTexture( GL_TEXTURE_1D, self._colormap )
+            glUniform1i( self._uniforms['colormap'], 0 )
+            glUniform1i( self._uniforms['value_components'], value_components )
+            glUniform2f( self._uniforms['value_range'], value_range[0], value_range[1] )
+
+    def end( self ):
+        if self.program == None:
+            return
+        glUseProgram( 0 )
+        glBindTexture( GL_TEXTURE_1D, 0 )
+        glDisable( GL_POINT_SPRITE )
+        glDisable( GL_VERTEX_PROGRAM_POINT_SIZE )
+
+    def _create_colormap( self ):
+        texture = glGenTextures( 1 )
+        glBindTexture( GL_TEXTURE_1D, texture )
+        glTexParameteri( GL_TEXTURE_1D, GL_TEXTURE_MIN_FILTER, GL_LINEAR )
+        glTexParameteri( GL_TEXTURE_1D, GL_TEXTURE_MAG_FILTER, GL_LINEAR )
+        glTexParameteri( GL_TEXTURE_1D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE )
+        glTexImage1D( GL_TEXTURE_1D, 0, GL_RGBA, COLORMAP_SIZE, 0, GL_RGBA, GL_FLOAT, colormap_table() )
+        glBindTexture( GL_TEXTURE_1D, 0 )
+        return texture
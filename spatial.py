@@ -0,0 +1,114 @@
+###############################################################################
+# ICE Explorer: A viewer and reader for ICE cache data
+# Copyright (C) 2010  M.A. Belzile
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+import numpy
+
+# maximum number of cells along each axis
+MAX_RESOLUTION = 32
+# average number of points per cell aimed for small frames
+POINTS_PER_CELL = 1000
+
+class GridIndex(object):
+    """
+    Uniform grid over the points of a frame. The frame points are sorted by cell, every non empty cell
+    holds a contiguous range of points described by starts/counts, and its bounding box by mins/maxs.
+    A coarse grid has a single cell holding all the points, nothing gets culled.
+    """
+    def __init__( self, starts, counts, mins, maxs, coarse=False ):
+        self.starts = starts
+        self.counts = counts
+        self.mins = mins
+        self.maxs = maxs
+        self.coarse = coarse
+
+    def __len__( self ):
+        return len(self.starts)
+
+    @property
+    def nbytes(self):
+        return self.starts.nbytes + self.counts.nbytes + self.mins.nbytes + self.maxs.nbytes
+
+    def visible( self, planes ):
+        """ return a mask of the cells intersecting the frustum planes (see frustum_planes) """
+        mask = numpy.ones( len(self.starts), bool )
+        for plane in planes:
+            # corner of the cell box the farthest along the plane normal
+            corner = numpy.where( plane[:3] >= 0, self.maxs, self.mins )
+            mask &= numpy.dot( corner, plane[:3] ) + plane[3] >= 0
+        return mask
+
+    def ranges( self, planes=None, fraction=1.0 ):
+        """
+        return the first indices and counts of the points to draw as two int32 arrays. Cells outside the
+        frustum planes are skipped, only the given fraction of the points of every cell is kept.
+        """
+        starts = self.starts
+        counts = self.counts
+        if planes != None:
+            mask = self.visible( planes )
+            starts = starts[ mask ]
+            counts = counts[ mask ]
+        if fraction < 1.0:
+            counts = numpy.ceil( counts * fraction ).astype( numpy.int32 )
+        return (starts, counts)
+
+def build_grid( points ):
+    """
+    Build the grid index of points (N x 3 array), vectorized. Returns the order sorting the points by
+    cell and the grid index of the sorted points. Points keep their relative order within a cell.
+    """
+    count = len(points)
+    resolution = int( round( (count / float(POINTS_PER_CELL)) ** (1.0/3.0) ) )
+    resolution = min( MAX_RESOLUTION, max( 1, resolution ) )
+
+    lo = points.min( axis=0 )
+    hi = points.max( axis=0 )
+    extent = numpy.maximum( hi - lo, 1e-6 )
+    cells = ( (points - lo) / extent * resolution ).astype( numpy.int32 )
+    numpy.clip( cells, 0, resolution-1, out=cells )
+    cell_ids = ( cells[:,0] * resolution + cells[:,1] ) * resolution + cells[:,2]
+
+    order = numpy.argsort( cell_ids, kind='mergesort' )
+    sorted_ids = cell_ids[ order ]
+    (ids, starts, counts) = numpy.unique( sorted_ids, return_index=True, return_counts=True )
+
+    # cell boxes
+    ijk = numpy.column_stack( ( ids // (resolution*resolution), (ids // resolution) % resolution, ids % resolution ) )
+    cell_size = extent / resolution
+    mins = ( lo + ijk * cell_size ).astype( numpy.float32 )
+    maxs = ( lo + (ijk+1) * cell_size ).astype( numpy.float32 )
+    return (order, GridIndex( starts.astype( numpy.int32 ), counts.astype( numpy.int32 ), mins, maxs ))
+
+def bounds_grid( points ):
+    """ coarse grid index of points in their current order, a single cell over their bounding box """
+    lo = points.min( axis=0 ).reshape( 1, -1 ).astype( numpy.float32 )
+    hi = points.max( axis=0 ).reshape( 1, -1 ).astype( numpy.float32 )
+    return GridIndex( numpy.zeros( 1, numpy.int32 ), numpy.array( [ len(points) ], numpy.int32 ), lo, hi, coarse=True )
+
+def frustum_planes( modelview, projection ):
+    """
+    Extract the 6 frustum planes (a,b,c,d) in object space from the OpenGL matrices as returned by
+    glGetFloatv, a point p is inside a plane if a*p.x + b*p.y + c*p.z + d >= 0.
+    """
+    # OpenGL matrices are column major, i.e. transposed when read in numpy, points are row vectors
+    m = numpy.dot( numpy.asarray( modelview, numpy.float64 ).reshape(4,4), numpy.asarray( projection, numpy.float64 ).reshape(4,4) )
+    planes = []
+    for axis in range(3):
+        planes.append( m[:,3] + m[:,axis] )
+        planes.append( m[:,3] - m[:,axis] )
+    return planes
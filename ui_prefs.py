@@ -17,12 +17,12 @@ except AttributeError:
 class Ui_Preferences(object):
     def setupUi(self, Preferences):
         Preferences.setObjectName(_fromUtf8("Preferences"))
-        Preferences.resize(416, 113)
+        Preferences.resize(416, 269)
         icon = QtGui.QIcon()
         icon.addPixmap(QtGui.QPixmap(_fromUtf8("resources/preferences.png")), QtGui.QIcon.Normal, QtGui.QIcon.Off)
         Preferences.setWindowIcon(icon)
         self.buttonBox = QtGui.QDialogButtonBox(Preferences)
-        self.buttonBox.setGeometry(QtCore.QRect(324, 71, 81, 32))
+        self.buttonBox.setGeometry(QtCore.QRect(324, 227, 81, 32))
         self.buttonBox.setOrientation(QtCore.Qt.Horizontal)
         self.buttonBox.setStandardButtons(QtGui.QDialogButtonBox.Ok)
         self.buttonBox.setObjectName(_fromUtf8("buttonBox"))
@@ -42,6 +42,42 @@ class Ui_Preferences(object):
         self.default_export_folder_btn.setGeometry(QtCore.QRect(383, 35, 21, 23))
         self.default_export_folder_btn.setContextMenuPolicy(QtCore.Qt.PreventContextMenu)
         self.default_export_folder_btn.setObjectName(_fromUtf8("default_export_folder_btn"))
+        self.label_3 = QtGui.QLabel(Preferences)
+        self.label_3.setGeometry(QtCore.QRect(22, 64, 101, 16))
+        self.label_3.setObjectName(_fromUtf8("label_3"))
+        self.max_open_files_edit = QtGui.QLineEdit(Preferences)
+        self.max_open_files_edit.setGeometry(QtCore.QRect(132, 64, 238, 20))
+        self.max_open_files_edit.setObjectName(_fromUtf8("max_open_files_edit"))
+        self.label_4 = QtGui.QLabel(Preferences)
+        self.label_4.setGeometry(QtCore.QRect(22, 90, 101, 16))
+        self.label_4.setObjectName(_fromUtf8("label_4"))
+        self.frame_cache_edit = QtGui.QLineEdit(Preferences)
+        self.frame_cache_edit.setGeometry(QtCore.QRect(132, 90, 238, 20))
+        self.frame_cache_edit.setObjectName(_fromUtf8("frame_cache_edit"))
+        self.label_5 = QtGui.QLabel(Preferences)
+        self.label_5.setGeometry(QtCore.QRect(22, 116, 101, 16))
+        self.label_5.setObjectName(_fromUtf8("label_5"))
+        self.read_ahead_edit = QtGui.QLineEdit(Preferences)
+        self.read_ahead_edit.setGeometry(QtCore.QRect(132, 116, 238, 20))
+        self.read_ahead_edit.setObjectName(_fromUtf8("read_ahead_edit"))
+        self.label_6 = QtGui.QLabel(Preferences)
+        self.label_6.setGeometry(QtCore.QRect(22, 142, 101, 16))
+        self.label_6.setObjectName(_fromUtf8("label_6"))
+        self.gpu_buffers_edit = QtGui.QLineEdit(Preferences)
+        self.gpu_buffers_edit.setGeometry(QtCore.QRect(132, 142, 238, 20))
+        self.gpu_buffers_edit.setObjectName(_fromUtf8("gpu_buffers_edit"))
+        self.label_7 = QtGui.QLabel(Preferences)
+        self.label_7.setGeometry(QtCore.QRect(22, 168, 101, 16))
+        self.label_7.setObjectName(_fromUtf8("label_7"))
+        self.conversion_cache_edit = QtGui.QLineEdit(Preferences)
+        self.conversion_cache_edit.setGeometry(QtCore.QRect(132, 168, 238, 20))
+        self.conversion_cache_edit.setObjectName(_fromUtf8("conversion_cache_edit"))
+        self.label_8 = QtGui.QLabel(Preferences)
+        self.label_8.setGeometry(QtCore.QRect(22, 194, 101, 16))
+        self.label_8.setObjectName(_fromUtf8("label_8"))
+        self.conversion_quota_edit = QtGui.QLineEdit(Preferences)
+        self.conversion_quota_edit.setGeometry(QtCore.QRect(132, 194, 238, 20))
+        self.conversion_quota_edit.setObjectName(_fromUtf8("conversion_quota_edit"))
 
         self.retranslateUi(Preferences)
         QtCore.QObject.connect(self.buttonBox, QtCore.SIGNAL(_fromUtf8("accepted()")), Preferences.accept)
@@ -53,4 +89,10 @@ class Ui_Preferences(object):
         self.label.setText(QtGui.QApplication.translate("Preferences", "Number of Processes", None, QtGui.QApplication.UnicodeUTF8))
         self.label_2.setText(QtGui.QApplication.translate("Preferences", "Export Folder", None, QtGui.QApplication.UnicodeUTF8))
         self.default_export_folder_btn.setText(QtGui.QApplication.translate("Preferences", "...", None, QtGui.QApplication.UnicodeUTF8))
+        self.label_8.setText(QtGui.QApplication.translate("Preferences", "Cache Quota (MB)", None, QtGui.QApplication.UnicodeUTF8))
+        self.label_7.setText(QtGui.QApplication.translate("Preferences", "Conversion Cache", None, QtGui.QApplication.UnicodeUTF8))
+        self.label_6.setText(QtGui.QApplication.translate("Preferences", "GPU Buffers (MB)", None, QtGui.QApplication.UnicodeUTF8))
+        self.label_5.setText(QtGui.QApplication.translate("Preferences", "Read-ahead Frames", None, QtGui.QApplication.UnicodeUTF8))
+        self.label_4.setText(QtGui.QApplication.translate("Preferences", "Frame Cache (MB)", None, QtGui.QApplication.UnicodeUTF8))
+        self.label_3.setText(QtGui.QApplication.translate("Preferences", "Open File Limit", None, QtGui.QApplication.UnicodeUTF8))
 
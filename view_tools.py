@@ -157,6 +157,11 @@ class ToolManager(object):
         # start with the 'no tool'
         self.active_tool = self.tools_from_name[ 'NOTOOL' ]
 
+    @property
+    def interacting(self):
+        """ True while a tool is being dragged """
+        return self.mouse_button != QtCore.Qt.NoButton and self.active_tool.name != 'NOTOOL'
+
     def mousePressEvent(self, event):       
         self.mouse_button = event.button()
         self.old_mousex, self.old_mousey = event.x(), event.y()        